@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+'''
+Deterministic generator of synthetic LaTeX projects for the benchmarks.
+
+    python benchmarks/generate.py --entries 100000 --output /tmp/corpus-1e5
+
+writes into the output folder
+
+    library.bib   the bibliography, with a few @string macros
+    main.tex      a document citing a fraction of the keys and including figures
+    main.aux      the matching \citation lines, as BibTeX would see them
+    figures/      small placeholder figures, half of them used by main.tex
+    corpus.json   the parameters the corpus was made with
+
+The same parameters and seed always give byte-identical files. The knobs are
+the ones the scripts are sensitive to: the share of entries that duplicate an
+earlier one under a new key (--duplicate-rate), how many distinct journal
+spellings appear (--journals), and which kinds of DOIs the entries carry
+(--doi-mix, shares of Physical Review DOIs that the offline page rules
+resolve, other publishers' DOIs that need a resolver, arXiv DOIs, and none).
+'''
+import argparse
+import json
+import os
+import random
+
+# (full name, abbreviation) pairs; the first ones are in journal-name-sub.py's table
+JOURNALS = [
+    ("Physical Review Letters", "Phys. Rev. Lett."),
+    ("Physical Review B", "Phys. Rev. B"),
+    ("Physical Review A", "Phys. Rev. A"),
+    ("Physical Review X", "Phys. Rev. X"),
+    ("Nano Letters", "Nano Lett."),
+    ("Nature Materials", "Nat. Mater."),
+    ("Nature Physics", "Nat. Phys."),
+    ("Reviews of Modern Physics", "Rev. Mod. Phys."),
+    ("Science Advances", "Sci. Adv."),
+    ("New Journal of Physics", "New J. Phys."),
+    ("Journal of the Physical Society of Japan", "J. Phys. Soc. Jpn."),
+    ("Journal of Applied Physics", "J. Appl. Phys."),
+    ("Applied Physics Letters", "Appl. Phys. Lett."),
+    ("Journal of Chemical Physics", "J. Chem. Phys."),
+    ("Journal of the American Chemical Society", "J. Am. Chem. Soc."),
+    ("Chemical Reviews", "Chem. Rev."),
+    ("Journal of Fluid Mechanics", "J. Fluid Mech."),
+    ("Communications in Mathematical Physics", "Commun. Math. Phys."),
+    ("Annals of Physics", "Ann. Phys."),
+    ("Journal of Statistical Mechanics", "J. Stat. Mech."),
+]
+
+SURNAMES = ["Smith", "Nguyen", "Garc\\'ia", "M{\\\"u}ller", "Kim", "Rossi", "Kowalski", "Tanaka", "Ivanov",
+            "Okafor", "Silva", "Dubois", "Jensen", "Cohen", "Patel", "Novak", "Larsen", "Chen", "Haddad", "Weber"]
+GIVEN_NAMES = ["A.", "B.", "C.", "D.", "E.", "F.", "G.", "H.", "J.", "K.", "L.", "M.", "N.", "P.", "R.", "S."]
+TITLE_WORDS = ["quantum", "topological", "transport", "magnetic", "phase", "transition", "spin", "lattice",
+               "superconductivity", "entanglement", "dynamics", "disorder", "symmetry", "nonequilibrium",
+               "correlated", "electrons", "photonic", "thermal", "Hall", "effect", "Majorana", "edge",
+               "states", "frustrated", "glass", "scaling", "critical", "optical", "response", "graphene"]
+APS_CODES = {"Physical Review Letters": "PhysRevLett", "Physical Review B": "PhysRevB",
+             "Physical Review A": "PhysRevA", "Physical Review X": "PhysRevX"}
+OTHER_PREFIXES = ["10.1021", "10.1063", "10.1016", "10.1017", "10.1002"]
+
+DEFAULT_DUPLICATE_RATE = 0.02
+DEFAULT_JOURNALS = 60
+DEFAULT_DOI_MIX = (0.4, 0.3, 0.1, 0.2)
+DEFAULT_CITE_FRACTION = 0.05
+DEFAULT_FIGURES = 40
+
+
+def journal_spellings(count, rng):
+    """Return `count` journal name spellings: full names, abbreviations, then variants of them."""
+    spellings = [name for pair in JOURNALS for name in pair][:count]
+    while len(spellings) < count:
+        full, abbreviation = rng.choice(JOURNALS)
+        variant = rng.choice([full.lower(), full.upper(), abbreviation.replace('. ', '.'),
+                              abbreviation.replace('.', ''), full.replace(' of ', ' Of '),
+                              full + 's', full[:-1], f"{full}, Series {rng.randrange(1, 10 * count)}"])
+        if variant not in spellings:
+            spellings.append(variant)
+    return spellings
+
+
+def make_doi(index, journal, year, volume, mix, rng):
+    """A DOI of the kind drawn from `mix` (aps, other, arxiv, none shares), or None."""
+    aps, other, arxiv, _ = mix
+    draw = rng.random()
+    if draw < aps:
+        code = APS_CODES.get(journal, rng.choice(list(APS_CODES.values())))
+        return f"10.1103/{code}.{volume}.{rng.randrange(10000, 999999)}"
+    if draw < aps + other:
+        return f"{rng.choice(OTHER_PREFIXES)}/bench.{year}.{index:07d}"
+    if draw < aps + other + arxiv:
+        return f"10.48550/arXiv.{year % 100:02d}{rng.randrange(1, 13):02d}.{index % 100000:05d}"
+    return None
+
+
+def make_entry(index, spellings, mix, rng):
+    """Return (key, fields) for one synthetic article."""
+    authors = [f"{rng.choice(SURNAMES)}, {rng.choice(GIVEN_NAMES)}" for _ in range(rng.randrange(1, 6))]
+    title = ' '.join(rng.choice(TITLE_WORDS) for _ in range(rng.randrange(4, 11)))
+    journal = rng.choice(spellings)
+    year = rng.randrange(1970, 2026)
+    volume = rng.randrange(1, 130)
+    surname = ''.join(char for char in authors[0].split(',')[0] if char.isalpha())
+    key = f"{surname}{year}{title.split()[0].capitalize()}{index}"
+    fields = [("author", ' and '.join(authors)), ("title", title[0].upper() + title[1:]),
+              ("journal", journal), ("year", str(year)), ("volume", str(volume)),
+              ("number", str(rng.randrange(1, 25)))]
+    if rng.random() < 0.3:
+        fields.append(("pages", f"{rng.randrange(1, 900)}--{rng.randrange(900, 2000)}"))
+    doi = make_doi(index, journal, year, volume, mix, rng)
+    if doi:
+        fields.append(("doi", doi))
+    return key, fields
+
+
+def format_article(key, fields):
+    return "@article{" + key + ",\n" + ",\n".join(f"  {name} = {{{value}}}" for name, value in fields) + "\n}\n"
+
+
+def parameters(entries, duplicate_rate=DEFAULT_DUPLICATE_RATE, journals=DEFAULT_JOURNALS,
+               doi_mix=DEFAULT_DOI_MIX, cite_fraction=DEFAULT_CITE_FRACTION, figures=DEFAULT_FIGURES, seed=0):
+    return dict(entries=entries, duplicate_rate=duplicate_rate, journals=journals, doi_mix=list(doi_mix),
+                cite_fraction=cite_fraction, figures=figures, seed=seed)
+
+
+def generate_corpus(directory, entries, duplicate_rate=DEFAULT_DUPLICATE_RATE, journals=DEFAULT_JOURNALS,
+                    doi_mix=DEFAULT_DOI_MIX, cite_fraction=DEFAULT_CITE_FRACTION, figures=DEFAULT_FIGURES,
+                    seed=0):
+    """Write a synthetic project into `directory`; return the parameters and counts as a dict."""
+    rng = random.Random(seed)
+    spellings = journal_spellings(journals, rng)
+    os.makedirs(os.path.join(directory, 'figures'), exist_ok=True)
+
+    keys = []
+    duplicates = 0
+    recent = []
+    with open(os.path.join(directory, 'library.bib'), 'w', encoding='utf-8') as bib:
+        bib.write('@string{prl = "Physical Review Letters"}\n\n@string{prb = "Physical Review B"}\n\n')
+        for index in range(entries):
+            if recent and rng.random() < duplicate_rate:
+                # Same work under another key, as happens when two libraries are merged
+                _, fields = rng.choice(recent)
+                key = f"dup{index}"
+                duplicates += 1
+            else:
+                key, fields = make_entry(index, spellings, doi_mix, rng)
+                recent.append((key, fields))
+                if len(recent) > 1000:
+                    recent.pop(rng.randrange(len(recent)))
+            keys.append(key)
+            bib.write(format_article(key, fields))
+            bib.write("\n")
+
+    cited = sorted(rng.sample(keys, max(1, int(len(keys) * cite_fraction))))
+    with open(os.path.join(directory, 'main.aux'), 'w', encoding='utf-8') as aux:
+        aux.write("\\relax\n")
+        for start in range(0, len(cited), 10):
+            aux.write("\\citation{" + ",".join(cited[start:start + 10]) + "}\n")
+        aux.write("\\bibdata{library}\n\\bibstyle{unsrt}\n")
+
+    for number in range(figures):
+        with open(os.path.join(directory, 'figures', f'fig{number:04d}.pdf'), 'wb') as figure:
+            figure.write(b"%PDF-1.4\n%" + str(number).encode() + b"\n%%EOF\n")
+    with open(os.path.join(directory, 'main.tex'), 'w', encoding='utf-8') as tex:
+        tex.write("\\documentclass{article}\n\\usepackage{graphicx}\n\\graphicspath{{figures/}}\n"
+                  "\\begin{document}\n")
+        for start in range(0, len(cited), 10):
+            tex.write("Text \\cite{" + ",".join(cited[start:start + 10]) + "}.\n")
+            if start // 10 < figures // 2:
+                tex.write(f"\\includegraphics[width=0.5\\textwidth]{{fig{start // 10 * 2:04d}}}\n")
+        tex.write("\\bibliography{library}\n\\end{document}\n")
+
+    corpus = dict(parameters(entries, duplicate_rate, journals, doi_mix, cite_fraction, figures, seed),
+                  duplicates=duplicates, cited=len(cited))
+    with open(os.path.join(directory, 'corpus.json'), 'w') as manifest:
+        json.dump(corpus, manifest, indent=2)
+    return corpus
+
+
+def load_or_generate(directory, entries, **options):
+    """Reuse the corpus in `directory` if it was made with the same parameters, else (re)generate it."""
+    try:
+        with open(os.path.join(directory, 'corpus.json')) as manifest:
+            corpus = json.load(manifest)
+    except (OSError, ValueError):
+        corpus = None
+    wanted = parameters(entries, **options)
+    if corpus and all(corpus.get(name) == value for name, value in wanted.items()):
+        return corpus
+    return generate_corpus(directory, entries, **options)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic LaTeX project with a large bibliography')
+    parser.add_argument('--entries', type=int, required=True, help='Number of bibliography entries, e.g. 1000 to 1000000')
+    parser.add_argument('--output', required=True, help='Folder to write the project into')
+    parser.add_argument('--duplicate-rate', type=float, default=DEFAULT_DUPLICATE_RATE,
+                        help=f'Share of entries that repeat an earlier one under a new key (default: {DEFAULT_DUPLICATE_RATE})')
+    parser.add_argument('--journals', type=int, default=DEFAULT_JOURNALS,
+                        help=f'Number of distinct journal spellings (default: {DEFAULT_JOURNALS})')
+    parser.add_argument('--doi-mix', type=float, nargs=4, default=DEFAULT_DOI_MIX,
+                        metavar=('APS', 'OTHER', 'ARXIV', 'NONE'),
+                        help='Shares of entries with Physical Review, other, arXiv and no DOIs '
+                             f'(default: {" ".join(map(str, DEFAULT_DOI_MIX))})')
+    parser.add_argument('--cite-fraction', type=float, default=DEFAULT_CITE_FRACTION,
+                        help=f'Share of the keys cited by main.tex (default: {DEFAULT_CITE_FRACTION})')
+    parser.add_argument('--figures', type=int, default=DEFAULT_FIGURES,
+                        help=f'Number of figure files, half of them used (default: {DEFAULT_FIGURES})')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.output, args.entries, args.duplicate_rate, args.journals, tuple(args.doi_mix),
+                             args.cite_fraction, args.figures, args.seed)
+    print(json.dumps(corpus, indent=2))
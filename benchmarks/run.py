@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+'''
+Time the scripts in this folder on synthetic projects of growing size.
+
+    python benchmarks/run.py --sizes 1000 10000 100000 --output results.json
+    python benchmarks/run.py --sizes 1000000 --cases clean_bib find_duplicates
+    python benchmarks/run.py --compare results.json
+
+Projects are made by generate.py in --workdir and reused while their
+parameters stay the same. Every case runs in a fresh interpreter. Untimed
+setup comes first, then the timed call --repeat times. The fastest wall
+time is reported, together with the process's peak resident memory. The
+pages case fetches the DOIs the offline rules cannot resolve from a local
+stand-in for doi.org, started in the benchmark process, so it measures our
+own overhead and not the network. The *_jobs cases parse the library in one
+process per CPU; their peak memory is that of the main process only.
+
+Results are printed as JSON (and written to --output). Given an earlier
+results file, --compare prints how each case changed.
+'''
+import argparse
+import importlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+sys.path.insert(0, REPO)
+sys.path.insert(0, HERE)
+
+from generate import load_or_generate
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_REPEAT = 3
+# Processes for the *_jobs cases, which parse the library in shards
+PARSE_JOBS = os.cpu_count() or 1
+
+
+def load_script(name):
+    """Import one of the scripts in the repository, e.g. 'clean-bib', as a module."""
+    return importlib.import_module(name)
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # bytes on macOS, KiB elsewhere
+
+
+class MockDOIHandler(BaseHTTPRequestHandler):
+    """Answer every DOI with a small CSL JSON record, the way doi.org does for Accept: application/json."""
+
+    def do_GET(self):
+        doi = self.path.lstrip('/')
+        body = json.dumps({"DOI": doi, "type": "journal-article", "page": f"{len(doi)}--{len(doi) + 9}"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_mock_resolver():
+    """Serve MockDOIHandler on a free local port in a background thread; return the server."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockDOIHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Each case is setup(corpus) -> state, run(corpus, state). corpus holds the project's paths.
+
+def setup_nothing(corpus):
+    return None
+
+
+def run_extract_citekeys(corpus, state):
+    load_script('citekeys').extract_citekeys(corpus['bib'])
+
+
+def run_clean_bib(corpus, state, use_index=False):
+    clean_bib = load_script('clean-bib')
+    citation_keys = clean_bib.extract_citation_keys(corpus['aux'])
+    bib_entries = clean_bib.read_bib_spans(corpus['bib'], citation_keys, use_index=use_index)
+    clean_bib.write_bib_spans(citation_keys, bib_entries, corpus['output'], corpus['bib'])
+
+
+def setup_clean_bib_index(corpus):
+    from bibkeyindex import BibKeyIndex
+    BibKeyIndex(corpus['bib']).close()
+
+
+def run_clean_bib_index(corpus, state):
+    run_clean_bib(corpus, state, use_index=True)
+
+
+def run_extract_journal_names(corpus, state):
+    load_script('journal-names').extract_journal_names(corpus['bib'])
+
+
+def run_extract_journal_names_jobs(corpus, state):
+    load_script('journal-names').extract_journal_names(corpus['bib'], jobs=PARSE_JOBS)
+
+
+def run_journal_substitution(corpus, state):
+    load_script('journal-name-sub').process_bib_file(corpus['bib'], corpus['output'])
+
+
+def run_find_duplicates(corpus, state):
+    from bibreader import iter_bib_entries
+    load_script('bibdeduplicate').find_duplicates(list(iter_bib_entries(corpus['bib'])))
+
+
+def run_find_duplicates_compact(corpus, state):
+    from bibreader import iter_compact_entries
+    load_script('bibdeduplicate').find_duplicates(iter_compact_entries(corpus['bib']))
+
+
+def run_find_duplicates_jobs(corpus, state):
+    from bibreader import iter_compact_entries
+    load_script('bibdeduplicate').find_duplicates(iter_compact_entries(corpus['bib'], jobs=PARSE_JOBS))
+
+
+def run_find_fuzzy_duplicates(corpus, state):
+    from bibreader import iter_compact_entries
+    load_script('bibdeduplicate').find_fuzzy_duplicates(iter_compact_entries(corpus['bib']))
+
+
+def setup_find_duplicates_index(corpus):
+    # The first run builds the index; the timed runs find the file unchanged
+    dedup = load_script('bibdeduplicate')
+    index = dedup.DedupIndex(corpus['output'] + '.dedup-index')
+    dedup.find_duplicates_incremental(corpus['bib'], index, fuzzy=True)
+    return index
+
+
+def run_find_duplicates_index(corpus, index):
+    load_script('bibdeduplicate').find_duplicates_incremental(corpus['bib'], index, fuzzy=True)
+
+
+def run_get_used_figures(corpus, state):
+    unused_figs = load_script('unused_figs')
+    graph = unused_figs.build_dependency_graph(corpus['tex'], use_cache=False)
+    unused_figs.get_used_figures(corpus['tex'], graph)
+
+
+def setup_pages_field(corpus):
+    server = start_mock_resolver()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def run_pages_field(corpus, resolver):
+    load_script('pages-field').process_bib_file(corpus['bib'], corpus['output'], resolver=resolver, rate=0)
+
+
+CASES = {
+    'extract_citekeys': (setup_nothing, run_extract_citekeys),
+    'clean_bib': (setup_nothing, run_clean_bib),
+    'clean_bib_index': (setup_clean_bib_index, run_clean_bib_index),
+    'extract_journal_names': (setup_nothing, run_extract_journal_names),
+    'extract_journal_names_jobs': (setup_nothing, run_extract_journal_names_jobs),
+    'journal_substitution': (setup_nothing, run_journal_substitution),
+    'find_duplicates': (setup_nothing, run_find_duplicates),
+    'find_duplicates_compact': (setup_nothing, run_find_duplicates_compact),
+    'find_duplicates_jobs': (setup_nothing, run_find_duplicates_jobs),
+    'find_fuzzy_duplicates': (setup_nothing, run_find_fuzzy_duplicates),
+    'find_duplicates_index': (setup_find_duplicates_index, run_find_duplicates_index),
+    'get_used_figures': (setup_nothing, run_get_used_figures),
+    'pages_field': (setup_pages_field, run_pages_field),
+}
+
+
+def run_case(name, directory, repeat):
+    """Run one case in this process and return its measurements; meant to be called in a fresh interpreter."""
+    setup, run = CASES[name]
+    corpus = dict(bib=os.path.join(directory, 'library.bib'), aux=os.path.join(directory, 'main.aux'),
+                  tex=os.path.join(directory, 'main.tex'))
+    with tempfile.TemporaryDirectory() as scratch:
+        corpus['output'] = os.path.join(scratch, 'output.bib')
+        baseline = peak_rss_kb()
+        times = []
+        # The scripts report progress on stdout, which would swamp the results
+        with redirect_stdout(io.StringIO()):
+            state = setup(corpus)
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run(corpus, state)
+                times.append(time.perf_counter() - started)
+    return dict(seconds=min(times), times=times, baseline_rss_kb=baseline, peak_rss_kb=peak_rss_kb())
+
+
+def benchmark(name, directory, entries, repeat):
+    """Run one case in a child interpreter and return its result record."""
+    child = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', name, directory, str(repeat)],
+                           capture_output=True, text=True)
+    record = dict(case=name, entries=entries)
+    if child.returncode != 0:
+        record['error'] = child.stderr.strip().splitlines()[-1] if child.stderr.strip() else f"exit {child.returncode}"
+    else:
+        record.update(json.loads(child.stdout.strip().splitlines()[-1]))
+    return record
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print the change in time and peak memory of each case against an earlier results file."""
+    before = {(record['case'], record['entries']): record for record in baseline['results']}
+    print(f"Compared with {baseline.get('revision')} ({baseline.get('date')}):", file=sys.stderr)
+    for record in results['results']:
+        old = before.get((record['case'], record['entries']))
+        if old is None or 'seconds' not in old or 'seconds' not in record:
+            continue
+        ratio = record['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        memory = ''
+        if record.get('peak_rss_kb') and old.get('peak_rss_kb'):
+            memory = f", peak memory {record['peak_rss_kb'] / old['peak_rss_kb']:.2f}x"
+        print(f"- {record['case']} ({record['entries']} entries): {old['seconds']:.3f} s -> "
+              f"{record['seconds']:.3f} s ({ratio:.2f}x){memory}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == '--child':
+        print(json.dumps(run_case(sys.argv[2], sys.argv[3], int(sys.argv[4]))))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description='Benchmark the BibTeX scripts on synthetic projects')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help=f'Numbers of bibliography entries (default: {" ".join(map(str, DEFAULT_SIZES))})')
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=list(CASES),
+                        help='Cases to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f'Timed runs per case, the fastest is reported (default: {DEFAULT_REPEAT})')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'bibtools-benchmarks'),
+                        help='Folder for the generated projects, reused across runs')
+    parser.add_argument('--duplicate-rate', type=float, default=None, help='Passed on to generate.py')
+    parser.add_argument('--journals', type=int, default=None, help='Passed on to generate.py')
+    parser.add_argument('--doi-mix', type=float, nargs=4, default=None, metavar=('APS', 'OTHER', 'ARXIV', 'NONE'),
+                        help='Passed on to generate.py')
+    parser.add_argument('--output', default=None, help='Also write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    options = {name: value for name, value in [('duplicate_rate', args.duplicate_rate), ('journals', args.journals),
+                                                ('doi_mix', args.doi_mix)] if value is not None}
+    results = dict(revision=git_revision(), date=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   python=platform.python_version(), platform=platform.platform(), results=[])
+    for entries in args.sizes:
+        directory = os.path.join(args.workdir, f'corpus-{entries}')
+        results['corpus'] = load_or_generate(directory, entries, **options)
+        for name in args.cases:
+            record = benchmark(name, directory, entries, args.repeat)
+            results['results'].append(record)
+            summary = record.get('error') or f"{record['seconds']:.3f} s, peak {record['peak_rss_kb']} KiB"
+            print(f"{name} ({entries} entries): {summary}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+'''
+Check that every bibtools subcommand starts within an import-time budget.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --budget 25 --commands clean pages --output startup.json
+
+Each subcommand is run as `bibtools.py <command> --help` under
+`python -X importtime`, which imports everything the command imports at start
+and exits before doing any work. The time spent importing modules that a bare
+interpreter does not already load is charged to the command; the median of
+--repeat runs is compared with --budget (milliseconds). Modules that should
+only be imported where they are used (requests, for instance) must not show
+up at all. The exit status is 1 if any command is over budget or imports one
+of them, so the check can run next to the benchmarks in CI.
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+sys.path.insert(0, REPO)
+
+from bibtools import SCRIPT_COMMANDS
+
+DEFAULT_BUDGET_MS = 40
+DEFAULT_REPEAT = 5
+# Imported lazily, only by the code paths that need them
+LAZY_MODULES = ('requests', 'urllib3', 'bibtexparser', 'concurrent.futures.process', 'cProfile',
+                'tarfile', 'zipfile')
+
+
+def imported_modules(argv):
+    """Run argv under -X importtime; return {module: self time in microseconds}."""
+    child = subprocess.run([sys.executable, '-X', 'importtime'] + argv, cwd=REPO,
+                           capture_output=True, text=True)
+    modules = {}
+    for line in child.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, _, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(self_time)
+    return modules
+
+
+def measure(command, repeat, baseline):
+    """Median import time (ms) of command beyond a bare interpreter, and the lazy modules it imported."""
+    times = []
+    for _ in range(repeat):
+        modules = imported_modules([os.path.join(REPO, 'bibtools.py'), command, '--help'])
+        times.append(sum(time for name, time in modules.items() if name not in baseline) / 1000)
+    eager = sorted(name for name in modules if name in LAZY_MODULES and name not in baseline)
+    return statistics.median(times), eager
+
+
+if __name__ == "__main__":
+    commands = list(SCRIPT_COMMANDS) + ['pipeline']
+    parser = argparse.ArgumentParser(description='Check the start-up import time of the bibtools subcommands')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f'Allowed import time per command, in milliseconds (default: {DEFAULT_BUDGET_MS})')
+    parser.add_argument('--commands', nargs='+', choices=commands, default=commands,
+                        help='Subcommands to check (default: all)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f'Runs per command, the median is reported (default: {DEFAULT_REPEAT})')
+    parser.add_argument('--output', default=None, help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    baseline = set(imported_modules(['-c', 'pass']))
+    results = []
+    for command in args.commands:
+        milliseconds, eager = measure(command, args.repeat, baseline)
+        ok = milliseconds <= args.budget and not eager
+        results.append(dict(command=command, import_ms=round(milliseconds, 2), eager_imports=eager, ok=ok))
+        note = f", imports {', '.join(eager)} at start" if eager else ''
+        print(f"{'ok  ' if ok else 'FAIL'} {command}: {milliseconds:.1f} ms{note}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(dict(budget_ms=args.budget, results=results), output, indent=2)
+    failed = [record['command'] for record in results if not record['ok']]
+    if failed:
+        print(f"Over the {args.budget:g} ms budget or importing lazy modules eagerly: {', '.join(failed)}",
+              file=sys.stderr)
+    sys.exit(1 if failed else 0)
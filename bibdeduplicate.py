@@ -4,9 +4,18 @@ BibTeX Duplicate Finder & Deduplicator
 """
 
 import argparse
-import bibtexparser
+from bibreader import (COMMON_STRINGS, iter_compact_entries, iter_raw_blocks, parse_entry,
+                       parse_string, read_entries_at, write_bib_entries)
+from citescan import WILDCARD, cited_keys, rewrite_citekeys
 from collections import defaultdict
+from difflib import SequenceMatcher, unified_diff
+from runstats import add_stats_arguments, get_stats, start_stats
+import hashlib
+import json
+import os
 import re
+import shutil
+import struct
 import sys
 
 USAGE_MESSAGE = """
@@ -29,9 +38,30 @@ USAGE:
     Interactively deduplicate only used keys:
         python dedup.py --bib myrefs.bib --deduplicate --tex main.tex
 
+    Also catch near-duplicates (typos, abbreviated author lists,
+    arXiv vs published year, shared DOI or arXiv id):
+        python dedup.py --bib myrefs.bib --show --fuzzy
+        python dedup.py --bib myrefs.bib --show --fuzzy --threshold 0.9
+
+    Keep a sidecar index (myrefs.bib.dedup-index) so that later runs only
+    examine new or changed entries and skip groups already resolved:
+        python dedup.py --bib myrefs.bib --show --fuzzy --index
+
+    Parse a very large .bib file in 8 processes:
+        python dedup.py --bib myrefs.bib --show --jobs 8
+
 AFTER DEDUPLICATION:
     - Creates deduplicated.bib with only kept entries
-    - Creates replace_keys.sed to update citation keys in .tex files
+    - Creates replace_keys.sed to update citation keys in .tex files,
+      unless --rewrite is given (see below)
+
+REWRITING CITATION KEYS DIRECTLY:
+    # Preview the changes as a diff, without touching any file:
+    python dedup.py --bib myrefs.bib --deduplicate --rewrite *.tex --dry-run
+
+    # Rewrite the keys in place (every \\cite-like command, key lists,
+    # optional arguments and biblatex multicites; files are replaced atomically):
+    python dedup.py --bib myrefs.bib --deduplicate --rewrite *.tex
 
 APPLYING THE SED SCRIPT:
     # Test changes without modifying files:
@@ -47,7 +77,7 @@ APPLYING THE SED SCRIPT:
     find . -name "*.tex" -exec sed -i -f replace_keys.sed {} +
 
 REQUIREMENTS:
-    pip install bibtexparser
+    bibreader.py (shipped alongside this script)
 """
 
 def entry_signature(entry):
@@ -64,16 +94,475 @@ def find_duplicates(entries):
         groups[entry_signature(e)].append(e)
     return {sig: grp for sig, grp in groups.items() if len(grp) > 1}
 
-def extract_used_keys(tex_files):
-    """Return a set of citation keys used in the given .tex files."""
-    cite_pattern = re.compile(r'\\cite[t|p]?\{([^}]*)\}')
-    used_keys = set()
-    for tex_file in tex_files:
-        with open(tex_file, encoding="utf-8") as f:
-            content = f.read()
-            for match in cite_pattern.findall(content):
-                keys = [k.strip() for k in match.split(',')]
-                used_keys.update(keys)
+# Fuzzy matching: MinHash signatures over title character shingles and author
+# surnames, split into LSH bands. Two entries become candidates when any band
+# agrees, which happens with high probability above ~0.6 Jaccard similarity,
+# so only a near-linear number of pairs is ever scored. The 32 hash functions
+# are the 16-bit words of one 64-byte BLAKE2b digest per shingle, which keeps
+# the per-entry work inside C code. The features of each entry are computed
+# once; a candidate pair is only scored with SequenceMatcher if its signatures
+# agree on at least MIN_AGREEMENT values, and if the cheap upper bounds of the
+# title ratio can still reach the threshold.
+SHINGLE_SIZE = 3
+NUM_BANDS = 8
+ROWS_PER_BAND = 4
+DEFAULT_THRESHOLD = 0.85
+MAX_BUCKET_SIZE = 64
+BUCKET_HEADS = 4  # members of an oversized bucket compared against all the others
+MIN_AGREEMENT = 12  # of the NUM_BANDS * ROWS_PER_BAND MinHash values, about 0.4 Jaccard
+_unpack_hashes = struct.Struct(f"<{NUM_BANDS * ROWS_PER_BAND}H").unpack
+
+ARXIV_ID_PATTERN = re.compile(r'(\d{4}\.\d{4,5}|[a-z\-]+(?:\.[a-z]{2})?/\d{7})(?:v\d+)?', re.IGNORECASE)
+ARXIV_HINT_PATTERN = re.compile(r'arxiv[:/\s.]*', re.IGNORECASE)
+
+def normalized_title(entry):
+    """Lower-cased title with LaTeX commands, braces and punctuation removed."""
+    title = re.sub(r'\\[a-zA-Z]+', '', entry.get("title", "")).lower()
+    return re.sub(r'[^a-z0-9]+', '', title)
+
+def author_surnames(entry):
+    """Return the set of normalized author surnames, ignoring 'others' / 'et al.'."""
+    surnames = set()
+    for name in re.split(r'\s+and\s+', entry.get("author", "")):
+        name = name.strip()
+        if not name or name.lower() in ("others", "et al.", "et al"):
+            continue
+        surname = name.split(",")[0] if "," in name else name.split()[-1]
+        surname = re.sub(r'\W+', '', re.sub(r'\\[a-zA-Z]+', '', surname).lower())
+        if surname:
+            surnames.add(surname)
+    return surnames
+
+def normalized_doi(entry):
+    """Return the entry's DOI, lower-cased and without a resolver prefix."""
+    doi = entry.get("doi", "").strip().lower()
+    return re.sub(r'^(https?://(dx\.)?doi\.org/|doi:)', '', doi)
+
+def arxiv_id(entry):
+    """Return the arXiv identifier of an entry, without version, if it has one."""
+    eprint = entry.get("eprint", "") or entry.get("arxivid", "")
+    match = ARXIV_ID_PATTERN.fullmatch(ARXIV_HINT_PATTERN.sub('', eprint.strip()))
+    if match:
+        return match.group(1).lower()
+    for field in ("doi", "url", "journal", "note"):
+        value = entry.get(field, "")
+        hint = ARXIV_HINT_PATTERN.search(value)
+        if hint:
+            match = ARXIV_ID_PATTERN.match(value, hint.end())
+            if match:
+                return match.group(1).lower()
+    return None
+
+def minhash_signature(title, surnames):
+    """Return the MinHash values of a normalized title and author surnames, or None without a title."""
+    if not title:
+        return None
+    shingles = {title[i:i + SHINGLE_SIZE] for i in range(max(1, len(title) - SHINGLE_SIZE + 1))}
+    shingles.update("@" + surname for surname in surnames)
+    return list(map(min, zip(*[
+        _unpack_hashes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=64).digest())
+        for shingle in shingles])))
+
+def band_keys(signature):
+    """Return one LSH bucket key per band of a MinHash signature ([] for None)."""
+    if signature is None:
+        return []
+    keys = []
+    for band in range(NUM_BANDS):
+        key = band
+        for value in signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]:
+            key = (key << 16) | value
+        keys.append(key)
+    return keys
+
+def minhash_bands(entry):
+    """Return one LSH bucket key per band for the entry, or [] if it has no title."""
+    return band_keys(minhash_signature(normalized_title(entry), author_surnames(entry)))
+
+def fuzzy_features(entry):
+    """Return (title, surnames, DOI, arXiv id, MinHash signature) of an entry for fuzzy matching."""
+    title, surnames = normalized_title(entry), author_surnames(entry)
+    return (title, surnames, normalized_doi(entry), arxiv_id(entry), minhash_signature(title, surnames))
+
+def _similarity(features_a, features_b, threshold=0.0):
+    """Score two entries' features on title and author agreement; 0 once it cannot reach threshold."""
+    title_a, authors_a = features_a[:2]
+    title_b, authors_b = features_b[:2]
+    if authors_a and authors_b:
+        # Containment rather than Jaccard, so "Smith and others" matches the full list
+        authors = 0.3 * len(authors_a & authors_b) / min(len(authors_a), len(authors_b))
+        weight = 0.7
+    else:
+        authors, weight = 0.0, 1.0  # the title stands in for the authors
+    matcher = SequenceMatcher(None, title_a, title_b)
+    for bound in (matcher.real_quick_ratio, matcher.quick_ratio):
+        if weight * bound() + authors < threshold:
+            return 0.0
+    return weight * matcher.ratio() + authors
+
+def entry_similarity(a, b):
+    """Score two entries between 0 and 1 on title and author agreement."""
+    return _similarity(fuzzy_features(a), fuzzy_features(b))
+
+def _is_fuzzy_match(features_a, features_b, threshold):
+    """is_fuzzy_duplicate on precomputed fuzzy_features."""
+    _, _, doi_a, arxiv_a, signature_a = features_a
+    _, _, doi_b, arxiv_b, signature_b = features_b
+    if doi_a and doi_a == doi_b:
+        return True
+    if arxiv_a and arxiv_a == arxiv_b:
+        return True
+    # Two different publisher DOIs are different works (e.g. a paper and its erratum)
+    if doi_a and doi_b and not doi_a.startswith("10.48550") and not doi_b.startswith("10.48550"):
+        return False
+    if signature_a is None or signature_b is None:
+        return False
+    if sum(x == y for x, y in zip(signature_a, signature_b)) < MIN_AGREEMENT:
+        return False
+    return _similarity(features_a, features_b, threshold) >= threshold
+
+def is_fuzzy_duplicate(a, b, threshold=DEFAULT_THRESHOLD):
+    """Decide whether two entries describe the same work."""
+    return _is_fuzzy_match(fuzzy_features(a), fuzzy_features(b), threshold)
+
+def _union_find_groups(pairs, dois=None):
+    """Return sorted lists of indices connected by pairs (groups of two or more).
+
+    If dois is given, two groups holding different publisher DOIs are never merged,
+    so a chain of near matches cannot pull a paper and its erratum together.
+    """
+    parent = {}
+    group_doi = {}
+
+    def find(i):
+        parent.setdefault(i, i)
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def doi_of(root):
+        if root in group_doi:
+            return group_doi[root]
+        return dois[root] if dois else None
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i == root_j:
+            continue
+        doi_i, doi_j = doi_of(root_i), doi_of(root_j)
+        if doi_i and doi_j and doi_i != doi_j:
+            continue
+        root, child = min(root_i, root_j), max(root_i, root_j)
+        parent[child] = root
+        group_doi[root] = doi_i or doi_j
+    groups = defaultdict(list)
+    for i in sorted(parent):
+        groups[find(i)].append(i)
+    return [grp for grp in groups.values() if len(grp) > 1]
+
+def candidate_pairs(signatures, features):
+    """Yield index pairs sharing an exact signature, DOI, arXiv id or LSH bucket.
+
+    signatures and features hold the entry_signature and fuzzy_features of
+    each entry. Oversized buckets (e.g. a very common short title) are
+    compared against their first members only, so a single hot bucket cannot
+    go quadratic.
+    """
+    buckets = defaultdict(list)
+    for i, (signature, (_, _, doi, arxiv, minhash)) in enumerate(zip(signatures, features)):
+        buckets[("sig",) + signature].append(i)
+        if doi:
+            buckets[("doi", doi)].append(i)
+        if arxiv:
+            buckets[("arxiv", arxiv)].append(i)
+        for key in band_keys(minhash):
+            buckets[key].append(i)
+    seen = set()
+    for members in buckets.values():
+        heads = members if len(members) <= MAX_BUCKET_SIZE else members[:BUCKET_HEADS]
+        for pos, i in enumerate(heads):
+            for j in members[pos + 1:]:
+                if (i, j) not in seen:
+                    seen.add((i, j))
+                    yield i, j
+
+def find_fuzzy_duplicates(entries, threshold=DEFAULT_THRESHOLD):
+    """Like find_duplicates, but also groups near-duplicates found through MinHash/LSH.
+
+    Groups are keyed by the positions of their entries, since two groups kept
+    apart by different DOIs may share a signature.
+    """
+    entries = list(entries)
+    signatures = [entry_signature(e) for e in entries]
+    features = [fuzzy_features(e) for e in entries]
+    pairs = [(i, j) for i, j in candidate_pairs(signatures, features)
+             if signatures[i] == signatures[j] or _is_fuzzy_match(features[i], features[j], threshold)]
+    publisher_dois = [f[2] if f[2] and not f[2].startswith("10.48550") else None for f in features]
+    groups = _union_find_groups(pairs, publisher_dois)
+    return {tuple(grp): [entries[i] for i in grp] for grp in groups}
+
+# Incremental mode: a sidecar SQLite index remembers, per entry, a digest of
+# its raw text and the keys used for bucketing, plus the groups found and the
+# groups the user resolved. Unchanged entries are never parsed again, and only
+# pairs involving a new or changed entry are scored. When the file still starts
+# with exactly the bytes scanned last time (references were appended), even the
+# scan resumes where it stopped.
+
+def default_index_path(bib_filename):
+    return bib_filename + ".dedup-index"
+
+class DedupIndex:
+    """Sidecar index of entry digests, bucket keys, duplicate groups and resolved groups."""
+
+    def __init__(self, index_filename):
+        import sqlite3
+        self._db = sqlite3.connect(index_filename)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS entries (
+                digest BLOB PRIMARY KEY, pos INTEGER, id TEXT, sig BLOB, doi TEXT,
+                arxiv TEXT, start INTEGER, end INTEGER) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS keys (key BLOB, digest BLOB);
+            CREATE INDEX IF NOT EXISTS keys_key ON keys (key);
+            CREATE INDEX IF NOT EXISTS keys_digest ON keys (digest);
+            CREATE TABLE IF NOT EXISTS groups (gid INTEGER, digest BLOB);
+            CREATE TABLE IF NOT EXISTS resolved (gid INTEGER, digest BLOB);
+        ''')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+    def get_meta(self, name):
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_meta(self, name, value):
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (name, json.dumps(value)))
+
+    def clear_entries(self):
+        """Forget every entry and group, but keep the resolved groups."""
+        self._db.executescript("DELETE FROM entries; DELETE FROM keys; DELETE FROM groups; DELETE FROM meta;")
+
+    def digests(self):
+        return {row[0] for row in self._db.execute("SELECT digest FROM entries")}
+
+    def contains(self, digest):
+        return self._db.execute("SELECT 1 FROM entries WHERE digest = ?", (digest,)).fetchone() is not None
+
+    def _select_in(self, query, values):
+        values = list(values)
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            yield from self._db.execute(query.format(",".join("?" * len(batch))), batch)
+
+    def lookup_keys(self, keys):
+        """Return (key, digest) for every stored entry carrying one of the keys."""
+        return list(self._select_in("SELECT key, digest FROM keys WHERE key IN ({})", keys))
+
+    def rows(self, digests):
+        """Return {digest: (pos, id, sig, doi, arxiv, start, end)}."""
+        return {row[0]: row[1:] for row in self._select_in(
+            "SELECT digest, pos, id, sig, doi, arxiv, start, end FROM entries WHERE digest IN ({})", digests)}
+
+    def add_entries(self, rows):
+        """Store (digest, pos, features, start, end, keys) rows for new entries."""
+        rows = list(rows)
+        self._db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             [(digest, pos, f[0], f[1], f[2], f[3], start, end)
+                              for digest, pos, f, start, end, _ in rows])
+        self._db.executemany("INSERT INTO keys VALUES (?, ?)",
+                             [(key, digest) for digest, _, _, _, _, keys in rows for key in keys])
+
+    def move_entries(self, moves):
+        """Record new (pos, start, end) for entries kept from a previous scan."""
+        self._db.executemany("UPDATE entries SET pos = ?, start = ?, end = ? WHERE digest = ?", moves)
+
+    def remove_entries(self, digests):
+        digests = [(digest,) for digest in digests]
+        self._db.executemany("DELETE FROM entries WHERE digest = ?", digests)
+        self._db.executemany("DELETE FROM keys WHERE digest = ?", digests)
+
+    def _groups(self, table):
+        groups = defaultdict(list)
+        for gid, digest in self._db.execute(f"SELECT gid, digest FROM {table} ORDER BY rowid"):
+            groups[gid].append(digest)
+        return list(groups.values())
+
+    def _set_groups(self, table, groups):
+        self._db.execute(f"DELETE FROM {table}")
+        self._db.executemany(f"INSERT INTO {table} VALUES (?, ?)",
+                             [(gid, digest) for gid, group in enumerate(groups) for digest in group])
+
+    def groups(self):
+        return self._groups("groups")
+
+    def set_groups(self, groups):
+        self._set_groups("groups", groups)
+
+    def resolved(self):
+        return [frozenset(group) for group in self._groups("resolved")]
+
+    def add_resolved(self, groups):
+        self._set_groups("resolved", self.resolved() + [frozenset(group) for group in groups])
+
+def entry_features(entry, fuzzy):
+    """Return (ID, signature digest, DOI, arXiv id, band keys) for an entry."""
+    signature = hashlib.blake2b(repr(entry_signature(entry)).encode("utf-8"), digest_size=8).digest()
+    bands = tuple(minhash_bands(entry)) if fuzzy else ()
+    return (entry["ID"], signature, normalized_doi(entry) or None, arxiv_id(entry), bands)
+
+def _bucket_keys(feature, fuzzy):
+    """Return the index keys of an entry's features as bytes."""
+    keys = [b"s" + feature[1]]
+    if fuzzy:
+        if feature[2]:
+            keys.append(b"d" + feature[2].encode("utf-8"))
+        if feature[3]:
+            keys.append(b"a" + feature[3].encode("utf-8"))
+        keys.extend(b"b" + band.to_bytes(9, "big") for band in feature[4])
+    return keys
+
+def _hash_file(bib_filename, start, end, digest=None):
+    """Feed bytes start..end of a file into a BLAKE2b digest; None if the file is shorter."""
+    digest = digest or hashlib.blake2b(digest_size=16)
+    remaining = end - start
+    with open(bib_filename, "rb") as f:
+        f.seek(start)
+        while remaining:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                return None
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest
+
+def find_duplicates_incremental(bib_filename, index, fuzzy=False, threshold=DEFAULT_THRESHOLD):
+    """Find duplicate groups using and updating a DedupIndex.
+
+    Returns the same shape as find_duplicates, keyed by the tuple of entry
+    digests of each group. Groups the user already resolved are left out.
+    """
+    params = [fuzzy, threshold, SHINGLE_SIZE, NUM_BANDS, ROWS_PER_BAND, MIN_AGREEMENT] if fuzzy else [fuzzy]
+    if index.get_meta("params") != params:
+        index.clear_entries()
+        index.set_meta("params", params)
+
+    # Resume after the previously scanned bytes if they are unchanged
+    scan = index.get_meta("scan")
+    prefix = scan and _hash_file(bib_filename, 0, scan["size"])
+    if prefix and prefix.hexdigest() == scan["digest"]:
+        scan_from, pos = scan["size"], scan["count"]
+        strings, strings_key = scan["strings"], bytes.fromhex(scan["strings_key"])
+        known = None
+    else:
+        prefix, scan_from, pos = None, 0, 0
+        strings, strings_key = dict(COMMON_STRINGS), b""
+        known = index.digests()
+
+    new = []     # (digest, pos, features, start, end, keys) of new or changed entries
+    moves = []   # (pos, start, end, digest) of unchanged entries, on a full rescan
+    seen = set()
+    last_end = scan_from
+    for block_type, body, start, end in iter_raw_blocks(bib_filename, scan_from):
+        last_end = end
+        if block_type == "string":
+            parse_string(body.decode("utf-8"), strings)
+            # Entries are keyed on the macros in effect too, so redefining one re-checks them
+            strings_key = hashlib.blake2b(strings_key + body, digest_size=32).digest()
+            continue
+        if block_type in ("comment", "preamble"):
+            continue
+        digest = hashlib.blake2b(block_type.encode() + body, digest_size=16, key=strings_key).digest()
+        while digest in seen or (known is None and index.contains(digest)):
+            # Byte-identical copies of an entry
+            digest = hashlib.blake2b(digest, digest_size=16).digest()
+        seen.add(digest)
+        if known is not None and digest in known:
+            moves.append((pos, start, end, digest))
+        else:
+            feature = entry_features(parse_entry(block_type, body.decode("utf-8"), strings), fuzzy)
+            new.append((digest, pos, feature, start, end, _bucket_keys(feature, fuzzy)))
+        pos += 1
+    get_stats().count('dedup index hits', pos - len(new))
+    get_stats().count('entries rescanned', len(new))
+    if known is not None:
+        index.remove_entries(known - seen)
+        index.move_entries(moves)
+
+    # Candidate pairs: new entries against each other and against stored entries sharing a key
+    buckets = defaultdict(list)
+    new_digests = {row[0] for row in new}
+    for key, digest in index.lookup_keys({key for row in new for key in row[5]}):
+        if digest not in new_digests:
+            buckets[key].append(digest)
+    for digest, _, _, _, _, keys in new:
+        for key in keys:
+            buckets[key].append(digest)
+    candidates = set()
+    for members in buckets.values():
+        heads = members if len(members) <= MAX_BUCKET_SIZE else members[:BUCKET_HEADS]
+        for i, a in enumerate(heads):
+            for b in members[i + 1:]:
+                if a in new_digests or b in new_digests:
+                    candidates.add((a, b))
+
+    index.add_entries(new)
+    involved = {digest for pair in candidates for digest in pair}
+    old_groups = [[d for d in group if known is None or d in seen] for group in index.groups()]
+    involved.update(d for group in old_groups for d in group)
+    rows = index.rows(involved)
+
+    # Score candidates; exact signature matches need no parsing
+    pairs = [(a, b) for a, b in candidates if rows[a][2] == rows[b][2]]
+    if fuzzy:
+        to_score = sorted(candidates.difference(pairs))
+        needed = sorted({d for pair in to_score for d in pair}, key=lambda d: rows[d][0])
+        features = dict(zip(needed, map(fuzzy_features,
+                                        read_entries_at(bib_filename, [rows[d][5:] for d in needed], strings))))
+        pairs.extend((a, b) for a, b in to_score if _is_fuzzy_match(features[a], features[b], threshold))
+
+    # Carry over the groups found last time, as long as their members are unchanged
+    for group in old_groups:
+        members = [d for d in group if d in rows]
+        pairs.extend(zip(members, members[1:]))
+
+    publisher_dois = None
+    if fuzzy:
+        publisher_dois = {d: row[3] if row[3] and not row[3].startswith("10.48550") else None
+                          for d, row in rows.items()}
+    groups = [sorted(grp, key=lambda d: rows[d][0]) for grp in _union_find_groups(pairs, publisher_dois)]
+    groups.sort(key=lambda grp: rows[grp[0]][0])
+    index.set_groups(groups)
+
+    resolved = index.resolved()
+    open_groups = [grp for grp in groups if not any(frozenset(grp) <= done for done in resolved)]
+    if len(open_groups) < len(groups):
+        print(f"Skipping {len(groups) - len(open_groups)} duplicate groups already resolved")
+
+    digest = _hash_file(bib_filename, scan_from, last_end, prefix) if prefix else _hash_file(bib_filename, 0, last_end)
+    index.set_meta("scan", dict(size=last_end, digest=digest.hexdigest(), count=pos,
+                                strings=strings, strings_key=strings_key.hex()))
+
+    needed = sorted({d for grp in open_groups for d in grp}, key=lambda d: rows[d][0])
+    parsed = dict(zip(needed, read_entries_at(bib_filename, [rows[d][5:] for d in needed], strings)))
+    return {tuple(grp): [parsed[d] for d in grp] for grp in open_groups}
+
+def extract_used_keys(tex_files, jobs=None):
+    """Return a set of citation keys used in the given .tex (or .aux) files.
+
+    Returns None, meaning every key, if the files contain \\nocite{*}.
+    """
+    used_keys = set(cited_keys(tex_files, jobs))
+    if WILDCARD in used_keys:
+        return None
     return used_keys
 
 def show_duplicates(duplicates, used_keys=None):
@@ -95,8 +584,56 @@ def show_duplicates(duplicates, used_keys=None):
             print(f"Key: {e.get('ID','')} | DOI: {e.get('doi','N/A')} | Year: {e.get('year','N/A')}{mark}")
         print()
 
-def interactive_deduplicate(duplicates, used_keys=None):
-    """Interactive deduplication session."""
+def _rewrite_tex_file(tex_file, replacements, dry_run):
+    """Rewrite one file; return (tex_file, changed, diff)."""
+    with open(tex_file, encoding="utf-8", newline="") as f:
+        content = f.read()
+    new_content = rewrite_citekeys(content, replacements)
+    if new_content == content:
+        return tex_file, False, ""
+    if dry_run:
+        diff = unified_diff(content.splitlines(keepends=True), new_content.splitlines(keepends=True),
+                            fromfile=tex_file, tofile=tex_file)
+        return tex_file, True, "".join(diff)
+    tmp_file = f"{tex_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w", encoding="utf-8", newline="") as f:
+        f.write(new_content)
+    shutil.copymode(tex_file, tmp_file)
+    os.replace(tmp_file, tex_file)
+    return tex_file, True, ""
+
+def rewrite_tex_files(tex_files, replacements, dry_run=False, jobs=None):
+    """Replace old citation keys with new ones in many .tex files, in parallel.
+
+    Every file is scanned once; with dry_run a unified diff is printed instead
+    of writing. Returns the list of files that changed (or would change).
+    """
+    replacements = dict(replacements)
+    if not replacements or not tex_files:
+        return []
+    if jobs == 1 or len(tex_files) == 1:
+        results = [_rewrite_tex_file(f, replacements, dry_run) for f in tex_files]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_rewrite_tex_file, tex_files,
+                                        [replacements] * len(tex_files), [dry_run] * len(tex_files)))
+    changed = []
+    for tex_file, was_changed, diff in results:
+        if was_changed:
+            changed.append(tex_file)
+            if diff:
+                sys.stdout.write(diff)
+    return changed
+
+def interactive_deduplicate(duplicates, used_keys=None, resolved=None, rewrite_files=None,
+                            dry_run=False, jobs=None):
+    """Interactive deduplication session.
+
+    If resolved is a list, the key of every group the user settles is appended to it.
+    If rewrite_files is given, citation keys in those files are rewritten directly
+    instead of writing replace_keys.sed.
+    """
     kept_entries = []
     replacements = []
     for sig, entries in duplicates.items():
@@ -124,15 +661,20 @@ def interactive_deduplicate(duplicates, used_keys=None):
             for idx, e in enumerate(entries):
                 if idx != keep_idx:
                     replacements.append((e['ID'], keep_key))
+            if resolved is not None:
+                resolved.append(sig)
         except (ValueError, IndexError):
             print("Invalid choice, skipping...")
             kept_entries.extend(entries)
 
     # Write updated .bib file
-    db = bibtexparser.bibdatabase.BibDatabase()
-    db.entries = kept_entries
-    with open("deduplicated.bib", "w", encoding="utf-8") as out:
-        out.write(bibtexparser.dumps(db))
+    write_bib_entries(kept_entries, "deduplicated.bib")
+
+    if rewrite_files is not None:
+        changed = rewrite_tex_files(rewrite_files, replacements, dry_run, jobs)
+        verb = "Would rewrite" if dry_run else "Rewrote"
+        print(f"\nSaved deduplicated.bib. {verb} citation keys in {len(changed)} of {len(rewrite_files)} files")
+        return
 
     # Write sed script
     with open("replace_keys.sed", "w", encoding="utf-8") as sedf:
@@ -152,21 +694,46 @@ def main():
     parser.add_argument("--show", action="store_true", help="Show duplicate entries")
     parser.add_argument("--deduplicate", action="store_true", help="Interactively deduplicate entries")
     parser.add_argument("--tex", nargs="+", help="Path(s) to .tex file(s) to check for used keys")
+    parser.add_argument("--fuzzy", action="store_true", help="Also detect near-duplicates (MinHash/LSH)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Similarity needed for a fuzzy match, 0-1 (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--rewrite", nargs="+", metavar="TEX",
+                        help="With --deduplicate, rewrite replaced keys in these .tex files instead of writing a sed script")
+    parser.add_argument("--dry-run", action="store_true", help="With --rewrite, only print a diff of the changes")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Processes parsing the .bib file (default: 1) and rewriting .tex files (default: CPU count)")
+    parser.add_argument("--index", nargs="?", const="", metavar="PATH",
+                        help="Keep a sidecar index so reruns only check new or changed entries "
+                             "(default path: <bib>.dedup-index)")
+    add_stats_arguments(parser)
     args = parser.parse_args()
+    start_stats(args)
 
-    with open(args.bib, encoding="utf-8") as bibfile:
-        db = bibtexparser.load(bibfile)
-
-    duplicates = find_duplicates(db.entries)
-    used_keys = extract_used_keys(args.tex) if args.tex else None
+    index = None
+    with get_stats().phase('transform'):
+        if args.index is not None:
+            index = DedupIndex(args.index or default_index_path(args.bib))
+            duplicates = find_duplicates_incremental(args.bib, index, args.fuzzy, args.threshold)
+        elif args.fuzzy:
+            duplicates = find_fuzzy_duplicates(iter_compact_entries(args.bib, jobs=args.jobs), args.threshold)
+        else:
+            duplicates = find_duplicates(iter_compact_entries(args.bib, jobs=args.jobs))
+    get_stats().count('duplicate groups', len(duplicates))
+    used_keys = extract_used_keys(args.tex, args.jobs) if args.tex else None
 
     if args.show:
         show_duplicates(duplicates, used_keys)
     elif args.deduplicate:
-        interactive_deduplicate(duplicates, used_keys)
+        resolved = []
+        interactive_deduplicate(duplicates, used_keys, resolved, args.rewrite, args.dry_run, args.jobs)
+        if index is not None:
+            index.add_resolved(resolved)
     else:
         print("Please specify either --show or --deduplicate")
         sys.exit(1)
 
+    if index is not None:
+        index.close()
+
 if __name__ == "__main__":
     main()
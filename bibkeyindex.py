@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+'''
+Sidecar index of where every citation key sits in a BibTeX file.
+
+The index, <bib>.key-index, is a small SQLite database mapping each key to
+the byte span of its entry, plus the spans of the @string and @preamble
+blocks. It is built in one byte-level scan (no field is parsed), and is
+trusted as long as the library's size and mtime are unchanged; if only the
+mtime moved, the content hash decides. Looking up the entries a paper cites
+then costs time proportional to the number of keys asked for, not to the size
+of the library, and the entries themselves are copied from the file by span.
+'''
+import hashlib
+import os
+import sqlite3
+
+from bibreader import iter_raw_blocks
+from runstats import get_stats
+
+INDEX_VERSION = 1
+
+# SQLite limits the number of bound parameters per statement
+_BATCH = 500
+
+
+def default_index_path(bib_filename):
+    return bib_filename + ".key-index"
+
+
+def file_digest(filename):
+    """BLAKE2b digest of a file's content, as hex."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _stamp(bib_filename):
+    info = os.stat(bib_filename)
+    return info.st_size, info.st_mtime_ns
+
+
+class BibKeyIndex:
+    """Key -> (start, end) lookups for one BibTeX file, rebuilt automatically when the file changes."""
+
+    def __init__(self, bib_filename, index_filename=None):
+        self.bib_filename = bib_filename
+        self.path = index_filename or default_index_path(bib_filename)
+        self.rebuilt = False
+        self._db = sqlite3.connect(self.path)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value);
+            CREATE TABLE IF NOT EXISTS blocks (
+                position INTEGER PRIMARY KEY, kind TEXT, key TEXT, start INTEGER, end INTEGER);
+            CREATE INDEX IF NOT EXISTS blocks_key ON blocks (key);
+        ''')
+        if self.is_current():
+            get_stats().count('key index hits')
+        else:
+            get_stats().count('key index rebuilds')
+            self.build()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def _meta(self):
+        return dict(self._db.execute("SELECT name, value FROM meta"))
+
+    def is_current(self):
+        """True if the index describes the file as it is now."""
+        meta = self._meta()
+        if meta.get('version') != INDEX_VERSION:
+            return False
+        size, mtime = _stamp(self.bib_filename)
+        if meta.get('size') != size:
+            return False
+        if meta.get('mtime') == mtime:
+            return True
+        # Touched but maybe not modified: compare content, and remember the new mtime
+        if meta.get('hash') != file_digest(self.bib_filename):
+            return False
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES ('mtime', ?)", (mtime,))
+        self._db.commit()
+        return True
+
+    def build(self):
+        """Scan the whole file once and store the span of every block."""
+        size, mtime = _stamp(self.bib_filename)
+        rows = []
+        for position, (block_type, body, start, end) in enumerate(iter_raw_blocks(self.bib_filename)):
+            if block_type in ('string', 'preamble'):
+                rows.append((position, block_type, None, start, end))
+            elif block_type != 'comment':
+                key = body.split(b',', 1)[0].strip().decode('utf-8')
+                rows.append((position, 'entry', key, start, end))
+        self._db.execute("DELETE FROM blocks")
+        self._db.execute("DELETE FROM meta")
+        self._db.executemany("INSERT INTO blocks VALUES (?, ?, ?, ?, ?)", rows)
+        self._db.executemany("INSERT INTO meta VALUES (?, ?)",
+                             [('version', INDEX_VERSION), ('size', size), ('mtime', mtime),
+                              ('hash', file_digest(self.bib_filename))])
+        self._db.commit()
+        self.rebuilt = True
+
+    def spans(self, keys):
+        """Return {key: (start, end)} for the given keys found in the file (the last one wins)."""
+        keys = list(keys)
+        found = {}
+        for offset in range(0, len(keys), _BATCH):
+            batch = keys[offset:offset + _BATCH]
+            rows = self._db.execute(
+                f"SELECT key, start, end FROM blocks WHERE kind = 'entry' AND key IN ({','.join('?' * len(batch))}) "
+                "ORDER BY position", batch)
+            for key, start, end in rows:
+                found[key] = (start, end)
+        return found
+
+    def all_spans(self):
+        """Return {key: (start, end)} for every entry in the file."""
+        return {key: (start, end) for key, start, end in self._db.execute(
+            "SELECT key, start, end FROM blocks WHERE kind = 'entry' ORDER BY position")}
+
+    def macro_spans(self):
+        """Return the (start, end) spans of the @string and @preamble blocks, in file order."""
+        return [(start, end) for start, end in self._db.execute(
+            "SELECT start, end FROM blocks WHERE kind != 'entry' ORDER BY position")]
+
+    def keys(self):
+        """Yield every entry key in file order."""
+        for (key,) in self._db.execute("SELECT key FROM blocks WHERE kind = 'entry' ORDER BY position"):
+            yield key
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM blocks WHERE kind = 'entry'").fetchone()[0]
@@ -0,0 +1,863 @@
+#!/usr/bin/env python
+'''
+Streaming BibTeX reader and writer shared by the scripts in this folder.
+
+The reader walks the file in fixed-size chunks and yields one record at a time,
+so memory stays flat no matter how large the library is and processing starts
+on the first entry. Entries come out as plain dicts in the same shape that
+bibtexparser uses ('ENTRYTYPE', 'ID' and lower-cased field names), so code
+written against bibtexparser entries keeps working unchanged.
+
+@string macros are expanded as they are defined (including '#'
+concatenation), @comment and @preamble blocks are passed through as raw text,
+and nested braces inside field values are preserved. The month macros that
+BibTeX styles predefine (jan ... dec) are not expanded: month = jan reads as
+'jan' and is written back as a bare macro, since what it stands for (January,
+Jan., or month 1 for biblatex) is up to the style.
+
+Given jobs > 1, the readers parse large files in parallel: the file is cut
+into shards at top-level '@' blocks, the shards are parsed in a process pool
+and their records are put back in file order. A worker cannot know the
+@string macros of the shards before its own, so it notes the macro names it
+could not resolve locally; the few entries whose value depends on them are
+parsed again once the earlier macros are known. A cut that turns out not to
+fall between blocks (an '@' at the start of a line inside a field value) is
+noticed when the shard before it ends, and that stretch is re-read serially.
+
+Every block also carries its byte span in the source file. write_passthrough
+uses the spans to copy untouched blocks straight from the source, and
+patch_entry re-writes only the fields a script actually changed within an
+entry, so everything else, down to macros, field order, indentation and
+comments between entries, comes out byte for byte.
+'''
+import mmap
+import os
+import re
+import shutil
+import sys
+import tempfile
+from collections.abc import MutableMapping
+from itertools import repeat
+
+from runstats import get_stats
+
+CHUNK_SIZE = 1 << 16
+# Sources at least this large are memory-mapped when copying spans from them.
+MMAP_THRESHOLD = 1 << 20
+# Chunks taken from a memory-mapped file cost no system call, so they can be larger
+MMAP_CHUNK_SIZE = 1 << 20
+# Parallel parsing splits no file into shards smaller than this
+MIN_SHARD_SIZE = 1 << 20
+# Shards per worker process, so that one slow shard does not hold up the rest
+SHARDS_PER_JOB = 4
+
+# Month macros that BibTeX styles predefine; they stand for themselves
+MONTH_MACROS = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+COMMON_STRINGS = {name: name for name in MONTH_MACROS}
+
+_HEAD_RE = re.compile(rb'@\s*([A-Za-z][\w\-]*)\s*([{(])')
+_HEAD_TEXT_RE = re.compile(r'@\s*([A-Za-z][\w\-]*)\s*([{(])')
+_HEAD_PREFIX_RE = re.compile(rb'@\s*(?:[A-Za-z][\w\-]*\s*)?')
+_BRACE_SCAN_RE = re.compile(rb'[{}]')
+_PAREN_SCAN_RE = re.compile(rb'[{}()"]')
+
+# Fast path for brace-delimited blocks: a body with up to four levels of nested
+# braces, written as unrolled loops so that a failed match cannot backtrack
+# exponentially. Anything deeper (or cut off by the chunk boundary) falls back
+# to counting braces one by one.
+_nested = rb'[^{}]*'
+for _ in range(4):
+    _nested = rb'[^{}]*(?:\{' + _nested + rb'\}[^{}]*)*'
+_BRACE_BODY_RE = re.compile(_nested + rb'\}')
+del _nested
+
+_FIELD_RE = re.compile(r'[\s,]*([^\s=,{}"#]+)\s*=\s*')
+_TOKEN_RE = re.compile(r'[^\s,#{}"]+')
+_BRACES_RE = re.compile(r'[{}]')
+_QUOTE_RE = re.compile(r'[{}"]')
+_NEWLINE_RE = re.compile(r'\s*\n\s*')
+
+
+def _iter_blocks(bib_file, chunk_size=CHUNK_SIZE, offset=0):
+    """Yield (type, body, start, end) for each top-level @-block of a binary file.
+
+    body is the raw bytes between the block delimiters; start and end are the
+    byte offsets of the '@' and one past the closing delimiter. offset is the
+    file position the reader is at when scanning starts.
+    """
+    buf = b''
+    base = offset  # file offset of buf[0]
+    pos = 0
+    eof = False
+    while True:
+        at = buf.find(b'@', pos)
+        if at < 0:
+            if eof:
+                return
+            base += len(buf)
+            buf, pos = bib_file.read(chunk_size), 0
+            eof = not buf
+            continue
+
+        head = _HEAD_RE.match(buf, at)
+        if head is None:
+            # Either a stray '@' in free text, or a header split across chunks.
+            if not eof and _HEAD_PREFIX_RE.fullmatch(buf, at):
+                chunk = bib_file.read(chunk_size)
+                base += at
+                buf, pos = buf[at:] + chunk, 0
+                eof = not chunk
+            else:
+                pos = at + 1
+            continue
+
+        is_paren = head.group(2) == b'('
+        if not is_paren:
+            body = _BRACE_BODY_RE.match(buf, head.end())
+            if body is not None:
+                end = body.end() - 1
+                yield head.group(1).decode('ascii').lower(), buf[head.end():end], base + at, base + end + 1
+                pos = end + 1
+                continue
+
+        pattern = _PAREN_SCAN_RE if is_paren else _BRACE_SCAN_RE
+        body_start = scan = head.end()
+        depth = 0
+        in_quote = False
+        end = -1
+        while end < 0:
+            for match in pattern.finditer(buf, scan):
+                char = buf[match.start()]
+                if char == 0x7b:  # {
+                    depth += 1
+                elif char == 0x7d:  # }
+                    if depth == 0 and not is_paren:
+                        end = match.start()
+                        break
+                    depth = max(depth - 1, 0)
+                elif depth == 0 and char == 0x22:  # "
+                    in_quote = not in_quote
+                elif depth == 0 and char == 0x29 and not in_quote:  # )
+                    end = match.start()
+                    break
+            if end >= 0:
+                break
+            if eof:
+                print(f"Warning: unterminated @{head.group(1).decode()} block at byte {base + at}",
+                      file=sys.stderr)
+                return
+            # Pull in the next chunk, dropping everything before this block.
+            chunk = bib_file.read(chunk_size)
+            eof = not chunk
+            scan = len(buf) - at
+            body_start -= at
+            base += at
+            buf, at = buf[at:] + chunk, 0
+
+        yield head.group(1).decode('ascii').lower(), buf[body_start:end], base + at, base + end + 1
+        pos = end + 1
+
+
+def _match_brace(text, pos):
+    """Return the index of the brace closing the one at text[pos]."""
+    depth = 0
+    for match in _BRACES_RE.finditer(text, pos):
+        if match.group() == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return match.start()
+    return len(text)
+
+
+def _match_quote(text, pos):
+    """Return the index of the quote closing the one at text[pos]."""
+    depth = 0
+    for match in _QUOTE_RE.finditer(text, pos + 1):
+        char = match.group()
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+        elif depth == 0:
+            return match.start()
+    return len(text)
+
+
+def _parse_value(text, pos, strings):
+    """Parse a field value starting at pos; return (value, next position)."""
+    parts = []
+    length = len(text)
+    while pos < length:
+        while pos < length and text[pos].isspace():
+            pos += 1
+        char = text[pos:pos + 1]
+        if char == '{':
+            end = _match_brace(text, pos)
+            parts.append(text[pos + 1:end])
+            pos = end + 1
+        elif char == '"':
+            end = _match_quote(text, pos)
+            parts.append(text[pos + 1:end])
+            pos = end + 1
+        else:
+            token = _TOKEN_RE.match(text, pos)
+            if token is None:
+                break
+            word = token.group()
+            parts.append(word if word.isdigit() else strings.get(word.lower(), word))
+            pos = token.end()
+        while pos < length and text[pos].isspace():
+            pos += 1
+        if text.startswith('#', pos):
+            pos += 1
+            continue
+        break
+    return _NEWLINE_RE.sub(' ', ''.join(parts)), pos
+
+
+def _parse_fields(text, pos, strings):
+    """Parse 'name = value' pairs from text[pos:] into a dict."""
+    fields = {}
+    while True:
+        match = _FIELD_RE.match(text, pos)
+        if match is None:
+            return fields
+        fields[match.group(1).lower()], pos = _parse_value(text, match.end(), strings)
+
+
+def parse_entry(entry_type, body, strings=COMMON_STRINGS):
+    """Turn the text between an entry's delimiters into a bibtexparser-style dict."""
+    comma = body.find(',')
+    if comma < 0:
+        key, fields = body.strip(), {}
+    else:
+        key, fields = body[:comma].strip(), _parse_fields(body, comma + 1, strings)
+    fields['ENTRYTYPE'] = entry_type
+    fields['ID'] = key
+    return fields
+
+
+def parse_string(text, strings):
+    """Parse the body of an @string block, record it in strings and return (name, value)."""
+    match = _FIELD_RE.match(text)
+    if match is None:
+        return None
+    value, _ = _parse_value(text, match.end(), strings)
+    strings[match.group(1).lower()] = value
+    return match.group(1), value
+
+
+def iter_raw_blocks(bib_filename, start=0, use_mmap=False):
+    """Yield (type, body, start, end) for every @-block of a file without parsing it.
+
+    body is the undecoded bytes between the delimiters; start and end are byte
+    offsets, so the block can be read again later with read_entries_at.
+    Scanning begins at byte offset start, which must lie between blocks. With
+    use_mmap the file is memory-mapped and chunks are taken straight from the
+    page cache instead of through read calls.
+    """
+    with open(bib_filename, 'rb') as bib_file:
+        stats = get_stats()
+        if use_mmap and os.fstat(bib_file.fileno()).st_size:
+            with mmap.mmap(bib_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                mapped.seek(start)
+                yield from stats.timed(_iter_blocks(mapped, chunk_size=MMAP_CHUNK_SIZE, offset=start), 'parse')
+            return
+        bib_file.seek(start)
+        yield from stats.timed(_iter_blocks(bib_file, offset=start), 'parse')
+
+
+def read_entries_at(bib_filename, spans, strings=COMMON_STRINGS, encoding='utf-8'):
+    """Yield the entries found at the given (start, end) byte spans of a file."""
+    return get_stats().timed(_read_entries_at(bib_filename, spans, strings, encoding), 'parse')
+
+
+def _read_entries_at(bib_filename, spans, strings, encoding):
+    with open(bib_filename, 'rb') as bib_file:
+        for start, end in spans:
+            bib_file.seek(start)
+            block = bib_file.read(end - start)
+            head = _HEAD_RE.match(block)
+            yield parse_entry(head.group(1).decode('ascii').lower(),
+                              block[head.end():-1].decode(encoding), strings)
+
+
+def shard_offsets(bib_filename, shards):
+    """Return the start offsets of about `shards` pieces of a file, each at a top-level block.
+
+    The first offset is 0. Cuts are placed at an '@' that begins a line and
+    opens a block header; iter_shards checks that they are block boundaries.
+    """
+    size = os.path.getsize(bib_filename)
+    shards = max(1, min(shards, size // MIN_SHARD_SIZE))
+    offsets = [0]
+    if shards == 1:
+        return offsets
+    with open(bib_filename, 'rb') as bib_file, \
+            mmap.mmap(bib_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for number in range(1, shards):
+            at = mapped.find(b'\n@', max(offsets[-1], size * number // shards))
+            while at >= 0 and _HEAD_RE.match(mapped, at + 1) is None:
+                at = mapped.find(b'\n@', at + 1)
+            if at < 0:
+                break
+            offsets.append(at + 1)
+    return offsets
+
+
+def iter_shards(bib_filename, parse_shard, jobs, *args):
+    """Run parse_shard over the shards of a file in jobs processes; yield the results in file order.
+
+    parse_shard(bib_filename, start, limit, *args) handles the blocks that
+    start in [start, limit) (limit None: to the end of the file) and returns
+    (result, next_start), next_start being where the first block at or after
+    limit starts, or None at the end of the file. It must be a module-level
+    function. With jobs None or 1, or a small file, it is called once in this
+    process for the whole file.
+    """
+    return get_stats().timed(_iter_shards(bib_filename, parse_shard, jobs, args), 'parse')
+
+
+def _iter_shards(bib_filename, parse_shard, jobs, args):
+    offsets = shard_offsets(bib_filename, jobs * SHARDS_PER_JOB) if jobs and jobs > 1 else [0]
+    if len(offsets) == 1:
+        yield parse_shard(bib_filename, 0, None, *args)[0]
+        return
+    limits = offsets[1:] + [None]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(_run_shard, repeat(parse_shard), repeat(bib_filename), offsets, limits,
+                               *(repeat(arg) for arg in args))
+        position = 0  # where the next block really starts
+        for start, limit, (result, next_start, warnings) in zip(offsets, limits, results):
+            if position is None or (limit is not None and position >= limit):
+                continue  # inside a block the shard before has already read
+            if start != position:
+                # The cut was not between two blocks
+                result, next_start = parse_shard(bib_filename, position, limit, *args)
+            else:
+                sys.stderr.write(warnings)
+            yield result
+            position = next_start
+
+
+def _run_shard(parse_shard, bib_filename, start, limit, *args):
+    """Call parse_shard in a worker, holding back what it prints to stderr.
+
+    A shard that starts inside a block reads it as garbage and may warn about
+    it; _iter_shards only passes the warnings on for the shards it keeps.
+    """
+    import io
+    from contextlib import redirect_stderr
+    with redirect_stderr(io.StringIO()) as warnings:
+        result, next_start = parse_shard(bib_filename, start, limit, *args)
+    return result, next_start, warnings.getvalue()
+
+
+class _ShardStrings(dict):
+    """The @string macros defined so far in one shard, as seen by a worker process.
+
+    Names defined in earlier shards are unknown here: they are looked up in
+    COMMON_STRINGS for the time being and noted in `guessed`. `stale` is set
+    when a macro whose own definition needed such a name is used.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.tainted = set()
+        self.guessed = set()
+        self.stale = False
+
+    def get(self, name, default=None):
+        if name in self.tainted:
+            self.stale = True
+        elif name not in self:
+            self.guessed.add(name)
+            return COMMON_STRINGS.get(name, default)
+        return self[name]
+
+
+def _parse_shard(bib_filename, start, limit, encoding):
+    """Parse the blocks of one shard; the parse_shard function of _iter_sharded_spans.
+
+    The result is a list of (kind, data, start, end, guessed) records. @string
+    bodies are left as text for the caller to define in file order. guessed is
+    None for an entry parsed without any outside macro, True if it must be
+    parsed again, and otherwise the macro names it looked up in COMMON_STRINGS.
+    """
+    strings = _ShardStrings()
+    records = []
+    with open(bib_filename, 'rb') as bib_file:
+        bib_file.seek(start)
+        for block_type, body, block_start, end in _iter_blocks(bib_file, offset=start):
+            if limit is not None and block_start >= limit:
+                return records, block_start
+            text = body.decode(encoding)
+            if block_type == 'string':
+                strings.guessed.clear()
+                strings.stale = False
+                definition = parse_string(text, strings)
+                if definition is not None:
+                    name = definition[0].lower()
+                    if strings.guessed or strings.stale:
+                        strings.tainted.add(name)
+                    else:
+                        strings.tainted.discard(name)
+                records.append(('string', text, block_start, end, None))
+            elif block_type in ('comment', 'preamble'):
+                records.append((block_type, text, block_start, end, None))
+            else:
+                strings.guessed.clear()
+                strings.stale = False
+                fields = parse_entry(block_type, text, strings)
+                guessed = True if strings.stale else tuple(strings.guessed) or None
+                records.append(('entry', fields, block_start, end, guessed))
+    return records, None
+
+
+def _iter_sharded_spans(bib_filename, encoding, jobs):
+    stats = get_stats()
+    strings = dict(COMMON_STRINGS)
+    for records in iter_shards(bib_filename, _parse_shard, jobs, encoding):
+        for kind, data, start, end, guessed in records:
+            if kind == 'string':
+                definition = parse_string(data, strings)
+                if definition is not None:
+                    yield 'string', definition, start, end
+            elif kind == 'entry':
+                stats.count('entries read')
+                if guessed is True or (guessed and any(strings.get(name) != COMMON_STRINGS.get(name)
+                                                       for name in guessed)):
+                    # The entry uses macros from an earlier shard
+                    stats.count('entries reparsed')
+                    data = next(_read_entries_at(bib_filename, [(start, end)], strings, encoding))
+                yield 'entry', data, start, end
+            else:
+                yield kind, data, start, end
+
+
+def iter_bib_spans(bib_filename, encoding='utf-8', jobs=None):
+    """Yield (kind, data, start, end) for every block in a BibTeX file, in file order.
+
+    kind and data are as for iter_bib_records; start and end are the byte
+    offsets of the block in the file, as expected by write_passthrough. With
+    jobs > 1 the file is parsed in that many processes.
+    """
+    if jobs is not None and jobs > 1:
+        return get_stats().timed(_iter_sharded_spans(bib_filename, encoding, jobs), 'parse')
+    return get_stats().timed(_iter_spans(bib_filename, encoding), 'parse')
+
+
+def _iter_spans(bib_filename, encoding):
+    stats = get_stats()
+    strings = dict(COMMON_STRINGS)
+    with open(bib_filename, 'rb') as bib_file:
+        for block_type, body, start, end in _iter_blocks(bib_file):
+            text = body.decode(encoding)
+            if block_type == 'string':
+                definition = parse_string(text, strings)
+                if definition is not None:
+                    yield 'string', definition, start, end
+            elif block_type in ('comment', 'preamble'):
+                yield block_type, text, start, end
+            else:
+                stats.count('entries read')
+                yield 'entry', parse_entry(block_type, text, strings), start, end
+
+
+def iter_bib_records(bib_filename, encoding='utf-8', jobs=None):
+    """Yield (kind, data) for every block in a BibTeX file, in file order.
+
+    kind is 'entry' (data is the entry dict), 'string' (data is a (name, value)
+    pair, already expanded), or 'preamble' / 'comment' (data is the raw body).
+    """
+    for kind, data, _, _ in iter_bib_spans(bib_filename, encoding, jobs):
+        yield kind, data
+
+
+def iter_bib_entries(bib_filename, encoding='utf-8', jobs=None):
+    """Yield the entries of a BibTeX file one at a time."""
+    for kind, data in iter_bib_records(bib_filename, encoding, jobs):
+        if kind == 'entry':
+            yield data
+
+
+# Fields a CompactEntry keeps decoded; the rest are parsed again from the file when first used
+COMPACT_FIELDS = ('author', 'title', 'journal', 'year', 'doi', 'eprint', 'volume', 'pages')
+# Compact fields whose values repeat across a library and are stored once per file
+INTERNED_FIELDS = frozenset(['journal', 'year', 'volume'])
+_SLOT_FIELDS = frozenset(('ENTRYTYPE', 'ID') + COMPACT_FIELDS)
+
+
+class CompactEntry(MutableMapping):
+    """A memory-saving stand-in for an entry dict, as yielded by iter_compact_entries.
+
+    The key, the entry type and COMPACT_FIELDS live in slots; repeated values
+    (entry types, journals, years, volumes) are shared between entries. Other
+    fields are only remembered by name and are read back from the entry's
+    byte span in the file the first time one of them is used. It supports the
+    whole dict interface, including assignment, so code written for entry
+    dicts accepts it unchanged.
+    """
+    __slots__ = ('ENTRYTYPE', 'ID') + COMPACT_FIELDS + ('_rare', '_extra', '_source', '_start', '_end')
+
+    def __init__(self, fields, source=None, start=None, end=None, interned=None, shapes=None):
+        self.ENTRYTYPE = sys.intern(fields['ENTRYTYPE'])
+        self.ID = fields['ID']
+        for name in COMPACT_FIELDS:
+            value = fields.get(name)
+            if value is not None and interned is not None and name in INTERNED_FIELDS:
+                value = interned.setdefault(value, value)
+            setattr(self, name, value)
+        rare = tuple(name for name in fields if name not in _SLOT_FIELDS)
+        # Entries with the same set of other fields share one tuple of their names
+        self._rare = shapes.setdefault(rare, rare) if shapes is not None else rare
+        # Without a file to read them back from, the other fields are kept
+        self._extra = {name: fields[name] for name in rare} if source is None and rare else None
+        self._source = source
+        self._start = start
+        self._end = end
+
+    def _load(self):
+        if self._extra is None:
+            self._extra = {}
+            if self._rare:
+                bib_filename, strings, encoding = self._source
+                entry = next(_read_entries_at(bib_filename, [(self._start, self._end)], strings, encoding))
+                self._extra = {name: entry[name] for name in self._rare}
+        return self._extra
+
+    def __getitem__(self, name):
+        if name in _SLOT_FIELDS:
+            value = getattr(self, name)
+            if value is None:
+                raise KeyError(name)
+            return value
+        if name not in self._rare:
+            raise KeyError(name)
+        return self._load()[name]
+
+    def get(self, name, default=None):
+        if name in _SLOT_FIELDS:
+            value = getattr(self, name)
+            return default if value is None else value
+        if name not in self._rare:
+            return default
+        return self._load()[name]
+
+    def __contains__(self, name):
+        if name in _SLOT_FIELDS:
+            return getattr(self, name) is not None
+        return name in self._rare
+
+    def __setitem__(self, name, value):
+        if name in _SLOT_FIELDS:
+            setattr(self, name, value)
+            return
+        self._load()[name] = value
+        if name not in self._rare:
+            self._rare += (name,)
+
+    def __delitem__(self, name):
+        if name in _SLOT_FIELDS:
+            if getattr(self, name) is None:
+                raise KeyError(name)
+            setattr(self, name, None)
+            return
+        del self._load()[name]
+        self._rare = tuple(rare for rare in self._rare if rare != name)
+
+    def __iter__(self):
+        for name in COMPACT_FIELDS:
+            if getattr(self, name) is not None:
+                yield name
+        yield from self._rare
+        yield 'ENTRYTYPE'
+        yield 'ID'
+
+    def __len__(self):
+        return 2 + len(self._rare) + sum(getattr(self, name) is not None for name in COMPACT_FIELDS)
+
+    def __repr__(self):
+        return f"CompactEntry({dict(self)!r})"
+
+
+def iter_compact_entries(bib_filename, encoding='utf-8', jobs=None):
+    """Like iter_bib_entries, but yield CompactEntry objects, for code that keeps many entries in memory."""
+    return get_stats().timed(_iter_compact_entries(bib_filename, encoding, jobs), 'parse')
+
+
+def _iter_compact_entries(bib_filename, encoding, jobs):
+    stats = get_stats()
+    interned = {}
+    shapes = {}
+    strings = dict(COMMON_STRINGS)
+    source = (bib_filename, strings, encoding)
+    if jobs is not None and jobs > 1:
+        for kind, data, start, end in _iter_sharded_spans(bib_filename, encoding, jobs):
+            if kind == 'string':
+                strings = dict(strings)
+                source = (bib_filename, strings, encoding)
+                strings[data[0].lower()] = data[1]
+            elif kind == 'entry':
+                yield CompactEntry(data, source, start, end, interned, shapes)
+        return
+    with open(bib_filename, 'rb') as bib_file:
+        for block_type, body, start, end in _iter_blocks(bib_file):
+            if block_type == 'string':
+                # Entries read so far keep the macros that were in effect for them
+                strings = dict(strings)
+                source = (bib_filename, strings, encoding)
+                parse_string(body.decode(encoding), strings)
+            elif block_type not in ('comment', 'preamble'):
+                stats.count('entries read')
+                fields = parse_entry(block_type, body.decode(encoding), strings)
+                yield CompactEntry(fields, source, start, end, interned, shapes)
+
+
+def format_entry(entry):
+    """Format an entry the way bibtexparser's BibTexWriter does by default."""
+    fields = sorted(k for k in entry if k not in ('ENTRYTYPE', 'ID'))
+    lines = [f"@{entry['ENTRYTYPE']}{{{entry['ID']}"]
+    lines.extend(f" {field} = {format_value(field, entry[field])}" for field in fields)
+    return ",\n".join(lines) + "\n}\n"
+
+
+def format_value(field, value):
+    """Brace a field value, except a month macro, which is written bare."""
+    if field == 'month' and value in MONTH_MACROS:
+        return value
+    return f"{{{value}}}"
+
+
+def format_record(kind, data):
+    """Format any record yielded by iter_bib_records back into BibTeX."""
+    if kind == 'entry':
+        return format_entry(data)
+    if kind == 'string':
+        return f"@string{{{data[0]} = {{{data[1]}}}}}\n"
+    return f"@{kind}{{{data}}}\n"
+
+
+def write_bib_records(records, output_filename, encoding='utf-8'):
+    """Stream (kind, data) records to output_filename; return how many were written.
+
+    The output is written to a temporary file and moved into place at the end,
+    so the records may come from output_filename itself, including
+    CompactEntry objects that read their other fields back from it.
+    """
+    count = 0
+    output_dir = os.path.dirname(os.path.abspath(output_filename))
+    with get_stats().phase('write'):
+        output_file = tempfile.NamedTemporaryFile('w', encoding=encoding, dir=output_dir, delete=False,
+                                                  prefix='.' + os.path.basename(output_filename))
+        try:
+            with output_file:
+                for kind, data in records:
+                    if count:
+                        output_file.write("\n")
+                    output_file.write(format_record(kind, data))
+                    count += 1
+        except BaseException:
+            os.unlink(output_file.name)
+            raise
+        if os.path.exists(output_filename):
+            shutil.copymode(output_filename, output_file.name)
+        else:
+            # Temporary files are private; give a new file the usual permissions
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(output_file.name, 0o666 & ~umask)
+        os.replace(output_file.name, output_filename)
+    return count
+
+
+def write_bib_entries(entries, output_filename, encoding='utf-8'):
+    """Stream entry dicts to output_filename; return how many were written."""
+    return write_bib_records((('entry', entry) for entry in entries), output_filename, encoding)
+
+
+def _field_spans(body):
+    """Find the key and fields of an entry body for patch_entry.
+
+    Returns (key start, key end, {field: [(cut start, name start, value start,
+    value end), ...]}), where cutting from cut start to value end removes the
+    field together with the separator before it.
+    """
+    comma = body.find(',')
+    key = body[:comma] if comma >= 0 else body
+    key_start, key_end = len(key) - len(key.lstrip()), len(key.rstrip())
+    fields = {}
+    if comma < 0:
+        return key_start, key_end, fields
+    cut = pos = comma
+    while True:
+        match = _FIELD_RE.match(body, pos)
+        if match is None:
+            return key_start, key_end, fields
+        _, pos = _parse_value(body, match.end(), {})
+        value_end = pos
+        while value_end > match.end() and body[value_end - 1].isspace():
+            value_end -= 1
+        fields.setdefault(match.group(1).lower(), []).append((cut, match.start(1), match.end(), value_end))
+        cut = value_end
+
+
+def patch_entry(block, before, after):
+    """Return the text of an entry block, parsed as before, changed to after.
+
+    Only what differs is re-written: a changed value is replaced in place, a
+    removed field is cut out with the separator before it, and new fields go
+    after the last one, in its indentation. The entry type, the key and all
+    other fields keep their original bytes, macros and layout included.
+    """
+    head = _HEAD_TEXT_RE.match(block)
+    body_start = head.end()
+    body = block[body_start:-1]
+    key_start, key_end, fields = _field_spans(body)
+    patches = []  # (start, end, text) in body positions, applied in order
+    if after['ID'] != before['ID']:
+        patches.append((key_start, key_end, after['ID']))
+    for name, spans in fields.items():
+        if name not in after:
+            patches.extend((cut, value_end, '') for cut, _, _, value_end in spans)
+        elif after[name] != before.get(name):
+            patches.extend((cut, value_end, '') for cut, _, _, value_end in spans[:-1])
+            _, _, value_start, value_end = spans[-1]
+            patches.append((value_start, value_end, format_value(name, after[name])))
+    added = [name for name in after if name not in ('ENTRYTYPE', 'ID') and name not in fields]
+    if added:
+        last = max((span for spans in fields.values() for span in spans), default=None)
+        if last is None:
+            at, separator = key_end, ',\n  '
+        else:
+            at = last[3]
+            line_start = body.rfind('\n', 0, last[1]) + 1
+            indent = body[line_start:last[1]]
+            newline = '\r\n' if body.startswith('\r\n', line_start - 2) else '\n'
+            separator = ',' + newline + indent if line_start and not indent.strip() else ', '
+        patches.append((at, at, ''.join(f"{separator}{name} = {format_value(name, after[name])}"
+                                         for name in added)))
+    pieces = [block[:head.start(1)], after['ENTRYTYPE'] if after['ENTRYTYPE'] != before['ENTRYTYPE']
+              else head.group(1), block[head.end(1):body_start]]
+    pos = 0
+    for start, end, text in sorted(patches, key=lambda patch: patch[:2]):
+        pieces.append(body[pos:start])
+        pieces.append(text)
+        pos = end
+    pieces.append(body[pos:])
+    pieces.append(block[-1])
+    return ''.join(pieces)
+
+
+def iter_entry_edits(bib_filename, edit, encoding='utf-8'):
+    """Call edit(entry) on every entry and yield (start, end, text) for the ones it changed.
+
+    edit modifies the entry dict in place; only the fields it changed are
+    re-written (see patch_entry). The result is meant for write_passthrough.
+    """
+    stats = get_stats()
+    with open(bib_filename, 'rb') as bib_file:
+        for kind, data, start, end in iter_bib_spans(bib_filename, encoding):
+            if kind == 'entry':
+                with stats.phase('transform'):
+                    before = dict(data)
+                    edit(data)
+                    changed = data != before
+                if changed:
+                    stats.count('entries modified')
+                    yield start, end, read_patched_entry(bib_file, start, end, before, data, encoding)
+
+
+def read_patched_entry(bib_file, start, end, before, after, encoding='utf-8'):
+    """patch_entry on the block at start..end of an open binary file."""
+    bib_file.seek(start)
+    return patch_entry(bib_file.read(end - start).decode(encoding), before, after)
+
+
+def _open_source(source_file):
+    """Return the whole of a binary file as a buffer, memory-mapped if it is large."""
+    size = os.fstat(source_file.fileno()).st_size
+    if size >= MMAP_THRESHOLD:
+        return mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return source_file.read()
+
+
+def write_pieces(bib_filename, pieces, output_filename, encoding='utf-8'):
+    """Stream pieces to output_filename and return how many were written.
+
+    Each piece is either a (start, end) byte span, copied verbatim from
+    bib_filename, or a string, written as is. Adjacent spans are merged into a
+    single copy. The output is written to a temporary file and moved into
+    place at the end, so output_filename may be bib_filename itself.
+    """
+    with get_stats().phase('write'):
+        return _write_pieces(bib_filename, pieces, output_filename, encoding)
+
+
+def _write_pieces(bib_filename, pieces, output_filename, encoding):
+    output_dir = os.path.dirname(os.path.abspath(output_filename))
+    output_file = tempfile.NamedTemporaryFile('wb', dir=output_dir, delete=False,
+                                              prefix='.' + os.path.basename(output_filename))
+    count = 0
+    try:
+        with open(bib_filename, 'rb') as source_file, output_file:
+            source = _open_source(source_file)
+            view = memoryview(source)
+            try:
+                copy_start = copy_end = 0
+                for piece in pieces:
+                    count += 1
+                    if isinstance(piece, tuple):
+                        start, end = piece
+                        if start != copy_end:
+                            output_file.write(view[copy_start:copy_end])
+                            copy_start = start
+                        copy_end = end
+                        continue
+                    output_file.write(view[copy_start:copy_end])
+                    copy_start = copy_end = 0
+                    output_file.write(piece.encode(encoding))
+                output_file.write(view[copy_start:copy_end])
+            finally:
+                view.release()
+                if isinstance(source, mmap.mmap):
+                    source.close()
+    except BaseException:
+        os.unlink(output_file.name)
+        raise
+    shutil.copymode(bib_filename, output_file.name)
+    os.replace(output_file.name, output_filename)
+    return count
+
+
+def write_passthrough(bib_filename, edits, output_filename, encoding='utf-8'):
+    """Copy bib_filename to output_filename, re-emitting only the edited blocks.
+
+    edits is an iterable of (start, end, text) in file order, replacing the
+    block at that span with text, or dropping it (and the blank space after
+    it) when text is None. Everything else is copied byte for byte. Returns
+    the number of blocks replaced or dropped.
+    """
+    edit_count = 0
+
+    def pieces():
+        nonlocal edit_count
+        pos = 0
+        with open(bib_filename, 'rb') as bib_file:
+            for start, end, text in edits:
+                edit_count += 1
+                yield pos, start
+                if text is None:
+                    bib_file.seek(end)
+                    trailing = bib_file.read(CHUNK_SIZE)
+                    end += len(trailing) - len(trailing.lstrip())
+                else:
+                    yield text.rstrip('\n')
+                pos = end
+            yield pos, os.fstat(bib_file.fileno()).st_size
+
+    write_pieces(bib_filename, pieces(), output_filename, encoding)
+    return edit_count
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+'''
+Single entry point for the scripts in this folder.
+
+Each script is a subcommand that takes the script's own options, e.g.
+
+    bibtools clean --aux main.aux --bib refs.bib --output cleaned.bib
+    bibtools journal-names --bib refs.bib --cluster
+
+(citekeys, clean, dedup, figures, journal-names, journals, pages, titlecase).
+Only the script behind the subcommand is imported, and the scripts import
+heavy dependencies such as requests only where they are used, so a call
+costs little more than interpreter start-up. For hooks that run the tools
+many times per build, `bibtools serve` keeps a warm interpreter around; see
+warmserver.py. After `pip install -e .` the command is on the PATH as
+`bibtools`; `python bibtools.py ...` works without installing.
+
+`bibtools pipeline` parses the bibliography once and passes its entries
+through a chain of stages, then writes the result once at the end:
+
+    clean      keep only the entries cited in --aux (clean-bib.py)
+    journals   abbreviate journal names (journal-name-sub.py)
+    pages      fill in missing pages fields (pages-field.py)
+    titlecase  brace every word of the title (fix-title-case.py)
+
+Stages run in the order given with --stages (by default all of them, in the
+order above, with clean only if --aux is given), e.g.
+
+    bibtools pipeline --input refs.bib --output out.bib \\
+        --stages clean,journals,pages,titlecase --aux main.aux
+
+or read from a JSON config file whose keys are the long option names:
+
+    {"stages": ["clean", "journals", "pages"], "aux": "main.aux", "offline": true}
+
+Options given on the command line override the config file. As with the
+individual scripts, only the entries a stage changes are re-written; the rest
+of the file is copied byte for byte.
+'''
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import types
+
+from bibreader import iter_bib_spans, read_patched_entry, write_passthrough
+from runstats import add_stats_arguments, get_stats, start_stats
+
+STAGE_NAMES = ('clean', 'journals', 'pages', 'titlecase')
+
+# Subcommands that run one of the scripts in this folder, with that script's own options
+SCRIPT_COMMANDS = {
+    'citekeys': ('citekeys', 'Print the citekeys of BibTeX files, or compare keys across files'),
+    'clean': ('clean-bib', 'Keep only the entries cited by one or more papers'),
+    'dedup': ('bibdeduplicate', 'Find and resolve duplicate entries'),
+    'figures': ('unused_figs', 'List used or unused figures, or package a LaTeX project'),
+    'journal-names': ('journal-names', 'List journal names, or group their variant spellings'),
+    'journals': ('journal-name-sub', 'Abbreviate journal names'),
+    'pages': ('pages-field', 'Fill in missing pages fields'),
+    'titlecase': ('fix-title-case', 'Brace the words of titles to keep their case'),
+}
+
+DEFAULT_OPTIONS = {
+    'stages': None,
+    'aux': None,
+    'offline': False,
+    'refresh': False,
+    'no_cache': False,
+    'cache': None,
+    'index': None,
+    'no_index': False,
+    'rules': None,
+    'jobs': None,
+    'abbreviations': None,
+    'ltwa': None,
+}
+
+
+def load_script(name):
+    """Import one of the hyphenated scripts in this folder, e.g. 'clean-bib', as a module."""
+    return importlib.import_module(name)
+
+
+class CleanStage:
+    """Drop every entry that is not cited in the aux file."""
+
+    def __init__(self, aux_filename):
+        self.keys = set(load_script('clean-bib').extract_citation_keys(aux_filename))
+
+    def __call__(self, entry):
+        return entry if entry['ID'] in self.keys or '*' in self.keys else None
+
+
+class PagesStage:
+    """Fill in missing pages fields, resolving all DOIs together before any entry is touched."""
+
+    def __init__(self, options):
+        self.pages_field = load_script('pages-field')
+        self.options = options
+        if options['index'] and not options['no_index'] and not os.path.exists(options['index']):
+            raise ValueError(f"DOI index {options['index']} not found")
+        self.rules = self.pages_field.PageRuleEngine()
+        if options['rules']:
+            for rule in self.pages_field.load_rules(options['rules']):
+                self.rules.add_rule(rule)
+        self.metadata_by_doi = {}
+
+    def prepare(self, entries):
+        pages_field = self.pages_field
+        options = self.options
+        dois = [entry['doi'] for entry in entries if pages_field.needs_lookup(entry, self.rules)]
+        if not dois:
+            return
+
+        fetch_options = {}
+        if options['jobs']:
+            fetch_options['jobs'] = options['jobs']
+
+        index = None
+        index_file = options['index'] or pages_field.default_index_path()
+        if not options['no_index'] and os.path.exists(index_file):
+            index = pages_field.DOIIndex(index_file)
+        try:
+            if options['no_cache']:
+                self.metadata_by_doi = pages_field.resolve_metadata(
+                    dois, offline=options['offline'], index=index, **fetch_options)
+            else:
+                with pages_field.DOICache(options['cache']) as cache:
+                    self.metadata_by_doi = pages_field.resolve_metadata(
+                        dois, cache=cache, offline=options['offline'], refresh=options['refresh'],
+                        index=index, **fetch_options)
+        finally:
+            if index is not None:
+                index.close()
+
+    def __call__(self, entry):
+        return self.pages_field.add_pages_field(entry, self.metadata_by_doi, self.rules)
+
+    def report(self):
+        if self.rules.counts:
+            print("Pages derived offline from the DOI:")
+            for line in self.rules.report():
+                print("-", line)
+
+
+def make_stage(name, options):
+    """Build the stage called name; a stage maps an entry to the edited entry, or None to drop it."""
+    if name == 'clean':
+        if not options['aux']:
+            raise ValueError("the clean stage needs an aux file (--aux)")
+        return CleanStage(options['aux'])
+    if name == 'journals':
+        journal_name_sub = load_script('journal-name-sub')
+        if options['abbreviations'] or options['ltwa']:
+            journal_name_sub.set_abbreviation_sources(options['abbreviations'] or [], options['ltwa'] or [])
+        return journal_name_sub.substitute_journal
+    if name == 'pages':
+        return PagesStage(options)
+    if name == 'titlecase':
+        return load_script('fix-title-case').fix_entry
+    raise ValueError(f"unknown stage {name!r}, choose from {', '.join(STAGE_NAMES)}")
+
+
+def default_stages(options):
+    """Every stage in the usual order, cleaning only when there is an aux file to clean against."""
+    return [name for name in STAGE_NAMES if name != 'clean' or options['aux']]
+
+
+def _apply_stage(stage, records):
+    """Run one stage over a stream of records.
+
+    A stage with a prepare method sees every surviving entry before the first
+    one is edited (the pages stage uses this to batch its DOI lookups), so it
+    holds the stream up to that point in memory; other stages stream.
+    """
+    stats = get_stats()
+    if hasattr(stage, 'prepare'):
+        records = list(records)
+        stage.prepare([data for kind, data, _, _, _ in records if kind == 'entry' and data is not None])
+    for kind, data, start, end, before in records:
+        if kind == 'entry' and data is not None:
+            with stats.phase('transform'):
+                data = stage(data)
+        yield kind, data, start, end, before
+
+
+def _edits(input_file, records, counts):
+    """Turn the pipeline output into (start, end, text) edits for write_passthrough."""
+    stats = get_stats()
+    with open(input_file, 'rb') as bib_file:
+        for kind, data, start, end, before in records:
+            if kind != 'entry':
+                continue
+            if data is None:
+                counts['dropped'] += 1
+                stats.count('entries dropped')
+                yield start, end, None
+            elif data != before:
+                counts['edited'] += 1
+                stats.count('entries modified')
+                yield start, end, read_patched_entry(bib_file, start, end, before, data)
+
+
+def run_pipeline(input_file, output_file, stages):
+    """Parse input_file once, run every entry through the stages in order and write output_file."""
+    records = ((kind, data, start, end, dict(data) if kind == 'entry' else None)
+               for kind, data, start, end in iter_bib_spans(input_file))
+    for stage in stages:
+        records = _apply_stage(stage, records)
+    counts = {'edited': 0, 'dropped': 0}
+    write_passthrough(input_file, _edits(input_file, records, counts), output_file)
+    return counts
+
+
+def load_config(config_filename):
+    """Read pipeline options from a JSON file; keys are the long option names."""
+    with open(config_filename, 'r') as config_file:
+        config = json.load(config_file)
+    options = {}
+    for key, value in config.items():
+        key = key.replace('-', '_')
+        if key not in DEFAULT_OPTIONS:
+            raise ValueError(f"unknown option {key!r} in {config_filename}")
+        options[key] = value
+    return options
+
+
+def pipeline_main(args):
+    options = dict(DEFAULT_OPTIONS)
+    try:
+        if args.config:
+            options.update(load_config(args.config))
+        options.update({key: value for key, value in vars(args).items()
+                        if key in DEFAULT_OPTIONS and value not in (None, False)})
+
+        stage_names = options['stages'] or default_stages(options)
+        if isinstance(stage_names, str):
+            stage_names = [name.strip() for name in stage_names.split(',') if name.strip()]
+        stages = [make_stage(name, options) for name in stage_names]
+    except ValueError as error:
+        sys.exit(f"Error: {error}")
+
+    print("Stages:", " -> ".join(stage_names))
+    counts = run_pipeline(args.input_file, args.output_file, stages)
+    for stage in stages:
+        if hasattr(stage, 'report'):
+            stage.report()
+    print(f"{counts['edited']} entries edited, {counts['dropped']} dropped")
+    print(f"New BibTeX file created: {args.output_file}")
+
+
+def run_script(command, argv):
+    """Run the script behind a subcommand as if it had been called directly with argv."""
+    # What runpy.run_module(..., alter_sys=True) does, except that sys.argv[0]
+    # names the subcommand rather than the script file, so that argparse
+    # shows `bibtools clean` in usage and error messages
+    spec = importlib.util.find_spec(SCRIPT_COMMANDS[command][0])
+    module = types.ModuleType('__main__')
+    module.__file__, module.__loader__, module.__spec__ = spec.origin, spec.loader, spec
+    saved_main = sys.modules['__main__']
+    sys.modules['__main__'] = module  # so that worker processes find the script's functions
+    sys.argv = [f'bibtools {command}'] + list(argv)
+    try:
+        exec(spec.loader.get_code(spec.name), module.__dict__)
+    finally:
+        sys.modules['__main__'] = saved_main
+
+
+def serve_main(args):
+    import warmserver
+    try:
+        socket_path = args.socket or warmserver.default_socket_path()
+    except PermissionError as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    warmserver.serve(socket_path, lambda argv: main(argv, use_server=False))
+
+
+def main(argv=None, use_server=True):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    socket_path = os.environ.get('BIBTOOLS_SOCKET')
+    if use_server and socket_path and argv[:1] != ['serve']:
+        import warmserver
+        status = warmserver.call_server(socket_path, argv)
+        if status is not None:
+            return status
+    if argv and argv[0] in SCRIPT_COMMANDS:
+        return run_script(argv[0], argv[1:])
+
+    parser = argparse.ArgumentParser(prog='bibtools', description='Tools for organizing a BibTeX file before submission')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, (_, description) in SCRIPT_COMMANDS.items():
+        # Listed for --help only; the script parses its own options
+        subparsers.add_parser(command, help=description, add_help=False)
+
+    pipeline = subparsers.add_parser('pipeline', help='Run several transforms over a BibTeX file in one pass',
+                                     description='Parse a BibTeX file once, run it through a chain of '
+                                                 'stages and write the result once.')
+    pipeline.add_argument('--input', dest='input_file', help='Input BibTeX file', required=True)
+    pipeline.add_argument('--output', dest='output_file', help='Output BibTeX file', required=True)
+    pipeline.add_argument('--stages', default=None,
+                          help=f'Comma-separated stages to run, in order (default: {",".join(STAGE_NAMES)}, '
+                               'clean only with --aux)')
+    pipeline.add_argument('--config', default=None, help='JSON file with pipeline options')
+    pipeline.add_argument('--aux', default=None, help='Auxiliary file for the clean stage (e.g., main.aux)')
+    pipeline.add_argument('--abbreviations', nargs='+', default=None, metavar='FILE',
+                          help='Journal abbreviation list(s) for the journals stage')
+    pipeline.add_argument('--ltwa', nargs='+', default=None, metavar='FILE',
+                          help='ISO 4 List of Title Word Abbreviations for the journals stage')
+    pipeline.add_argument('--rules', default=None, help='JSON file with extra DOI -> pages rules')
+    pipeline.add_argument('--jobs', type=int, default=None, help='Number of concurrent DOI lookups')
+    pipeline.add_argument('--cache', default=None, help='DOI metadata cache file')
+    pipeline.add_argument('--no-cache', action='store_true', help='Do not read or write the DOI metadata cache')
+    pipeline.add_argument('--index', default=None, help='Local DOI index consulted before the network')
+    pipeline.add_argument('--no-index', action='store_true', help='Do not consult the local DOI index')
+    mode = pipeline.add_mutually_exclusive_group()
+    mode.add_argument('--offline', action='store_true', help='Never touch the network, use cached metadata only')
+    mode.add_argument('--refresh', action='store_true', help='Ignore cached metadata and fetch every DOI again')
+    add_stats_arguments(pipeline)
+    pipeline.set_defaults(func=pipeline_main)
+
+    serve = subparsers.add_parser('serve', help='Keep a warm interpreter for repeated calls (Unix only)',
+                                  description='Preload the tools and run every bibtools call made with '
+                                              'BIBTOOLS_SOCKET set to the socket in a fork of this process.')
+    serve.add_argument('--socket', default=None,
+                       help='Unix socket to listen on (default: bibtools-<uid>.sock in $XDG_RUNTIME_DIR or /tmp)')
+    serve.set_defaults(func=serve_main)
+
+    args = parser.parse_args(argv)
+    if args.func is pipeline_main:
+        start_stats(args)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,10 @@
 import argparse
+import hashlib
+import json
 import re
+from collections import defaultdict
+from bibreader import iter_raw_blocks, read_entries_at
+from runstats import add_stats_arguments, get_stats, start_stats
 
 def extract_citekeys(bib_filename):
     with open(bib_filename, 'r') as bib_file:
@@ -11,17 +16,130 @@ def extract_citekeys(bib_filename):
 
     return citekeys
 
+def indexed_citekeys(bib_filename):
+    # Keys straight from the <bib>.key-index sidecar, built first if missing or stale
+    from bibkeyindex import BibKeyIndex
+    with BibKeyIndex(bib_filename) as index:
+        return list(index.keys())
+
+def scan_entry_keys(bib_filename):
+    """Return (key, start, end, digest) for every entry of a file, skipping @string, @preamble and @comment.
+
+    digest identifies the entry's content with whitespace normalized, so two
+    entries with the same digest are identical up to formatting.
+    """
+    entries = []
+    for block_type, body, start, end in iter_raw_blocks(bib_filename, use_mmap=True):
+        if block_type in ('string', 'preamble', 'comment'):
+            continue
+        key, _, fields = body.partition(b',')
+        digest = hashlib.blake2b(block_type.encode() + b' ' + b' '.join(fields.split()), digest_size=8).hexdigest()
+        entries.append((key.strip().decode('utf-8', errors='replace'), start, end, digest))
+    return entries
+
+def _compare(occurrences):
+    """Return ('identical', []) or ('conflicting', differing field names) for (file, start, end, digest) tuples."""
+    if len({digest for _, _, _, digest in occurrences}) == 1:
+        return 'identical', []
+    entries = [next(read_entries_at(bib_filename, [(start, end)]))
+               for bib_filename, start, end, _ in occurrences]
+    fields = sorted(set().union(*entries) - {'ID'})
+    differing = [field for field in fields
+                 if len({' '.join(entry.get(field, '').split()) for entry in entries}) > 1]
+    return ('conflicting' if differing else 'identical'), differing
+
+def citekey_census(bib_filenames, jobs=None):
+    """Scan many BibTeX files in parallel and report duplicate keys within files and collisions across them."""
+    with get_stats().phase('parse'):
+        if jobs == 1 or len(bib_filenames) == 1:
+            scans = [scan_entry_keys(bib_filename) for bib_filename in bib_filenames]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                scans = list(executor.map(scan_entry_keys, bib_filenames))
+
+    occurrences = defaultdict(list)
+    files = {}
+    for bib_filename, entries in zip(bib_filenames, scans):
+        files[bib_filename] = {'entries': len(entries), 'keys': len({key for key, _, _, _ in entries})}
+        for key, start, end, digest in entries:
+            occurrences[key].append((bib_filename, start, end, digest))
+
+    duplicates = []
+    collisions = []
+    for key, found in occurrences.items():
+        if len(found) < 2:
+            continue
+        by_file = defaultdict(list)
+        for occurrence in found:
+            by_file[occurrence[0]].append(occurrence)
+        for bib_filename, in_file in by_file.items():
+            if len(in_file) > 1:
+                status, fields = _compare(in_file)
+                duplicates.append({'key': key, 'file': bib_filename, 'count': len(in_file),
+                                   'status': status, 'fields': fields})
+        if len(by_file) > 1:
+            # Compare one entry per file; duplicates inside a file are reported above
+            status, fields = _compare([in_file[-1] for in_file in by_file.values()])
+            collisions.append({'key': key, 'files': list(by_file), 'status': status, 'fields': fields})
+
+    return {'files': files, 'keys': len(occurrences), 'duplicates': duplicates, 'collisions': collisions}
+
+def print_census(census):
+    def describe(item):
+        if item['status'] == 'identical':
+            return 'identical'
+        return f"conflicting: {', '.join(item['fields'])}"
+
+    print("Duplicate keys within a file:")
+    for item in census['duplicates']:
+        print(f"- {item['file']}: {item['key']} ({item['count']}x, {describe(item)})")
+    print("Key collisions across files:")
+    for item in census['collisions']:
+        print(f"- {item['key']}: {', '.join(item['files'])} ({describe(item)})")
+    entries = sum(info['entries'] for info in census['files'].values())
+    conflicting = sum(item['status'] == 'conflicting' for item in census['duplicates'] + census['collisions'])
+    print(f"{len(census['files'])} files, {entries} entries, {census['keys']} distinct keys, "
+          f"{len(census['duplicates'])} duplicated within a file, {len(census['collisions'])} shared across files, "
+          f"{conflicting} conflicting")
+
 if __name__ == "__main__":
     # Create argument parser
     parser = argparse.ArgumentParser(description='Extract citation keys from a BibTeX file')
-    
-    # Add argument for the BibTeX file name
-    parser.add_argument('--bib', dest='bib_filename', help='BibTeX file name', required=True)
-    
+
+    # Add argument for the BibTeX file name(s)
+    parser.add_argument('--bib', dest='bib_filenames', nargs='+', help='BibTeX file name(s)', required=True)
+
+    # Add argument for reading keys from the sidecar key index
+    parser.add_argument('--index', action='store_true',
+                        help='List keys from the <bib>.key-index sidecar (built if needed) instead of scanning')
+
+    # Add arguments for the cross-file census
+    parser.add_argument('--census', action='store_true',
+                        help='Report keys duplicated within a file and colliding across files, '
+                             'and whether the entries involved are identical or conflicting')
+    parser.add_argument('--json', action='store_true', help='Print the census as JSON')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of files scanned at once (default: one per CPU)')
+
+    # Add arguments for run statistics and profiling
+    add_stats_arguments(parser)
+
     # Parse arguments
     args = parser.parse_args()
-    
-    # Extract and print all citation keys
-    citekeys = extract_citekeys(args.bib_filename)
-    for citekey in citekeys:
-        print(citekey)
+    start_stats(args)
+
+    if args.census or args.json:
+        census = citekey_census(args.bib_filenames, args.jobs)
+        if args.json:
+            print(json.dumps(census, indent=2))
+        else:
+            print_census(census)
+    else:
+        # Extract and print all citation keys
+        for bib_filename in args.bib_filenames:
+            if args.index:
+                citekeys = indexed_citekeys(bib_filename)
+            else:
+                citekeys = extract_citekeys(bib_filename)
+            for citekey in citekeys:
+                print(citekey)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+r'''
+Finding and rewriting citation keys in LaTeX sources.
+
+Covers the natbib and biblatex families (\cite, \citet, \citep, \parencite,
+\autocite, \textcite, \footcite, \citeauthor, \nocite, starred forms, ...),
+up to two optional arguments, comma-separated key lists and the biblatex
+multicite commands (\cites{a}{b}, \parencites[see][]{a}[12]{b}).
+
+The same scanner reads .aux files: BibTeX's \citation{...}, biblatex's
+\abx@aux@cite{...}, and the \@input{chapter.aux} lines \include leaves behind,
+which are followed. Commented-out text is ignored. scan_files reads many
+files, in parallel when asked to or when there is a lot to read, and reports
+every key with the file and line it is cited on; \nocite{*} shows up as the
+key '*'.
+'''
+import os
+import re
+
+from runstats import get_stats
+
+# \<anything>cite<anything> (any case: \Cite, \Textcite, \Citet) or \nocite, optional star,
+# up to two (..) and two [..], then {keys}
+CITE_PATTERN = re.compile(r'\\(?P<command>[a-zA-Z]*(?i:cite)[a-zA-Z]*|nocite)\*?'
+                          r'(?:\s*\([^)]*\)){0,2}(?:\s*\[[^\]]*\]){0,2}\s*\{(?P<keys>[^}]*)\}')
+# One more {keys} argument of a multicite command
+MULTICITE_ARGUMENT_PATTERN = re.compile(r'(?:\s*\([^)]*\)){0,2}(?:\s*\[[^\]]*\]){0,2}\s*\{([^}]*)\}')
+KEY_PATTERN = re.compile(r'[^,\s]+')
+
+# Commands that contain "cite" but do not take citation keys
+NON_CITE_COMMANDS = {'citestyle'}
+
+# Citation records written to .aux files, and the \@input of included chapters' .aux files
+AUX_PATTERN = re.compile(r'\\(?:citation|abx@aux@cite(?:\{[^}]*\})?)\{(?P<keys>[^}]*)\}'
+                         r'|\\@input\{(?P<input>[^}]*)\}')
+COMMENT_PATTERN = re.compile(r'(?<!\\)%.*')
+WILDCARD = '*'
+# Without an explicit jobs count, files are only scanned in worker processes past this many bytes
+PARALLEL_THRESHOLD = 4 << 20
+
+
+def iter_key_lists(text):
+    """Yield (start, end) of every citation key list in text, in order."""
+    pos = 0
+    while True:
+        match = CITE_PATTERN.search(text, pos)
+        if match is None:
+            return
+        pos = match.end()
+        command = match.group('command').lower()
+        if command in NON_CITE_COMMANDS:
+            continue
+        yield match.span('keys')
+        if command.endswith('cites'):
+            while True:
+                more = MULTICITE_ARGUMENT_PATTERN.match(text, pos)
+                if more is None:
+                    break
+                yield more.span(1)
+                pos = more.end()
+
+
+def final_key(key, replacements):
+    """Follow chained replacements (a -> b, b -> c) from key to the key it ends up as."""
+    seen = {key}
+    while key in replacements:
+        key = replacements[key]
+        if key in seen:  # a cycle; stop where it closes
+            break
+        seen.add(key)
+    return key
+
+
+def rewrite_citekeys(text, replacements):
+    """Return text with every cited key found in replacements swapped for its final new key."""
+    pieces = []
+    last = 0
+    for start, end in iter_key_lists(text):
+        key_list = text[start:end]
+        new_list = KEY_PATTERN.sub(lambda m: final_key(m.group(), replacements), key_list)
+        if new_list != key_list:
+            pieces.append(text[last:start])
+            pieces.append(new_list)
+            last = end
+    if not pieces:
+        return text
+    pieces.append(text[last:])
+    return ''.join(pieces)
+
+
+def strip_comments(text):
+    """Blank out LaTeX comments, keeping every line where it was."""
+    return COMMENT_PATTERN.sub('', text)
+
+
+def _line_numbers(text, positions):
+    """Turn ascending character offsets into 1-based line numbers."""
+    line = 1
+    last = 0
+    for position in positions:
+        line += text.count('\n', last, position)
+        last = position
+        yield line
+
+
+def scan_citations(text, aux=False):
+    """Return ([(key, line)], [input files]) for the citations in a .tex or (with aux) .aux source."""
+    text = strip_comments(text)
+    spans = []
+    inputs = []
+    if aux:
+        for match in AUX_PATTERN.finditer(text):
+            if match.group('input') is not None:
+                inputs.append(match.group('input').strip())
+            else:
+                spans.append(match.span('keys'))
+    else:
+        spans = list(iter_key_lists(text))
+    citations = []
+    for (start, end), line in zip(spans, _line_numbers(text, [start for start, _ in spans])):
+        citations.extend((key, line) for key in KEY_PATTERN.findall(text, start, end))
+    return citations, inputs
+
+
+def scan_file(filename):
+    """Return ([(key, filename, line)], [input files]) for one .tex or .aux file."""
+    with open(filename, 'r', encoding='utf-8', errors='replace') as source:
+        citations, inputs = scan_citations(source.read(), aux=filename.endswith('.aux'))
+    base = os.path.dirname(filename)
+    return [(key, filename, line) for key, line in citations], [os.path.join(base, name) for name in inputs]
+
+
+def scan_files(filenames, jobs=None):
+    """Scan .tex and .aux files; return (key, filename, line) for every citation.
+
+    .aux files named by \\@input in an .aux file are scanned as well, if they
+    exist. Files are scanned in jobs processes when jobs > 1, or with jobs None
+    when they add up to more than PARALLEL_THRESHOLD bytes; otherwise, as for
+    the few small files of a typical paper, in this process.
+    """
+    with get_stats().phase('parse'):
+        return _scan_files(filenames, jobs)
+
+
+def _in_parallel(filenames, jobs):
+    if len(filenames) < 2 or (jobs is not None and jobs <= 1):
+        return False
+    if jobs is not None:
+        return True
+    size = 0
+    for filename in filenames:
+        try:
+            size += os.path.getsize(filename)
+        except OSError:
+            pass
+    return size > PARALLEL_THRESHOLD
+
+
+def _scan_files(filenames, jobs):
+    citations = []
+    seen = set(filenames)
+    pending = list(filenames)
+    while pending:
+        if not _in_parallel(pending, jobs):
+            results = [scan_file(filename) for filename in pending]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(scan_file, pending))
+        get_stats().count('latex files scanned', len(pending))
+        pending = []
+        for file_citations, inputs in results:
+            citations.extend(file_citations)
+            for name in inputs:
+                if name not in seen and os.path.exists(name):
+                    seen.add(name)
+                    pending.append(name)
+    return citations
+
+
+def cited_keys(filenames, jobs=None):
+    """Return the distinct keys cited in the files, in order of first citation."""
+    return list(dict.fromkeys(key for key, _, _ in scan_files(filenames, jobs)))
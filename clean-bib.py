@@ -5,55 +5,280 @@ It creates a fresh bibfile that has only the entries present in the tex file.
 It reads all the citekeys from aux_filename, then reads a bib_filename, that
 has more entries than the latex file. Then this script creates an output_bib_file, which
 has only those citekeys that are present in the paper.
+
+With --watch it keeps running: the master library stays indexed in memory and
+the aux and bib files are polled, so the output is brought up to date within
+milliseconds of every LaTeX compile that changes the set of cited keys. The
+master library is only re-read when it changes itself.
+
+By default the library is scanned, with --jobs N in N processes that each
+take one stretch of the file. With --index the byte span of every entry is
+kept in a sidecar file next to the library, <bib>.key-index (see
+bibkeyindex.py), so once it is built, trimming a paper's bibliography only
+touches the entries it cites.
+
+Batch mode cleans many papers against one master library in a single run:
+give several --aux files with --output-dir, or a --manifest listing one
+"paper.aux output.bib" pair per line. The master is indexed once, and the aux
+files are read and the outputs written by a pool of threads. The one --jobs
+value sets both: N processes scan the master library and N threads handle
+the papers.
 '''
 import argparse
+import os
 import re
-import bibtexparser
+import sqlite3
+import sys
+import time
+from bibkeyindex import BibKeyIndex
+from bibreader import iter_bib_entries, iter_raw_blocks, iter_shards, write_bib_entries, write_pieces
+from citescan import WILDCARD, cited_keys
+from runstats import add_stats_arguments, get_stats, start_stats
+
+# Seconds between polls of the aux and bib files in --watch mode
+DEFAULT_INTERVAL = 0.25
 
 def extract_citation_keys(filename):
-    citation_keys = set()
-    with open(filename, 'r') as file:
-        for line in file:
-            if line.startswith('\\citation'):
-                # Extract keys from the \citation line
-                keys = line.strip().split('{')[1].rstrip('}').split(',')
-                citation_keys.update(keys)
+    # \citation and biblatex's \abx@aux@cite lines, including those in the .aux
+    # files of \include'd chapters; a .tex file can be given as well
+    citation_keys = set(cited_keys([filename]))
     sorted_keys = sorted(citation_keys)
     return sorted_keys
 
+def missing_keys(citation_keys, entry_spans):
+    return [key for key in citation_keys if key != WILDCARD and key not in entry_spans]
+
+def scan_shard(bib_filename, start, limit, wanted):
+    # The macro spans and wanted entry spans among the blocks starting in [start, limit)
+    macro_spans = []
+    entry_spans = []
+    for block_type, body, block_start, end in iter_raw_blocks(bib_filename, start):
+        if limit is not None and block_start >= limit:
+            return (macro_spans, entry_spans), block_start
+        if block_type in ('string', 'preamble'):
+            macro_spans.append((block_start, end))
+        elif block_type != 'comment':
+            key = body.split(b',', 1)[0].strip().decode('utf-8')
+            if wanted is None or key in wanted:
+                entry_spans.append((key, (block_start, end)))
+    return (macro_spans, entry_spans), None
+
 def read_bib_file(bib_filename):
-    with open(bib_filename, 'r') as bib_file:
-        bib_database = bibtexparser.load(bib_file)
-    return {entry['ID']: entry for entry in bib_database.entries}
+    # Every entry of the library as a dict, by key
+    return {entry['ID']: entry for entry in iter_bib_entries(bib_filename)}
 
 def write_new_bib_file(citation_keys, bib_entries, output_filename):
+    # Write the cited entries of a read_bib_file dict, re-formatted
+    if WILDCARD in citation_keys:
+        citation_keys = list(bib_entries)
     selected_entries = [bib_entries[key] for key in citation_keys if key in bib_entries]
-    new_bib_database = bibtexparser.bibdatabase.BibDatabase()
-    new_bib_database.entries = selected_entries
+    write_bib_entries(selected_entries, output_filename)
+
+def read_bib_spans(bib_filename, citation_keys=None, use_index=False, jobs=None):
+    # Like read_bib_file, but only remember where the cited entries are:
+    # returns (macro spans, {key: entry span}) for write_bib_spans. The
+    # @string and @preamble blocks are kept too, since cited entries may use
+    # them. With the sidecar key index only the cited keys are looked up;
+    # without it the library is scanned, in jobs processes if given.
+    # \nocite{*} (the key '*') selects everything.
+    if citation_keys is not None and WILDCARD in citation_keys:
+        citation_keys = None
+    if use_index:
+        try:
+            with BibKeyIndex(bib_filename) as index:
+                if citation_keys is None:
+                    return index.macro_spans(), index.all_spans()
+                return index.macro_spans(), index.spans(citation_keys)
+        except (OSError, sqlite3.Error) as error:
+            print(f"Key index unavailable ({error}), scanning {bib_filename}")
+    wanted = set(citation_keys) if citation_keys is not None else None
+    macro_spans = []
+    entry_spans = {}
+    for shard_macros, shard_entries in iter_shards(bib_filename, scan_shard, jobs, wanted):
+        macro_spans.extend(shard_macros)
+        entry_spans.update(shard_entries)
+    return macro_spans, entry_spans
+
+def write_bib_spans(citation_keys, bib_spans, output_filename, bib_filename):
+    # Copy the blocks read_bib_spans selected byte for byte from the original file
+    macro_spans, entry_spans = bib_spans
+    if WILDCARD in citation_keys:
+        citation_keys = list(entry_spans)
+    spans = macro_spans + [entry_spans[key] for key in citation_keys if key in entry_spans]
+    get_stats().count('entries written', len(spans) - len(macro_spans))
+    pieces = []
+    for span in spans:
+        pieces.append(span)
+        pieces.append("\n\n")
+    if pieces:
+        pieces[-1] = "\n"
+    write_pieces(bib_filename, pieces, output_filename)
+
+def _stat_key(filename):
+    try:
+        info = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+def watch(aux_filename, bib_filename, output_filename, interval=DEFAULT_INTERVAL, use_index=False):
+    # Poll until interrupted. A file is only acted on once its size and mtime
+    # are the same on two polls in a row, so a half-written aux is never read.
+    # Nothing is written while the bib differs from the version its spans were
+    # read from; the write happens once the new version has settled and been read.
+    bib_spans = None
+    spans_stamp = None
+    citation_keys = []
+    seen = {aux_filename: None, bib_filename: None}
+    settled = dict(seen)
+    print(f"Watching {aux_filename} and {bib_filename} (Ctrl-C to stop)")
+    try:
+        while True:
+            changed = set()
+            for filename in seen:
+                stamp = _stat_key(filename)
+                if stamp is not None and stamp == seen[filename] and stamp != settled[filename]:
+                    settled[filename] = stamp
+                    changed.add(filename)
+                seen[filename] = stamp
+
+            if changed:
+                started = time.perf_counter()
+                if bib_filename in changed:
+                    spans_stamp = settled[bib_filename]
+                    bib_spans = read_bib_spans(bib_filename, use_index=use_index)
+                    print(f"Indexed {len(bib_spans[1])} entries from {bib_filename}")
+                added = removed = ()
+                if aux_filename in changed:
+                    new_keys = extract_citation_keys(aux_filename)
+                    added = set(new_keys) - set(citation_keys)
+                    removed = set(citation_keys) - set(new_keys)
+                    citation_keys = new_keys
+                if (bib_spans is not None and settled[aux_filename] is not None
+                        and (added or removed or bib_filename in changed)
+                        and _stat_key(bib_filename) == spans_stamp):
+                    write_bib_spans(citation_keys, bib_spans, output_filename, bib_filename)
+                    missing = missing_keys(citation_keys, bib_spans[1])
+                    elapsed = (time.perf_counter() - started) * 1000
+                    print(f"+{len(added)} -{len(removed)} keys, {len(citation_keys) - len(missing)} entries "
+                          f"written to {output_filename} in {elapsed:.1f} ms")
+                    if missing:
+                        print("Not in the library:", ", ".join(missing))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
 
-    with open(output_filename, 'w') as output_file:
-        bibtexparser.dump(new_bib_database, output_file)
+def read_manifest(manifest_filename):
+    # One "paper.aux output.bib" pair per line; blank lines and # comments are skipped
+    jobs = []
+    base = os.path.dirname(manifest_filename)
+    with open(manifest_filename, 'r') as manifest:
+        for line in manifest:
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) != 2:
+                raise ValueError(f"Expected 'aux output' in {manifest_filename}, got: {line.strip()}")
+            jobs.append(tuple(os.path.join(base, field) for field in fields))
+    return jobs
+
+def batch_outputs(aux_filenames, output_dir):
+    # Name each output after its aux file; two papers with the same aux name need a manifest
+    jobs = []
+    seen = {}
+    for aux_filename in aux_filenames:
+        name = os.path.splitext(os.path.basename(aux_filename))[0] + '.bib'
+        if name in seen:
+            raise ValueError(f"{aux_filename} and {seen[name]} would both be written to {name}; use --manifest")
+        seen[name] = aux_filename
+        jobs.append((aux_filename, os.path.join(output_dir, name)))
+    return jobs
+
+def clean_batch(jobs, bib_filename, workers=None, use_index=False):
+    # Index the master library once, then extract and write every paper in parallel
+    bib_spans = read_bib_spans(bib_filename, use_index=use_index, jobs=workers)
+    print(f"Indexed {len(bib_spans[1])} entries from {bib_filename}")
+
+    def clean_one(job):
+        aux_filename, output_filename = job
+        citation_keys = extract_citation_keys(aux_filename)
+        os.makedirs(os.path.dirname(os.path.abspath(output_filename)), exist_ok=True)
+        write_bib_spans(citation_keys, bib_spans, output_filename, bib_filename)
+        missing = missing_keys(citation_keys, bib_spans[1])
+        return aux_filename, output_filename, len(citation_keys), missing
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(clean_one, jobs))
+
+    print("Summary:")
+    for aux_filename, output_filename, cited, missing in results:
+        print(f"- {aux_filename}: {cited - len(missing)} of {cited} cited entries written to {output_filename}")
+        if missing:
+            print(f"  Missing from {bib_filename}: {', '.join(missing)}")
+    return results
 
 if __name__ == "__main__":
     # Create argument parser
     parser = argparse.ArgumentParser(description='Create a new BibTeX file with entries from the LaTeX file')
     
     # Add arguments
-    parser.add_argument('--aux', dest='aux_filename', help='Auxiliary file name (e.g., main.aux)', required=True)
+    parser.add_argument('--aux', dest='aux_filenames', nargs='+', default=[],
+                        help='Auxiliary file name (e.g., main.aux); several for batch mode')
     parser.add_argument('--bib', dest='bib_filename', help='BibTeX file name (e.g., refs.bib)', required=True)
-    parser.add_argument('--output', dest='output_bib_filename', help='Output BibTeX file name (e.g., refs1.bib)', required=True)
+    parser.add_argument('--output', dest='output_bib_filename', help='Output BibTeX file name (e.g., refs1.bib)')
+    parser.add_argument('--output-dir', help='Batch mode: folder for the outputs, each named after its aux file')
+    parser.add_argument('--manifest', help='Batch mode: file with one "paper.aux output.bib" pair per line')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Number of processes scanning the library (unless --index is given); '
+                             'in batch mode also the number of threads cleaning papers at once')
+    
+    parser.add_argument('--index', action='store_true',
+                        help='Look entries up in a <bib>.key-index sidecar (built or refreshed as needed) '
+                             'instead of scanning the library')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and update the output whenever the aux or bib file changes')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help=f'Seconds between checks for changes in --watch mode (default: {DEFAULT_INTERVAL})')
+    
+    # Add arguments for run statistics and profiling
+    add_stats_arguments(parser)
     
     # Parse arguments
     args = parser.parse_args()
+    start_stats(args)
+
+    if args.manifest or len(args.aux_filenames) > 1:
+        if args.watch or args.output_bib_filename:
+            parser.error('batch mode takes --output-dir or --manifest instead of --output, and cannot --watch')
+        try:
+            jobs = read_manifest(args.manifest) if args.manifest else []
+            if args.aux_filenames:
+                if not args.output_dir:
+                    parser.error('--output-dir is required with several --aux files')
+                jobs += batch_outputs(args.aux_filenames, args.output_dir)
+        except ValueError as error:
+            parser.error(str(error))
+        clean_batch(jobs, args.bib_filename, args.jobs, use_index=args.index)
+        sys.exit(0)
+
+    if len(args.aux_filenames) != 1 or not args.output_bib_filename:
+        parser.error('--aux and --output are required')
+    args.aux_filename = args.aux_filenames[0]
+
+    if args.watch:
+        watch(args.aux_filename, args.bib_filename, args.output_bib_filename, args.interval,
+              use_index=args.index)
+        sys.exit(0)
     
     # Extract citation keys from the LaTeX file
     citation_keys = extract_citation_keys(args.aux_filename)
     print("Citation Keys in", args.aux_filename, ":", citation_keys, len(citation_keys))
 
     # Read entries from the original BibTeX file
-    bib_entries = read_bib_file(args.bib_filename)
-    print("Total Entries in inputfile (", args.bib_filename, "):", len(bib_entries))
+    bib_spans = read_bib_spans(args.bib_filename, citation_keys, use_index=args.index, jobs=args.jobs)
+    print("Cited Entries found in inputfile (", args.bib_filename, "):", len(bib_spans[1]))
 
     # Write the required entries to a new BibTeX file
-    write_new_bib_file(citation_keys, bib_entries, args.output_bib_filename)
+    write_bib_spans(citation_keys, bib_spans, args.output_bib_filename, args.bib_filename)
     print(f"New BibTeX file created: {args.output_bib_filename}")
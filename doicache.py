@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+'''
+Persistent on-disk cache of DOI metadata, shared between runs and papers.
+
+Metadata is stored as the raw JSON returned by the resolver in a small SQLite
+database keyed by normalized DOI. Negative results (unknown DOI, empty or
+non-JSON response) are cached too, with their own shorter lifetime, so that a
+dead DOI is not asked about again on every run. Entries expire after a TTL and
+the least recently used ones are evicted once the cache grows past a size
+limit.
+'''
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_TTL = 90 * 24 * 3600           # seconds a positive result stays valid
+DEFAULT_NEGATIVE_TTL = 7 * 24 * 3600   # seconds a negative result stays valid
+DEFAULT_MAX_ENTRIES = 200000
+
+# SQLite limits the number of bound parameters per statement
+_BATCH = 500
+
+_DOI_PREFIXES = ('https://doi.org/', 'http://doi.org/', 'https://dx.doi.org/',
+                 'http://dx.doi.org/', 'doi:')
+
+
+def normalize_doi(doi):
+    """Lower-case a DOI and strip any resolver URL or 'doi:' prefix."""
+    doi = doi.strip()
+    lowered = doi.lower()
+    for prefix in _DOI_PREFIXES:
+        if lowered.startswith(prefix):
+            lowered = lowered[len(prefix):]
+            break
+    return lowered
+
+
+def cache_dir():
+    """Return the directory bibtools keeps its caches in, honouring $XDG_CACHE_HOME."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'bibtools')
+
+
+def default_cache_path():
+    """Return the default DOI metadata cache location."""
+    return os.path.join(cache_dir(), 'doi-metadata.sqlite')
+
+
+class DOICache:
+    """SQLite-backed DOI -> metadata cache with TTL expiry and LRU eviction."""
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path or default_cache_path()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS metadata (
+                                doi TEXT PRIMARY KEY,
+                                data TEXT,
+                                fetched REAL NOT NULL,
+                                accessed REAL NOT NULL)''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS metadata_accessed ON metadata (accessed)')
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.evict()
+        self._db.close()
+
+    def _is_fresh(self, data, fetched, now):
+        ttl = self.ttl if data is not None else self.negative_ttl
+        return now - fetched <= ttl
+
+    def get_many(self, dois):
+        """Return {doi: metadata or None} for every DOI with a fresh cache entry."""
+        keys = {normalize_doi(doi): doi for doi in dois}
+        found = {}
+        now = time.time()
+        key_list = list(keys)
+        for start in range(0, len(key_list), _BATCH):
+            batch = key_list[start:start + _BATCH]
+            rows = self._db.execute(
+                f"SELECT doi, data, fetched FROM metadata WHERE doi IN ({','.join('?' * len(batch))})",
+                batch)
+            for key, data, fetched in rows:
+                if self._is_fresh(data, fetched, now):
+                    found[keys[key]] = json.loads(data) if data is not None else None
+        if found:
+            self._db.executemany('UPDATE metadata SET accessed = ? WHERE doi = ?',
+                                 [(now, normalize_doi(doi)) for doi in found])
+            self._db.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, doi):
+        """Return (hit, metadata) for a single DOI."""
+        found = self.get_many([doi])
+        return (doi in found), found.get(doi)
+
+    def put_many(self, items):
+        """Store (doi, metadata) pairs; a metadata of None records a negative result."""
+        now = time.time()
+        self._db.executemany(
+            'INSERT OR REPLACE INTO metadata (doi, data, fetched, accessed) VALUES (?, ?, ?, ?)',
+            [(normalize_doi(doi), json.dumps(data) if data is not None else None, now, now)
+             for doi, data in items])
+        self._db.commit()
+
+    def put(self, doi, metadata):
+        self.put_many([(doi, metadata)])
+
+    def evict(self):
+        """Drop expired entries, then the least recently used beyond max_entries."""
+        now = time.time()
+        self._db.execute('DELETE FROM metadata WHERE (data IS NOT NULL AND fetched < ?) '
+                         'OR (data IS NULL AND fetched < ?)',
+                         (now - self.ttl, now - self.negative_ttl))
+        if self.max_entries is not None:
+            (count,) = self._db.execute('SELECT COUNT(*) FROM metadata').fetchone()
+            if count > self.max_entries:
+                self._db.execute('DELETE FROM metadata WHERE doi IN '
+                                 '(SELECT doi FROM metadata ORDER BY accessed LIMIT ?)',
+                                 (count - self.max_entries,))
+        self._db.commit()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+'''
+Local DOI -> pages index built from a Crossref-style JSONL metadata dump.
+
+Each line of the dump is one work record as returned by the Crossref API (or
+an API page with an "items" list). Only the fields pages-field.py needs,
+"article-number" and "page", are kept, in an SQLite table keyed by normalized
+DOI. The dump is streamed line by line and inserted in fixed-size batches, so
+building the index takes bounded memory however large the dump is. Gzipped
+dumps are read directly.
+'''
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from doicache import cache_dir, normalize_doi
+
+BATCH_SIZE = 10000
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH = 500
+
+
+def default_index_path():
+    """Return the default index location, next to the DOI metadata cache."""
+    return os.path.join(cache_dir(), 'doi-index.sqlite')
+
+
+def _open_dump(dump_filename):
+    if dump_filename.endswith('.gz'):
+        return gzip.open(dump_filename, 'rt', encoding='utf-8')
+    return open(dump_filename, 'r', encoding='utf-8')
+
+
+def _first(value):
+    """Crossref sometimes wraps single values in a list."""
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def iter_dump_records(dump_filename):
+    """Yield (doi, article_number, page) for every work in a JSONL dump that has either field."""
+    with _open_dump(dump_filename) as dump:
+        for line in dump:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            works = record.get('items') or record.get('message', {}).get('items') or [record]
+            for work in works:
+                doi = work.get('DOI')
+                article_number = _first(work.get('article-number'))
+                page = _first(work.get('page'))
+                if doi and (article_number or page):
+                    yield normalize_doi(doi), article_number, page
+
+
+def build_index(dump_filenames, index_filename):
+    """Ingest one or more JSONL dumps into the index; return how many works were stored."""
+    directory = os.path.dirname(os.path.abspath(index_filename))
+    os.makedirs(directory, exist_ok=True)
+    # Build into a copy next to the index and swap it in at the end, so that a
+    # crash or an interrupt while ingesting never leaves a corrupt index behind
+    # (which is what makes it safe to turn journaling and syncing off)
+    fd, temp_filename = tempfile.mkstemp(prefix='.doi-index-', suffix='.tmp', dir=directory)
+    os.close(fd)
+    try:
+        if os.path.exists(index_filename):
+            shutil.copy2(index_filename, temp_filename)
+        count = _ingest(dump_filenames, temp_filename)
+        os.replace(temp_filename, index_filename)
+    except BaseException:
+        os.unlink(temp_filename)
+        raise
+    return count
+
+
+def _ingest(dump_filenames, index_filename):
+    db = sqlite3.connect(index_filename)
+    db.execute('PRAGMA journal_mode=OFF')
+    db.execute('PRAGMA synchronous=OFF')
+    db.execute('''CREATE TABLE IF NOT EXISTS pages (
+                      doi TEXT PRIMARY KEY,
+                      article_number TEXT,
+                      page TEXT) WITHOUT ROWID''')
+    count = 0
+    batch = []
+    for dump_filename in dump_filenames:
+        for record in iter_dump_records(dump_filename):
+            batch.append(record)
+            if len(batch) >= BATCH_SIZE:
+                db.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?)', batch)
+                count += len(batch)
+                batch.clear()
+    db.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?)', batch)
+    count += len(batch)
+    db.commit()
+    db.close()
+    with open(index_filename, 'rb+') as index_file:
+        os.fsync(index_file.fileno())
+    return count
+
+
+class DOIIndex:
+    """Read-only view of an index built by build_index."""
+
+    def __init__(self, index_filename):
+        self.path = index_filename
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(f'file:{index_filename}?mode=ro', uri=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def get_many(self, dois):
+        """Return {doi: metadata} for the DOIs in the index, shaped like resolver metadata."""
+        keys = {normalize_doi(doi): doi for doi in dois}
+        found = {}
+        key_list = list(keys)
+        for start in range(0, len(key_list), _QUERY_BATCH):
+            batch = key_list[start:start + _QUERY_BATCH]
+            rows = self._db.execute(
+                f"SELECT doi, article_number, page FROM pages WHERE doi IN ({','.join('?' * len(batch))})",
+                batch)
+            for key, article_number, page in rows:
+                metadata = {}
+                if article_number:
+                    metadata['article-number'] = article_number
+                if page:
+                    metadata['page'] = page
+                found[keys[key]] = metadata
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
@@ -1,7 +1,6 @@
 import argparse
-import bibtexparser
-from bibtexparser.bwriter import BibTexWriter
-from bibtexparser.bibdatabase import BibDatabase
+from bibreader import iter_entry_edits, write_passthrough
+from runstats import add_stats_arguments, start_stats
 
 def add_braces_to_title(title):
     # Split the title into words and add braces around each word
@@ -9,24 +8,23 @@ def add_braces_to_title(title):
     # Join the words back into a single string
     return " ".join(braced_words)
 
-def process_bib_file(input_file, output_file):
-    with open(input_file, 'r') as file:
-        bib_database = bibtexparser.load(file)
-
-    for entry in bib_database.entries:
-        if 'title' in entry:
-            entry['title'] = add_braces_to_title(entry['title'])
+def fix_entry(entry):
+    if 'title' in entry:
+        entry['title'] = add_braces_to_title(entry['title'])
+    return entry
 
-    writer = BibTexWriter()
-    with open(output_file, 'w') as file:
-        bibtexparser.dump(bib_database, file, writer)
+def process_bib_file(input_file, output_file):
+    # Only the entries with a title are re-written, the rest is copied as is
+    write_passthrough(input_file, iter_entry_edits(input_file, fix_entry), output_file)
 
 def main():
     parser = argparse.ArgumentParser(description='Add braces around each word in the title fields of a .bib file to preserve the exact cases.')
     parser.add_argument('--bib', required=True, help='Path to the input .bib file')
     parser.add_argument('--output', required=True, help='Path to the output .bib file')
 
+    add_stats_arguments(parser)
     args = parser.parse_args()
+    start_stats(args)
 
     process_bib_file(args.bib, args.output)
 
@@ -2,12 +2,16 @@
 
 '''
 This script replaces long journal names present in the bibliography with their short forms.
+
+Besides the built-in journal_dict, full abbreviation lists (--abbreviations)
+and the ISO 4 word list (--ltwa) can be given; see journalabbrev.py for the
+formats. Titles that are in no list are then abbreviated word by word.
 '''
 
 import argparse
-import bibtexparser
-from bibtexparser.bparser import BibTexParser
-from bibtexparser.bwriter import BibTexWriter
+from bibreader import iter_entry_edits, write_passthrough
+from journalabbrev import load_abbreviator
+from runstats import add_stats_arguments, start_stats
 
 # Dictionary mapping long journal names to their short forms
 journal_dict = {
@@ -38,34 +42,32 @@ journal_dict = {
     "Journal of Optics": "J Opt"
 }
 
-def capitalize_title_properly(text):
-    small_words = {'of', 'the', 'and', 'in', 'on', 'at', 'by', 'for', 'to', 'with', 'a', 'an'}
-    words = text.split()
-    capitalized_words = [
-        word if (word in small_words and i != 0) else word.capitalize()
-        for i, word in enumerate(words)
-    ]
-    return ' '.join(capitalized_words)
+_abbreviator = None
 
-def process_bib_file(input_file, output_file):
-    # Read the BibTeX file
-    with open(input_file, 'r') as bibtex_file:
-        parser = BibTexParser()
-        parser.ignore_nonstandard_types = False
-        bib_database = bibtexparser.load(bibtex_file, parser=parser)
+def get_abbreviator():
+    # Only the built-in journal_dict unless set_abbreviation_sources was called
+    global _abbreviator
+    if _abbreviator is None:
+        _abbreviator = load_abbreviator(journal_dict)
+    return _abbreviator
 
-    # Iterate over each entry
-    for entry in bib_database.entries:
-        if 'journal' in entry:
-            # Replace journal names with short names if they exist in the dictionary
-            long_journal_name = capitalize_title_properly(entry['journal'])
-            if long_journal_name in journal_dict:
-                entry['journal'] = journal_dict[long_journal_name]
+def set_abbreviation_sources(title_files=(), ltwa_files=()):
+    global _abbreviator
+    _abbreviator = load_abbreviator(journal_dict, title_files, ltwa_files)
 
-    # Write the updated BibTeX entries to a new file
-    writer = BibTexWriter()
-    with open(output_file, 'w') as bibtex_file:
-        bibtex_file.write(writer.write(bib_database))
+def substitute_journal(entry):
+    if 'journal' in entry:
+        # Replace journal names with short names if the abbreviator knows them
+        entry['journal'] = get_abbreviator().abbreviate(entry['journal'])
+    return entry
+
+def process_bib_file(input_file, output_file):
+    # Stream the BibTeX file, substituting journal names entry by entry
+    edits = iter_entry_edits(input_file, substitute_journal)
+
+    # Copy the file, re-writing only the entries whose journal was substituted
+    count = write_passthrough(input_file, edits, output_file)
+    print(f"Journal names substituted in {count} entries")
 
 if __name__ == "__main__":
     # Create argument parser
@@ -77,8 +79,19 @@ if __name__ == "__main__":
     # Add argument for the output BibTeX file name
     parser.add_argument('--output', dest='output_file', help='Output BibTeX file name', required=True)
     
+    # Add arguments for external abbreviation tables
+    parser.add_argument('--abbreviations', nargs='+', default=[], metavar='FILE',
+                        help='Journal abbreviation list(s), "Full Title;Abbrev." per line')
+    parser.add_argument('--ltwa', nargs='+', default=[], metavar='FILE',
+                        help='ISO 4 List of Title Word Abbreviations, for titles in no list')
+    
+    # Add arguments for run statistics and profiling
+    add_stats_arguments(parser)
+    
     # Parse arguments
     args = parser.parse_args()
+    start_stats(args)
+    set_abbreviation_sources(args.abbreviations, args.ltwa)
     
     # Process the BibTeX file
     process_bib_file(args.input_file, args.output_file)
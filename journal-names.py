@@ -6,20 +6,145 @@ This is useful to check if all the journal names are in the same type-setting fo
 
 For example, there can be multiple entries with "Physical Review Letter" and "Phys. Rev. Lett."
 Then you can substitute in vim with %s:Physical Review Letter:Phys. Rev. Lett.:g
+
+With --cluster the variants are found for you: journal names that are
+spellings or abbreviations of one another are grouped, each group is printed
+with its entry counts and a suggested canonical form (the most used
+abbreviated spelling, if there is one). Candidate pairs come from an inverted
+index over the first three letters of each significant word, so only names that
+share their rarest word starts are ever compared.
+
+With --jobs N a large file is parsed in N processes (see bibreader.py).
 '''
 import argparse
-import bibtexparser
+import re
+import sys
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from bibreader import iter_bib_entries
+from runstats import add_stats_arguments, get_stats, start_stats
+
+# Words ISO 4 drops from titles; they never decide whether two names match
+STOPWORDS = {'a', 'an', 'the', 'and', 'of', 'for', 'in', 'on', 'at', 'by', 'to', 'with', 'from',
+             'de', 'des', 'du', 'la', 'le', 'les', 'et', 'der', 'die', 'das', 'und', 'fur'}
+# How many of a name's rarest grams are indexed; two names that may match share one of them
+PREFIX_GRAMS = 3
+TYPO_RATIO = 0.85
 
-def extract_journal_names(bib_filename):
-    with open(bib_filename, 'r') as bib_file:
-        bib_database = bibtexparser.load(bib_file)
+_WORD_RE = re.compile(r'(?:[^\W\d_]\.){2,}|[^\W\d_]+\.?|\d+')
 
-    journals = set()
-    for entry in bib_database.entries:
+def extract_journal_names(bib_filename, jobs=None):
+    return sorted(count_journal_names(bib_filename, jobs))
+
+def count_journal_names(bib_filename, jobs=None):
+    journals = Counter()
+    for entry in iter_bib_entries(bib_filename, jobs=jobs):
         if 'journal' in entry:
-            journals.add(entry['journal'])
+            journals[entry['journal']] += 1
+
+    return journals
+
+def journal_tokens(journal):
+    """Split a journal name into (word, abbreviated) pairs, without stopwords or LaTeX braces."""
+    tokens = []
+    for word in _WORD_RE.findall(journal.replace('{', '').replace('}', '').lower()):
+        abbreviated = word.endswith('.')
+        word = word.replace('.', '')  # initials such as U.S.A. count as one word
+        if word not in STOPWORDS:
+            tokens.append((word, abbreviated))
+    return tokens
+
+def _is_subsequence(short, long):
+    remaining = iter(long)
+    return all(char in remaining for char in short)
+
+def tokens_match(first, second):
+    """True if two words can be the same word: equal, an abbreviation of it, or a typo."""
+    (word1, abbreviated1), (word2, abbreviated2) = first, second
+    if word1 == word2:
+        return True
+    if len(word1) > len(word2):
+        (word1, abbreviated1), (word2, abbreviated2) = second, first
+    if word1[0] != word2[0]:
+        return False
+    # "Phys." for "Physical", "Natl." for "National", "Letter" for "Letters"
+    if abbreviated1 and _is_subsequence(word1, word2):
+        return True
+    if len(word1) >= 4 and word2.startswith(word1):
+        return True
+    return len(word1) >= 5 and len(word2) - len(word1) <= 2 and SequenceMatcher(None, word1, word2).ratio() >= TYPO_RATIO
+
+def names_match(first, second):
+    """True if two tokenized journal names are variants of each other.
+
+    Words are compared in order. The names need the same number of words, or
+    one extra word when the shorter has at least three (e.g. a trailing
+    "U.S.A."), so "Physical Review" and "Physical Review B" stay apart.
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    extra = len(second) - len(first)
+    if not first or extra > 1 or (extra and len(first) < 3):
+        return False
+    pos = 0
+    skipped = 0
+    for token in first:
+        while not tokens_match(token, second[pos]):
+            skipped += 1
+            pos += 1
+            if skipped > extra:
+                return False
+        pos += 1
+    return True
+
+def cluster_journal_names(journal_counts):
+    """Group journal names that are variants of one another; return a list of name lists."""
+    names = list(journal_counts)
+    tokens = [journal_tokens(name) for name in names]
+    grams = [{word[:3] for word, _ in name_tokens} for name_tokens in tokens]
+    frequency = Counter(gram for name_grams in grams for gram in name_grams)
 
-    return sorted(journals)
+    parent = list(range(len(names)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    # Names written out in full, per group: a group may hold only full names that
+    # match each other, so "J. Phys." cannot chain "Journal of Physics" to
+    # "Journal of Physiology"
+    full_names = {index: [name_tokens] for index, name_tokens in enumerate(tokens)
+                  if not any(abbreviated for _, abbreviated in name_tokens)}
+
+    def can_merge(root, other_root):
+        return all(names_match(first, second)
+                   for first in full_names.get(root, ()) for second in full_names.get(other_root, ()))
+
+    postings = defaultdict(list)
+    for index, name_grams in enumerate(grams):
+        rarest = sorted(name_grams, key=lambda gram: (frequency[gram], gram))[:PREFIX_GRAMS]
+        candidates = set()
+        for gram in rarest:
+            candidates.update(postings[gram])
+            postings[gram].append(index)
+        for other in candidates:
+            root, other_root = find(index), find(other)
+            if (root != other_root and names_match(tokens[index], tokens[other])
+                    and can_merge(root, other_root)):
+                parent[other_root] = root
+                if other_root in full_names:
+                    full_names.setdefault(root, []).extend(full_names.pop(other_root))
+
+    groups = defaultdict(list)
+    for index, name in enumerate(names):
+        groups[find(index)].append(name)
+    return [group for group in groups.values() if len(group) > 1]
+
+def suggest_canonical(variants, journal_counts):
+    """The most used abbreviated spelling, else the most used spelling."""
+    return max(variants, key=lambda name: ('.' in name, journal_counts[name], -len(name)))
 
 if __name__ == "__main__":
     # Create argument parser
@@ -28,11 +153,36 @@ if __name__ == "__main__":
     # Add argument for the BibTeX file name
     parser.add_argument('--bib', dest='bib_filename', help='BibTeX file name', required=True)
     
+    # Add argument for grouping variant spellings
+    parser.add_argument('--cluster', action='store_true',
+                        help='Group variant spellings and abbreviations of the same journal')
+    
+    # Add argument for parsing in parallel
+    parser.add_argument('--jobs', type=int, default=None, help='Processes parsing the BibTeX file (default: 1)')
+    
+    # Add arguments for run statistics and profiling
+    add_stats_arguments(parser)
+    
     # Parse arguments
     args = parser.parse_args()
+    start_stats(args)
     
+    if args.cluster:
+        journal_counts = count_journal_names(args.bib_filename, args.jobs)
+        with get_stats().phase('transform'):
+            clusters = cluster_journal_names(journal_counts)
+        clusters.sort(key=lambda variants: -sum(journal_counts[name] for name in variants))
+        print(f"Journal Name Variants ({len(clusters)} groups among {len(journal_counts)} names):")
+        for variants in clusters:
+            canonical = suggest_canonical(variants, journal_counts)
+            total = sum(journal_counts[name] for name in variants)
+            print(f"{canonical} ({total} entries)")
+            for name in sorted(variants, key=lambda name: -journal_counts[name]):
+                print(f"- {name} ({journal_counts[name]})")
+        sys.exit(0)
+
     # Extract and sort journal names
-    journals = extract_journal_names(args.bib_filename)
+    journals = extract_journal_names(args.bib_filename, args.jobs)
     print("Journal Names:")
     for journal in journals:
         print("-", journal)
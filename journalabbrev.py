@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+'''
+Journal name abbreviation backed by external abbreviation tables.
+
+Two kinds of source are understood:
+
+- Abbreviation lists mapping full journal titles to their abbreviations, one
+  journal per line, as "Full Title;Abbrev.", "Full Title,Abbrev." (quoted CSV
+  is fine) or "Full Title = Abbrev." (the formats JabRef's lists come in).
+- The ISO 4 List of Title Word Abbreviations (LTWA), one word per line as
+  "word;abbreviation[;languages]". A trailing hyphen marks a stem ("phys-"
+  covers physics, physical, ...), "n.a." means the word is never
+  abbreviated, and entries of several words ("United States") are phrases.
+
+Titles found in a list are replaced whole. Other titles are abbreviated word
+by word from the LTWA, dropping articles, prepositions and conjunctions as
+ISO 4 prescribes. Everything is kept in flat dicts keyed by normalized text,
+so building the tables is done once and the result is pickled next to the
+other bibtools caches. The pickle is rebuilt whenever a source file's mtime or
+size changes; otherwise loading it takes milliseconds. Each distinct journal
+string is normalized and abbreviated only once per run.
+'''
+import csv
+import hashlib
+import os
+import pickle
+import re
+
+from doicache import cache_dir
+from runstats import get_stats
+
+# Bump when the pickled layout changes
+CACHE_VERSION = 1
+
+# Dropped from titles when abbreviating word by word (ISO 4, section 7)
+STOPWORDS = {
+    'a', 'an', 'the', 'and', 'of', 'for', 'in', 'on', 'at', 'by', 'to', 'with', 'from', '&',
+    'de', 'des', 'du', 'la', 'le', 'les', 'et', 'der', 'die', 'das', 'und', 'für', 'fur', 'y', 'e',
+}
+NOT_ABBREVIATED = 'n.a.'
+
+_BRACES_RE = re.compile(r'[{}\\]')
+_PUNCTUATION_RE = re.compile(r'[^\w\s:]')
+_SPACE_RE = re.compile(r'\s+')
+_WORD_PUNCTUATION = ':,;'
+
+
+def normalize_title(title):
+    """Return the lookup key for a journal title: lower case, no braces, punctuation or extra space."""
+    title = _BRACES_RE.sub('', title).replace('&', ' and ').lower()
+    title = _PUNCTUATION_RE.sub(' ', title)
+    return _SPACE_RE.sub(' ', title.replace(' :', ':')).strip()
+
+
+def _normalize_word(word):
+    return _BRACES_RE.sub('', word).lower().strip(_WORD_PUNCTUATION + '.')
+
+
+def _sniff_rows(lines):
+    """Split abbreviation list lines into (full, abbreviation) pairs, whatever the separator."""
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if ' = ' in line:
+            full, _, abbreviation = line.partition(' = ')
+            yield full.strip(), abbreviation.strip()
+            continue
+        delimiter = ';' if ';' in line else ('\t' if '\t' in line else ',')
+        row = next(csv.reader([line], delimiter=delimiter))
+        if len(row) >= 2:
+            yield row[0].strip(), row[1].strip()
+
+
+def _read_lines(filename):
+    with open(filename, 'r', encoding='utf-8-sig') as source:
+        yield from source
+
+
+class JournalAbbreviator:
+    """Precompiled title and word tables, with a per-run memo of abbreviated journals."""
+
+    def __init__(self, titles=None):
+        self.titles = {}        # normalized full title -> abbreviation
+        self.abbreviations = set()  # normalized abbreviations, already in final form
+        self.words = {}         # whole word -> abbreviation (or NOT_ABBREVIATED)
+        self.stems = {}         # word stem -> abbreviation
+        self.phrases = {}       # tuple of words -> abbreviation
+        self.max_stem = 0
+        self.max_phrase = 0
+        self._memo = {}
+        for full, abbreviation in (titles or {}).items():
+            self.add_title(full, abbreviation)
+
+    def add_title(self, full, abbreviation):
+        self.titles[normalize_title(full)] = abbreviation
+        self.abbreviations.add(normalize_title(abbreviation))
+
+    def add_word(self, word, abbreviation):
+        word = word.strip().lower()
+        abbreviation = abbreviation.strip()
+        if not word or word.startswith('-'):
+            return  # suffix patterns are rare and not supported
+        if abbreviation.lower() == NOT_ABBREVIATED:
+            abbreviation = NOT_ABBREVIATED
+        if ' ' in word:
+            phrase = tuple(_normalize_word(part) for part in word.split())
+            self.phrases[phrase] = abbreviation
+            self.max_phrase = max(self.max_phrase, len(phrase))
+        elif word.endswith('-'):
+            stem = word.rstrip('-')
+            self.stems[stem] = abbreviation
+            self.max_stem = max(self.max_stem, len(stem))
+        else:
+            self.words[word] = abbreviation
+
+    def load_titles(self, filename):
+        for full, abbreviation in _sniff_rows(_read_lines(filename)):
+            self.add_title(full, abbreviation)
+
+    def load_ltwa(self, filename):
+        for word, abbreviation in _sniff_rows(_read_lines(filename)):
+            if word.upper() == 'WORD':
+                continue  # header row
+            self.add_word(word, abbreviation)
+
+    def _abbreviate_word(self, word):
+        """Return the LTWA abbreviation of one word, or None if it has none."""
+        key = _normalize_word(word)
+        abbreviation = self.words.get(key)
+        if abbreviation is None:
+            for length in range(min(len(key), self.max_stem), 0, -1):
+                abbreviation = self.stems.get(key[:length])
+                if abbreviation is not None:
+                    break
+        if abbreviation is None or abbreviation == NOT_ABBREVIATED:
+            return None
+        return abbreviation
+
+    def abbreviate_words(self, title):
+        """Abbreviate a title word by word with the LTWA rules."""
+        words = _BRACES_RE.sub('', title).split()
+        if len(words) < 2:
+            return title  # single-word titles are never abbreviated
+        keys = [_normalize_word(word) for word in words]
+        result = []
+        pos = 0
+        while pos < len(words):
+            word = words[pos]
+            trailing = word[len(word.rstrip(_WORD_PUNCTUATION)):]
+            for length in range(min(self.max_phrase, len(words) - pos), 1, -1):
+                abbreviation = self.phrases.get(tuple(keys[pos:pos + length]))
+                if abbreviation is not None and abbreviation != NOT_ABBREVIATED:
+                    last = words[pos + length - 1]
+                    result.append(abbreviation + last[len(last.rstrip(_WORD_PUNCTUATION)):])
+                    pos += length
+                    break
+            else:
+                pos += 1
+                if pos > 1 and keys[pos - 1] in STOPWORDS:
+                    continue
+                abbreviation = self._abbreviate_word(word)
+                if abbreviation is None:
+                    result.append(word)
+                    continue
+                if word[:1].isupper():
+                    abbreviation = abbreviation[:1].upper() + abbreviation[1:]
+                result.append(abbreviation + trailing)
+        return ' '.join(result)
+
+    def abbreviate(self, journal):
+        """Return the abbreviated form of a journal name, or the name itself if nothing applies."""
+        if journal in self._memo:
+            return self._memo[journal]
+        key = normalize_title(journal)
+        if key in self.titles:
+            result = self.titles[key]
+        elif key in self.abbreviations or not (self.words or self.stems or self.phrases):
+            result = journal
+        else:
+            result = self.abbreviate_words(journal)
+        self._memo[journal] = result
+        return result
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_memo'] = {}
+        return state
+
+
+def _cache_path(sources):
+    digest = hashlib.sha1('\0'.join(os.path.abspath(source) for source in sources).encode()).hexdigest()
+    return os.path.join(cache_dir(), f'journal-abbrev-{digest[:16]}.pickle')
+
+
+def _source_stamps(sources):
+    stamps = []
+    for source in sources:
+        info = os.stat(source)
+        stamps.append((os.path.abspath(source), info.st_mtime_ns, info.st_size))
+    return stamps
+
+
+def load_abbreviator(titles=None, title_files=(), ltwa_files=(), use_cache=True):
+    """Build a JournalAbbreviator from built-in titles and external files, through the pickle cache.
+
+    titles is a dict of built-in full title -> abbreviation; entries in
+    title_files take precedence over it.
+    """
+    sources = [('titles', filename) for filename in title_files] + [('ltwa', filename) for filename in ltwa_files]
+    use_cache = use_cache and bool(sources)
+    if use_cache:
+        cache_path = _cache_path([filename for _, filename in sources])
+        stamps = (CACHE_VERSION, sorted((titles or {}).items()), _source_stamps([f for _, f in sources]))
+        try:
+            with open(cache_path, 'rb') as cache_file:
+                cached_stamps, abbreviator = pickle.load(cache_file)
+            if cached_stamps == stamps:
+                get_stats().count('abbreviation cache hits')
+                return abbreviator
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+        get_stats().count('abbreviation cache misses')
+
+    abbreviator = JournalAbbreviator(titles)
+    for kind, filename in sources:
+        if kind == 'titles':
+            abbreviator.load_titles(filename)
+        else:
+            abbreviator.load_ltwa(filename)
+
+    if use_cache:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as cache_file:
+            pickle.dump((stamps, abbreviator), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, cache_path)
+    return abbreviator
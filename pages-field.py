@@ -1,97 +1,329 @@
-import bibtexparser
 import argparse
-import requests
-from bibtexparser.bparser import BibTexParser
-from bibtexparser.bwriter import BibTexWriter
-from requests.exceptions import RequestException, JSONDecodeError
-
-def get_article_metadata(doi):
-    url = f"https://doi.org/{doi}"
-    headers = {"Accept": "application/json"}
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
-        
-        # Check if the response content is empty
-        if not response.content:
-            print(f"Empty response content for {doi}")
-            return None
-        
-        # Try to decode the JSON content
-        data = response.json()
-        return data
-    
-    except RequestException as e:
-        print(f"Request failed: {e} for {doi}")
-        return None
-    
-    except JSONDecodeError as e:
-        print(f"Failed to decode JSON: {e} for {doi}")
-        return None
-
-def process_bib_file(input_file, output_file):
-    # Read the BibTeX file
-    with open(input_file, 'r') as bibtex_file:
-        parser = BibTexParser()
-        parser.ignore_nonstandard_types = False
-        bib_database = bibtexparser.load(bibtex_file, parser=parser)
-
-    # Iterate over each entry
-    for entry in bib_database.entries:
-        # Skip entries that already have a 'pages' field
-        if 'pages' in entry:
-            continue
-        
-        # Process only entries with a 'doi' field 
-        if 'doi' in entry:
-            doi = entry['doi']
-            citekey = entry['ID']
-            # If it is arxiv DOI then skip
-            if doi.startswith('10.48550'):
-                print(f"ArXiv Preprint: {citekey}. Skipping...")
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import urljoin, urlparse
+
+from bibreader import iter_bib_entries, iter_entry_edits, write_passthrough
+from doicache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, DOICache, default_cache_path
+from doiindex import DOIIndex, build_index, default_index_path
+from pagerules import PageRuleEngine, load_rules
+from runstats import add_stats_arguments, get_stats, start_stats
+
+# requests is imported by the functions that talk to the network, so runs that
+# find every DOI in the rules, the index or the cache never load it
+
+DEFAULT_RESOLVER = "https://doi.org"
+DEFAULT_JOBS = 8
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_RATE = 10.0  # requests per second, per host
+MAX_REDIRECTS = 5
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class HostRateLimiter:
+    """Space out requests so that no host sees more than `rate` requests per second."""
+
+    def __init__(self, rate=DEFAULT_RATE):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_session(pool_size=DEFAULT_JOBS):
+    """Return a keep-alive session whose connection pool fits `pool_size` workers."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Accept"] = "application/json"
+    return session
+
+
+def _retry_delay(response, attempt, backoff):
+    """Seconds to wait before the next attempt, honouring Retry-After when present."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return backoff * (2 ** attempt) * (1 + random.random() / 2)
+
+
+def _get(session, url, timeout, rate_limiter):
+    """GET url, following redirects by hand so that every hop is rate limited."""
+    import requests
+    for _ in range(MAX_REDIRECTS + 1):
+        if rate_limiter:
+            rate_limiter.wait(url)
+        response = session.get(url, timeout=timeout, allow_redirects=False)
+        if not response.is_redirect:
+            return response
+        url = urljoin(url, response.headers["Location"])
+    raise requests.TooManyRedirects(f"Exceeded {MAX_REDIRECTS} redirects")
+
+
+def _request_metadata(doi, session, resolver, timeout, retries, backoff, rate_limiter):
+    """Return (metadata, final); final is False for transient failures that are worth retrying later."""
+    import requests
+    from requests.exceptions import JSONDecodeError, RequestException
+    url = f"{resolver.rstrip('/')}/{doi}"
+    for attempt in range(retries + 1):
+        response = None
+        try:
+            response = _get(session, url, timeout, rate_limiter)
+            if response.status_code in RETRY_STATUS and attempt < retries:
+                time.sleep(_retry_delay(response, attempt, backoff))
+                continue
+            response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
+
+            # Check if the response content is empty
+            if not response.content:
+                print(f"Empty response content for {doi}")
+                return None, True
+
+            # Try to decode the JSON content
+            data = response.json()
+            return data, True
+
+        except JSONDecodeError as e:
+            print(f"Failed to decode JSON: {e} for {doi}")
+            return None, True
+
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt < retries:
+                time.sleep(_retry_delay(None, attempt, backoff))
                 continue
+            print(f"Request failed: {e} for {doi}")
+            return None, False
+
+        except RequestException as e:
+            print(f"Request failed: {e} for {doi}")
+            # Only a definite "no such DOI" is worth remembering
+            final = response is not None and 400 <= response.status_code < 500 and response.status_code != 429
+            return None, final
+
+
+def get_article_metadata(doi, session=None, resolver=DEFAULT_RESOLVER, timeout=DEFAULT_TIMEOUT,
+                         retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, rate_limiter=None):
+    if session is None:
+        with make_session(1) as session:
+            return _request_metadata(doi, session, resolver, timeout, retries, backoff, rate_limiter)[0]
+    return _request_metadata(doi, session, resolver, timeout, retries, backoff, rate_limiter)[0]
 
-            # starting with '10.1103' For physical review family of journal
-            if entry['doi'].startswith('10.1103'):
-                # Extract the last part of the DOI
-                last_part = doi.split(".")[-1]
-                # Append the page number to the BibTeX entry
-                entry['pages'] = last_part.title()
 
-            # For other DOI fetch info from web.
+def fetch_metadata(dois, jobs=DEFAULT_JOBS, resolver=DEFAULT_RESOLVER, timeout=DEFAULT_TIMEOUT,
+                   retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, rate=DEFAULT_RATE, cache=None):
+    """Resolve many DOIs concurrently; return a dict mapping DOI -> metadata (or None).
+
+    Results that are not transient failures are written to `cache` if one is given.
+    """
+    dois = list(dict.fromkeys(dois))
+    if not dois:
+        return {}
+    from concurrent.futures import ThreadPoolExecutor
+    jobs = max(1, min(jobs, len(dois)))
+    rate_limiter = HostRateLimiter(rate)
+    stats = get_stats()
+    stats.count('doi requests', len(dois))
+    with stats.phase('network'):
+        with make_session(jobs) as session, ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(
+                lambda doi: _request_metadata(doi, session, resolver, timeout, retries, backoff, rate_limiter),
+                dois))
+    if cache is not None:
+        cache.put_many((doi, data) for doi, (data, final) in zip(dois, results) if final)
+    return {doi: data for doi, (data, _) in zip(dois, results)}
+
+
+def resolve_metadata(dois, cache=None, offline=False, refresh=False, index=None, **fetch_options):
+    """Look DOIs up in the local index, then the cache, and fetch only the rest (never, when offline)."""
+    dois = list(dict.fromkeys(dois))
+    found = {}
+    if index is not None:
+        found.update(index.get_many(dois))
+        get_stats().count('doi index hits', len(found))
+        print(f"DOI index: {len(found)} of {len(dois)} DOIs resolved locally")
+        dois = [doi for doi in dois if doi not in found]
+    if cache is not None and not refresh:
+        found.update(cache.get_many(dois))
+    missing = [doi for doi in dois if doi not in found]
+    if cache is not None and not refresh:
+        get_stats().count('doi cache hits', len(dois) - len(missing))
+        get_stats().count('doi cache misses', len(missing))
+        print(f"DOI cache: {len(dois) - len(missing)} hits, {len(missing)} misses")
+    if offline:
+        if missing:
+            print(f"Offline mode: skipping {len(missing)} DOIs that are not cached")
+        return found
+    found.update(fetch_metadata(missing, cache=cache, **fetch_options))
+    return found
+
+
+def needs_lookup(entry, rules=None):
+    """True if the entry's pages can only be found by asking the DOI resolver."""
+    doi = entry.get('doi')
+    if 'pages' in entry or doi is None or doi.startswith('10.48550'):
+        return False
+    return (rules or PageRuleEngine()).match(entry)[0] is None
+
+
+def add_pages_field(entry, metadata_by_doi=None, rules=None):
+    # Skip entries that already have a 'pages' field
+    if 'pages' in entry:
+        return entry
+
+    # Process only entries with a 'doi' field
+    if 'doi' in entry:
+        doi = entry['doi']
+        citekey = entry['ID']
+        # If it is arxiv DOI then skip
+        if doi.startswith('10.48550'):
+            print(f"ArXiv Preprint: {citekey}. Skipping...")
+            return entry
+
+        # Publishers that encode the article number in the DOI, e.g. the Physical Review family
+        pages = (rules or PageRuleEngine()).resolve(entry)
+        if pages:
+            entry['pages'] = pages
+
+        # For other DOI use the prefetched metadata, or fetch info from web.
+        else:
+            pages=None
+            if metadata_by_doi is not None:
+                metadata = metadata_by_doi.get(doi)
             else:
-                pages=None
                 metadata = get_article_metadata(doi)
-                if metadata:
-                    if "article-number" in metadata.keys():
-                        pages=metadata["article-number"]
-                    elif "page" in metadata.keys():
-                        pages=metadata["page"]
-                    if pages==None:
-                        print(f"Pages field not found for citekey: {citekey}")
-                        continue
+            if metadata:
+                if "article-number" in metadata.keys():
+                    pages=metadata["article-number"]
+                elif "page" in metadata.keys():
+                    pages=metadata["page"]
+                if pages==None:
+                    print(f"Pages field not found for citekey: {citekey}")
+                    return entry
+
+                entry['pages'] = pages
+
+            else:
+                print(f"No metadata found for citekey: {citekey}")
+
+    return entry
+
+def process_bib_file(input_file, output_file, cache=None, offline=False, refresh=False, index=None,
+                     rules=None, **fetch_options):
+    rules = rules or PageRuleEngine()
 
-                    entry['pages'] = pages
+    # First pass: gather every DOI that no rule covers and resolve them together
+    dois = [entry['doi'] for entry in iter_bib_entries(input_file) if needs_lookup(entry, rules)]
+    metadata_by_doi = resolve_metadata(dois, cache=cache, offline=offline, refresh=refresh, index=index,
+                                       **fetch_options)
 
-                else:
-                    print(f"No metadata found for citekey: {citekey}")
+    # Second pass: stream the BibTeX file, filling in pages entry by entry
+    edits = iter_entry_edits(input_file, lambda entry: add_pages_field(entry, metadata_by_doi, rules))
 
+    # Copy the file, re-writing only the entries that gained a pages field
+    count = write_passthrough(input_file, edits, output_file)
+    print(f"Pages field added to {count} entries")
 
-    # Write the updated BibTeX entries to a new file
-    writer = BibTexWriter()
-    with open(output_file, 'w') as bibtex_file:
-        bibtex_file.write(writer.write(bib_database))
+    if rules.counts:
+        print("Pages derived offline from the DOI:")
+        for line in rules.report():
+            print("-", line)
 
 if __name__ == "__main__":
     # Create argument parser
     parser = argparse.ArgumentParser(description='Process input and output BibTeX files')
-    
+
     # Add arguments
-    parser.add_argument('--input', dest='input_file', help='Input BibTeX file', required=True)
-    parser.add_argument('--output', dest='output_file', help='Output BibTeX file', required=True)
-    
+    parser.add_argument('--input', dest='input_file', help='Input BibTeX file')
+    parser.add_argument('--output', dest='output_file', help='Output BibTeX file')
+    parser.add_argument('--build-index', dest='dump_files', nargs='+', metavar='DUMP',
+                        help='Instead of processing a BibTeX file, ingest Crossref-style JSONL dump(s) '
+                             '(optionally .gz) into the local DOI index')
+    parser.add_argument('--index', dest='index_file', default=None,
+                        help=f'Local DOI index consulted before the network (default: {default_index_path()}, if it exists)')
+    parser.add_argument('--no-index', action='store_true', help='Do not consult the local DOI index')
+    parser.add_argument('--rules', dest='rules_file', default=None,
+                        help='JSON file with extra DOI -> pages rules, tried after the built-in ones')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS,
+                        help=f'Number of concurrent DOI lookups (default: {DEFAULT_JOBS})')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'Maximum requests per second to any one host, 0 for no limit (default: {DEFAULT_RATE})')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f'Per-request timeout in seconds (default: {DEFAULT_TIMEOUT})')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help=f'Retries for timeouts, 429 and 5xx responses (default: {DEFAULT_RETRIES})')
+    parser.add_argument('--resolver', default=DEFAULT_RESOLVER,
+                        help=f'DOI resolver base URL, e.g. a local stand-in server for testing (default: {DEFAULT_RESOLVER})')
+    parser.add_argument('--cache', dest='cache_file', default=None,
+                        help=f'DOI metadata cache file (default: {default_cache_path()})')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the DOI metadata cache')
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL / 86400,
+                        help=f'Days before a cached result is fetched again (default: {DEFAULT_TTL / 86400:g})')
+    parser.add_argument('--cache-max-entries', type=int, default=DEFAULT_MAX_ENTRIES,
+                        help=f'Evict least recently used DOIs beyond this many (default: {DEFAULT_MAX_ENTRIES})')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--offline', action='store_true', help='Never touch the network, use cached metadata only')
+    mode.add_argument('--refresh', action='store_true', help='Ignore cached metadata and fetch every DOI again')
+
+    # Add arguments for run statistics and profiling
+    add_stats_arguments(parser)
+
     # Parse arguments
     args = parser.parse_args()
-    
-    # Process the BibTeX file
-    process_bib_file(args.input_file, args.output_file)
+    start_stats(args)
+
+    index_file = args.index_file or default_index_path()
+    if args.dump_files:
+        count = build_index(args.dump_files, index_file)
+        print(f"Indexed {count} works into {index_file}")
+        sys.exit(0)
+    if not args.input_file or not args.output_file:
+        parser.error('--input and --output are required')
+
+    if args.index_file and not args.no_index and not os.path.exists(args.index_file):
+        sys.exit(f"Error: DOI index {args.index_file} not found (build it with --build-index)")
+
+    rules = PageRuleEngine()
+    if args.rules_file:
+        for rule in load_rules(args.rules_file):
+            rules.add_rule(rule)
+
+    fetch_options = dict(jobs=args.jobs, resolver=args.resolver, timeout=args.timeout,
+                         retries=args.retries, rate=args.rate)
+
+    index = None
+    if not args.no_index and os.path.exists(index_file):
+        index = DOIIndex(index_file)
+    try:
+        # Process the BibTeX file
+        if args.no_cache:
+            process_bib_file(args.input_file, args.output_file, offline=args.offline, index=index,
+                             rules=rules, **fetch_options)
+        else:
+            with DOICache(args.cache_file, ttl=args.cache_ttl * 86400,
+                          max_entries=args.cache_max_entries) as cache:
+                process_bib_file(args.input_file, args.output_file, cache=cache,
+                                 offline=args.offline, refresh=args.refresh, index=index,
+                                 rules=rules, **fetch_options)
+    finally:
+        if index is not None:
+            index.close()
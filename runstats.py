@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+'''
+Run statistics shared by the scripts in this folder: --stats and --profile.
+
+Library code marks what it is doing with phases and counters:
+
+    stats = get_stats()
+    with stats.phase('network'):
+        ...
+    stats.count('doi cache hits', len(found))
+
+and wraps the generators that read input with stats.timed(iterable, 'parse'),
+so that the time spent producing each item is charged to that phase even
+when reading, editing and writing are interleaved in one streaming pass.
+Phases nest; time is always charged to the innermost one, so the phases add
+up to the whole run and anything outside them shows as 'other'.
+
+Until a script calls start_stats with --stats or --profile given, get_stats
+returns a disabled collector whose methods do nothing, so the instrumentation
+costs nothing in normal runs. Work done in worker processes (--jobs) is
+counted as the time the main process spends waiting for it, and phases
+entered in worker threads are ignored; counters are kept from every thread.
+'''
+import atexit
+import json
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def _peak_rss(who):
+    # ru_maxrss is in bytes on macOS, KiB elsewhere
+    return resource.getrusage(who).ru_maxrss // (1024 if sys.platform == 'darwin' else 1)
+
+
+class _Phase:
+    __slots__ = ('stats', 'name')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        if threading.get_ident() == self.stats._thread:
+            self.stats._charge()
+            self.stats._stack.append(self.name)
+
+    def __exit__(self, *exc):
+        if threading.get_ident() == self.stats._thread:
+            self.stats._charge()
+            self.stats._stack.pop()
+
+
+class _NoPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+class RunStats:
+    """Wall and CPU time per phase, plus named counters, for one run."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.wall = defaultdict(float)
+        self.cpu = defaultdict(float)
+        self.counters = Counter()
+        self._stack = ['other']
+        self._thread = threading.get_ident()
+        self._mark = (time.perf_counter(), time.process_time())
+        # Children that ran before us (e.g. a launcher) would otherwise show up as workers
+        self._children_rss = _peak_rss(resource.RUSAGE_CHILDREN) if resource is not None else 0
+
+    def _charge(self):
+        wall, cpu = time.perf_counter(), time.process_time()
+        phase = self._stack[-1]
+        self.wall[phase] += wall - self._mark[0]
+        self.cpu[phase] += cpu - self._mark[1]
+        self._mark = (wall, cpu)
+
+    def phase(self, name):
+        """Context manager charging the time spent inside it to phase name."""
+        return _Phase(self, name) if self.enabled else _NO_PHASE
+
+    def timed(self, iterable, name):
+        """Iterate over iterable, charging the time spent producing each item to phase name."""
+        if not self.enabled or threading.get_ident() != self._thread:
+            return iterable
+        return self._timed(iterable, name)
+
+    def _timed(self, iterable, name):
+        iterator = iter(iterable)
+        while True:
+            self._charge()
+            self._stack.append(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._charge()
+                self._stack.pop()
+            yield item
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] += amount
+
+    def report(self):
+        """Return the statistics so far as a JSON-serializable dict."""
+        self._charge()
+        phases = {name: {'wall': round(self.wall[name], 6), 'cpu': round(self.cpu[name], 6)}
+                  for name in sorted(self.wall, key=self.wall.get, reverse=True)}
+        report = {'wall': round(sum(self.wall.values()), 6), 'cpu': round(sum(self.cpu.values()), 6),
+                  'phases': phases, 'counters': dict(sorted(self.counters.items()))}
+        if resource is not None:
+            report['peak_rss_kb'] = _peak_rss(resource.RUSAGE_SELF)
+            children = _peak_rss(resource.RUSAGE_CHILDREN)
+            if children > self._children_rss:
+                report['peak_rss_children_kb'] = children
+        return report
+
+
+def format_report(report):
+    """Render a report dict as text."""
+    lines = [f"Run statistics: {report['wall']:.3f} s wall, {report['cpu']:.3f} s CPU"
+             + (f", peak RSS {report['peak_rss_kb'] / 1024:.1f} MiB" if 'peak_rss_kb' in report else '')
+             + (f" ({report['peak_rss_children_kb'] / 1024:.1f} MiB in workers)"
+                if 'peak_rss_children_kb' in report else '')]
+    for name, times in report['phases'].items():
+        share = 100 * times['wall'] / report['wall'] if report['wall'] else 0
+        lines.append(f"  {name:<12} {times['wall']:9.3f} s wall {times['cpu']:9.3f} s CPU {share:5.1f}%")
+    for name, value in report['counters'].items():
+        lines.append(f"  {name}: {value}")
+    return "\n".join(lines)
+
+
+_stats = RunStats(enabled=False)
+_finish = None  # the pending report of start_stats
+
+
+def get_stats():
+    """The collector for this run; disabled unless start_stats turned it on."""
+    return _stats
+
+
+def add_stats_arguments(parser):
+    """Add --stats and --profile to an argparse parser."""
+    parser.add_argument('--stats', nargs='?', const='text', choices=['text', 'json'], default=None,
+                        help='Report time per phase (parse, transform, network, write), entry and cache '
+                             'counts and peak memory on stderr when done, as text (default) or json')
+    parser.add_argument('--profile', metavar='FILE', default=None,
+                        help='Write a cProfile dump of the run to FILE (view it with python -m pstats FILE)')
+
+
+def start_stats(args):
+    """Start collecting as asked by --stats/--profile; the report is printed when the program exits."""
+    global _stats
+    if not args.stats and not args.profile:
+        return _stats
+    _stats = RunStats()
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def finish():
+        global _finish
+        _finish = None
+        atexit.unregister(finish)
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print(f"Profile written to {args.profile}", file=sys.stderr)
+        if args.stats == 'json':
+            print(json.dumps(_stats.report(), indent=2), file=sys.stderr)
+        elif args.stats:
+            print(format_report(_stats.report()), file=sys.stderr)
+
+    global _finish
+    _finish = finish
+    atexit.register(finish)
+    return _stats
+
+
+def finish_stats():
+    """Print the report start_stats asked for now instead of at exit, e.g. in a process that ends with os._exit."""
+    if _finish is not None:
+        _finish()
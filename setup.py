@@ -0,0 +1,9 @@
+# The scripts are flat modules, and pyproject.toml cannot list the hyphenated ones
+# (clean-bib.py, ...); `bibtools <command>` runs them by name.
+from setuptools import setup
+
+setup(py_modules=[
+    'bibdeduplicate', 'bibkeyindex', 'bibreader', 'bibtools', 'citekeys', 'citescan', 'clean-bib',
+    'doicache', 'doiindex', 'fix-title-case', 'journal-name-sub', 'journal-names', 'journalabbrev',
+    'pagerules', 'pages-field', 'runstats', 'unused_figs', 'warmserver',
+])
@@ -0,0 +1,95 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bibdeduplicate import (DedupIndex, find_duplicates, find_duplicates_incremental, find_fuzzy_duplicates,
+                            is_fuzzy_duplicate)
+from bibreader import iter_compact_entries
+
+LIBRARY = (
+    '@article{smith2020,\n  author = {Smith, John and Doe, Anna},\n  title = {Spin waves in frustrated magnets},\n'
+    '  year = {2020}\n}\n'
+    '@article{smith2020b,\n  author = {Smith, John and Doe, Anna},\n  title = {Spin Waves in Frustrated Magnets},\n'
+    '  year = {2020}\n}\n'
+    '@article{smith2020typo,\n  author = {Smith, J. and others},\n  title = {Spin waves in frustated magnets},\n'
+    '  year = {2021}\n}\n'
+    '@article{chen2019,\n  author = {Chen, Li},\n  title = {Topological edge states of light},\n'
+    '  doi = {10.1103/PhysRevB.1.1}, year = {2019}\n}\n'
+    '@article{chen2019erratum,\n  author = {Chen, Li},\n  title = {Topological edge states of light},\n'
+    '  doi = {10.1103/PhysRevB.1.2}, year = {2019}\n}\n'
+    '@misc{kim2018,\n  author = {Kim, K.},\n  title = {A preprint title},\n  eprint = {1801.01234v2}\n}\n'
+    '@article{kim2018pub,\n  author = {Kim, K.},\n  title = {The published title},\n'
+    '  journal = {arXiv:1801.01234}\n}\n'
+    '@article{other,\n  author = {Novak, P.},\n  title = {Unrelated thermal transport},\n  year = {2010}\n}\n'
+)
+
+
+def group_keys(duplicates):
+    return sorted(sorted(entry['ID'] for entry in group) for group in duplicates.values())
+
+
+class DedupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.bib = os.path.join(self.directory, 'library.bib')
+        self.write(LIBRARY)
+
+    def write(self, text, mode='w'):
+        with open(self.bib, mode, encoding='utf-8') as bib_file:
+            bib_file.write(text)
+
+    def entries(self):
+        return list(iter_compact_entries(self.bib))
+
+    def incremental(self, fuzzy=True):
+        with DedupIndex(self.bib + '.dedup-index') as index, redirect_stdout(io.StringIO()):
+            return group_keys(find_duplicates_incremental(self.bib, index, fuzzy=fuzzy))
+
+    def test_exact_duplicates(self):
+        self.assertEqual(group_keys(find_duplicates(self.entries())),
+                         [['chen2019', 'chen2019erratum'], ['smith2020', 'smith2020b']])
+
+    def test_fuzzy_duplicates(self):
+        self.assertEqual(group_keys(find_fuzzy_duplicates(self.entries())),
+                         [['kim2018', 'kim2018pub'], ['smith2020', 'smith2020b', 'smith2020typo']])
+
+    def test_different_publisher_dois_are_different_works(self):
+        entries = {entry['ID']: entry for entry in self.entries()}
+        self.assertFalse(is_fuzzy_duplicate(entries['chen2019'], entries['chen2019erratum']))
+        self.assertTrue(is_fuzzy_duplicate(entries['smith2020'], entries['smith2020typo']))
+        self.assertFalse(is_fuzzy_duplicate(entries['smith2020'], entries['other']))
+
+    def test_incremental_matches_full_scan(self):
+        expected = group_keys(find_fuzzy_duplicates(self.entries()))
+        self.assertEqual(self.incremental(), expected)
+        self.assertEqual(self.incremental(), expected)  # from the index alone
+        self.assertEqual(self.incremental(fuzzy=False), group_keys(find_duplicates(self.entries())))
+
+    def test_incremental_after_append_and_edit(self):
+        self.incremental()
+        self.write('@article{novak-copy,\n  author = {Novak, P.},\n  title = {Unrelated thermal transport},\n'
+                   '  year = {2010}\n}\n', mode='a')
+        self.assertIn(['novak-copy', 'other'], self.incremental())
+        self.write(LIBRARY.replace('frustated', 'quantum'))  # smith2020typo no longer matches
+        groups = self.incremental()
+        self.assertEqual(groups, group_keys(find_fuzzy_duplicates(self.entries())))
+        self.assertIn(['smith2020', 'smith2020b'], groups)
+
+    def test_resolved_groups_are_skipped(self):
+        with DedupIndex(self.bib + '.dedup-index') as index, redirect_stdout(io.StringIO()):
+            duplicates = find_duplicates_incremental(self.bib, index, fuzzy=True)
+            index.add_resolved([digests for digests, group in duplicates.items()
+                                if group[0]['ID'].startswith('kim')])
+        self.assertEqual(self.incremental(), [['smith2020', 'smith2020b', 'smith2020typo']])
+
+
+if __name__ == '__main__':
+    unittest.main()
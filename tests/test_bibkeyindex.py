@@ -0,0 +1,94 @@
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bibkeyindex import BibKeyIndex
+
+clean_bib = importlib.import_module('clean-bib')
+
+LIBRARY = ('@string{j = "J"}\n\n'
+           '@article{alpha,\n  title = {A},\n  journal = j\n}\n\n'
+           '@comment{skipped}\n'
+           '@preamble{"x"}\n'
+           '@book{beta, title = {B}}\n'
+           '@misc{alpha, title = {A again}}\n')
+
+
+class BibKeyIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.bib = os.path.join(self.directory, 'library.bib')
+        self.write(LIBRARY)
+
+    def write(self, text, mode='w'):
+        with open(self.bib, mode, encoding='utf-8') as bib_file:
+            bib_file.write(text)
+
+    def read(self, span):
+        with open(self.bib, 'rb') as bib_file:
+            bib_file.seek(span[0])
+            return bib_file.read(span[1] - span[0]).decode()
+
+    def index(self):
+        index = BibKeyIndex(self.bib)
+        self.addCleanup(index.close)
+        return index
+
+    def bump_mtime(self):
+        info = os.stat(self.bib)
+        os.utime(self.bib, ns=(info.st_atime_ns, info.st_mtime_ns + 10 ** 9))
+
+    def test_spans(self):
+        index = self.index()
+        self.assertTrue(index.rebuilt)
+        spans = index.spans(['beta', 'alpha', 'missing'])
+        self.assertEqual(sorted(spans), ['alpha', 'beta'])
+        self.assertEqual(self.read(spans['beta']), '@book{beta, title = {B}}')
+        self.assertEqual(self.read(spans['alpha']), '@misc{alpha, title = {A again}}')  # the last one wins
+        self.assertEqual([self.read(span) for span in index.macro_spans()], ['@string{j = "J"}', '@preamble{"x"}'])
+        self.assertEqual(list(index.keys()), ['alpha', 'beta', 'alpha'])
+        self.assertEqual(len(index), 3)
+
+    def test_reused_while_unchanged(self):
+        self.index().close()
+        self.assertFalse(self.index().rebuilt)
+
+    def test_rebuilt_after_append(self):
+        self.index().close()
+        self.write('@misc{gamma, title = {G}}\n', mode='a')
+        index = self.index()
+        self.assertTrue(index.rebuilt)
+        self.assertEqual(self.read(index.spans(['gamma'])['gamma']), '@misc{gamma, title = {G}}')
+
+    def test_rebuilt_after_same_size_edit(self):
+        self.index().close()
+        self.write(LIBRARY.replace('beta', 'zeta'))
+        self.bump_mtime()
+        index = self.index()
+        self.assertTrue(index.rebuilt)
+        self.assertEqual(sorted(index.spans(['beta', 'zeta'])), ['zeta'])
+
+    def test_touch_only_checks_content(self):
+        self.index().close()
+        self.bump_mtime()
+        index = self.index()
+        self.assertFalse(index.rebuilt)
+        # The new mtime is remembered, so the next run does not hash the file again
+        self.assertEqual(index._meta()['mtime'], os.stat(self.bib).st_mtime_ns)
+
+    def test_clean_bib_index_matches_scan(self):
+        scanned = clean_bib.read_bib_spans(self.bib, ['beta', 'alpha'])
+        indexed = clean_bib.read_bib_spans(self.bib, ['beta', 'alpha'], use_index=True)
+        self.assertEqual(indexed, scanned)
+        self.assertTrue(os.path.exists(self.bib + '.key-index'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,312 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bibreader
+from bibreader import (_iter_blocks, format_entry, iter_bib_entries, iter_bib_records, iter_bib_spans,
+                       iter_compact_entries, iter_entry_edits, iter_raw_blocks, write_passthrough)
+
+
+class BibFileTest(unittest.TestCase):
+    """Base class for tests that write small .bib files into a scratch folder."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, text, name='refs.bib', newline=None):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'w', encoding='utf-8', newline=newline) as bib_file:
+            bib_file.write(text)
+        return filename
+
+    def entries(self, text, **options):
+        return list(iter_bib_entries(self.write(text), **options))
+
+
+class ParseTest(BibFileTest):
+
+    def test_fields(self):
+        entry, = self.entries('@Article{key1,\n  Author = {Smith, J.},\n  year = 2020,\n  pages = "1--10"\n}\n')
+        self.assertEqual(entry, {'ENTRYTYPE': 'article', 'ID': 'key1', 'author': 'Smith, J.',
+                                 'year': '2020', 'pages': '1--10'})
+
+    def test_string_macros_and_concatenation(self):
+        entry, = self.entries('@string{prl = "Physical Review Letters"}\n'
+                              '@STRING(vol = {12})\n'
+                              '@article{k, journal = prl, volume = vol # "a", note = "see " # prl # { too}}\n')
+        self.assertEqual(entry['journal'], 'Physical Review Letters')
+        self.assertEqual(entry['volume'], '12a')
+        self.assertEqual(entry['note'], 'see Physical Review Letters too')
+
+    def test_redefined_macro_applies_from_then_on(self):
+        first, second = self.entries('@string{j = "One"}\n@misc{a, journal = j}\n'
+                                     '@string{j = "Two"}\n@misc{b, journal = j}\n')
+        self.assertEqual((first['journal'], second['journal']), ('One', 'Two'))
+
+    def test_unknown_macro_is_kept(self):
+        entry, = self.entries('@misc{k, publisher = unknownmacro}\n')
+        self.assertEqual(entry['publisher'], 'unknownmacro')
+
+    def test_month_macros_are_not_expanded(self):
+        entry, = self.entries('@misc{k, month = jan, note = {in } # dec}\n')
+        self.assertEqual(entry['month'], 'jan')
+        self.assertEqual(entry['note'], 'in dec')
+        self.assertIn(' month = jan,\n', format_entry(entry))
+        self.assertIn(' note = {in dec}\n', format_entry(entry))
+
+    def test_nested_braces(self):
+        entry, = self.entries('@article{k, title = {The {{Deeply} {Nested {{Braces}}}} of {X}}, year = {2001}}\n')
+        self.assertEqual(entry['title'], 'The {{Deeply} {Nested {{Braces}}}} of {X}')
+        self.assertEqual(entry['year'], '2001')
+
+    def test_parenthesis_delimited_entry(self):
+        entry, = self.entries('@article(k,\n  title = {A (parenthesised) title},\n  note = "x)y"\n)\n')
+        self.assertEqual(entry['ID'], 'k')
+        self.assertEqual(entry['title'], 'A (parenthesised) title')
+        self.assertEqual(entry['note'], 'x)y')
+
+    def test_quoted_values_with_braces(self):
+        entry, = self.entries('@misc{k, title = "A {"}quoted{"} {Word}", author = "{\\"O}zt{\\"u}rk"}\n')
+        self.assertEqual(entry['title'], 'A {"}quoted{"} {Word}')
+        self.assertEqual(entry['author'], '{\\"O}zt{\\"u}rk')
+
+    def test_comment_and_preamble(self):
+        records = list(iter_bib_records(self.write(
+            'Free text is ignored.\n@comment{jabref-meta: databaseType:bibtex;}\n'
+            '@preamble{ "\\newcommand{\\noop}[1]{}" }\n@misc{k, title = {T}}\n')))
+        self.assertEqual([kind for kind, _ in records], ['comment', 'preamble', 'entry'])
+        self.assertEqual(records[0][1], 'jabref-meta: databaseType:bibtex;')
+        self.assertEqual(records[1][1], ' "\\newcommand{\\noop}[1]{}" ')
+
+    def test_article_inside_field_value(self):
+        entries = self.entries('@misc{outer,\n  note = {see\n@article{inner, title = {No}}\n  instead},\n'
+                               '  year = {2000}\n}\n@misc{after, title = {Yes}}\n')
+        self.assertEqual([entry['ID'] for entry in entries], ['outer', 'after'])
+        self.assertIn('@article{inner', entries[0]['note'])
+        self.assertEqual(entries[0]['year'], '2000')
+
+    def test_unterminated_block(self):
+        warnings = io.StringIO()
+        with redirect_stderr(warnings):
+            entries = self.entries('@misc{good, title = {T}}\n@article{bad, title = {never closed}\n')
+        self.assertEqual([entry['ID'] for entry in entries], ['good'])
+        self.assertIn('unterminated @article block at byte 25', warnings.getvalue())
+
+    def test_crlf_line_endings(self):
+        text = '@string{j = "J"}\n@article{k,\n  title = {Two\n  lines},\n  journal = j,\n  year = 2020\n}\n'
+        entry, = self.entries(text)
+        crlf_entry, = list(iter_bib_entries(self.write(text, 'crlf.bib', newline='\r\n')))
+        self.assertEqual(crlf_entry, entry)
+        self.assertEqual(entry['title'], 'Two lines')
+
+    def test_spans_survive_chunk_boundaries(self):
+        text = ''.join(f'@misc{{k{i}, title = {{{"x" * i}}}, note = {{{{a}} {{b}}}}}}\n' for i in range(40))
+        filename = self.write(text)
+        expected = [(block_type, body, start, end) for block_type, body, start, end in iter_raw_blocks(filename)]
+        for chunk_size in (1, 7, 64):
+            with open(filename, 'rb') as bib_file:
+                self.assertEqual(list(_iter_blocks(bib_file, chunk_size=chunk_size)), expected)
+        data = text.encode()
+        self.assertTrue(all(data[start:end].startswith(b'@misc{') and data[end - 1:end] == b'}'
+                            for _, _, start, end in expected))
+
+
+
+class CompactEntryTest(BibFileTest):
+
+    LIBRARY = ('@string{pub = "First Publisher"}\n'
+               '@article{a, author = {Smith, J.}, journal = {Nature}, year = 2020, publisher = pub, note = {x}}\n'
+               '@string{pub = "Second Publisher"}\n'
+               '@book{b, title = {A Book}, journal = {Nature}, year = 2020, publisher = pub}\n')
+
+    def compact(self):
+        return list(iter_compact_entries(self.write(self.LIBRARY)))
+
+    def test_same_as_entry_dicts(self):
+        self.assertEqual([dict(entry) for entry in self.compact()], self.entries(self.LIBRARY))
+
+    def test_rare_fields_keep_the_macros_of_their_entry(self):
+        first, second = self.compact()
+        self.assertEqual(first['publisher'], 'First Publisher')
+        self.assertEqual(second['publisher'], 'Second Publisher')
+
+    def test_shared_values(self):
+        first, second = self.compact()
+        self.assertIs(first['journal'], second['journal'])
+        self.assertIs(first['year'], second['year'])
+
+    def test_mapping_interface(self):
+        first, second = self.compact()
+        self.assertNotIn('title', first)
+        self.assertIsNone(first.get('title'))
+        self.assertEqual(first.get('note'), 'x')
+        first['title'] = 'New'
+        first['keywords'] = 'spin'
+        del first['note']
+        del first['author']
+        self.assertEqual(dict(first), {'ENTRYTYPE': 'article', 'ID': 'a', 'title': 'New', 'journal': 'Nature',
+                                       'year': '2020', 'publisher': 'First Publisher', 'keywords': 'spin'})
+        self.assertEqual(len(first), 7)
+        with self.assertRaises(KeyError):
+            del first['note']
+        with self.assertRaises(KeyError):
+            first['author']
+        self.assertEqual(second['publisher'], 'Second Publisher')
+
+    def test_without_source_file(self):
+        entry = bibreader.CompactEntry({'ENTRYTYPE': 'misc', 'ID': 'k', 'title': 'T', 'howpublished': 'web'})
+        self.assertEqual(entry['howpublished'], 'web')
+        self.assertEqual(dict(entry), {'ENTRYTYPE': 'misc', 'ID': 'k', 'title': 'T', 'howpublished': 'web'})
+
+
+SHARDED_BIB = ''.join(
+    [f'@article{{early{i}, journal = {{J{i}}}, month = may}}\n' for i in range(5)]
+    + ['@string{pub = "First Publisher"}\n',
+       '@string{series = pub # " Series"}\n']
+    + [f'@book{{middle{i}, publisher = pub, series = series, note = missing # {{ {i}}}}}\n' for i in range(5)]
+    + ['@misc{trap,\n  note = {a line that looks like an entry:\n@article{fake, title = {not an entry}}\n}\n}\n',
+       '@misc{trap2,\n  note = {and one that never closes:\n@article(fake2, title = {x}\n}\n}\n',
+       '@comment{between}\n',
+       '@string{pub = "Second Publisher"}\n']
+    + [f'@book{{late{i}, publisher = pub, series = series}}\n' for i in range(5)]
+    + ['@preamble{"\\newcommand{\\x}{}"}\n']
+)
+
+
+def every_header(bib_filename, shards):
+    """Cut before every '@' at the start of a line that opens a block header, fake ones included."""
+    with open(bib_filename, 'rb') as bib_file:
+        data = bib_file.read()
+    offsets = [0]
+    at = data.find(b'\n@')
+    while at >= 0:
+        if bibreader._HEAD_RE.match(data, at + 1):
+            offsets.append(at + 1)
+        at = data.find(b'\n@', at + 1)
+    return offsets
+
+
+class ShardedParseTest(BibFileTest):
+    """The sharded parse must give exactly what the serial parse gives."""
+
+    def test_small_shards(self):
+        filename = self.write(SHARDED_BIB)
+        serial = list(iter_bib_spans(filename))
+        with mock.patch('bibreader.MIN_SHARD_SIZE', 64):
+            for jobs in (2, 3, 8):
+                with self.subTest(jobs=jobs):
+                    self.assertEqual(list(iter_bib_spans(filename, jobs=jobs)), serial)
+
+    def test_cuts_at_every_header(self):
+        filename = self.write(SHARDED_BIB)
+        self.assertGreater(len(every_header(filename, 2)), len(list(iter_raw_blocks(filename))))
+        warnings = io.StringIO()
+        with redirect_stderr(warnings):
+            serial = list(iter_bib_spans(filename))
+        with mock.patch('bibreader.shard_offsets', every_header), redirect_stderr(io.StringIO()) as sharded_warnings:
+            sharded = list(iter_bib_spans(filename, jobs=2))
+        self.assertEqual(sharded, serial)
+        self.assertEqual(sharded_warnings.getvalue(), warnings.getvalue())
+
+    def test_macros_across_shards(self):
+        filename = self.write(SHARDED_BIB)
+        with mock.patch('bibreader.shard_offsets', every_header):
+            entries = {entry['ID']: entry for entry in iter_bib_entries(filename, jobs=2)}
+        self.assertEqual(entries['early0']['month'], 'may')
+        self.assertEqual(entries['middle3']['publisher'], 'First Publisher')
+        self.assertEqual(entries['middle3']['series'], 'First Publisher Series')
+        self.assertEqual(entries['middle3']['note'], 'missing 3')
+        self.assertEqual(entries['late0']['publisher'], 'Second Publisher')
+        self.assertEqual(entries['late0']['series'], 'First Publisher Series')
+        self.assertNotIn('fake', entries)
+
+    def test_compact_entries(self):
+        filename = self.write(SHARDED_BIB)
+        serial = [dict(entry) for entry in iter_compact_entries(filename)]
+        with mock.patch('bibreader.shard_offsets', every_header):
+            self.assertEqual([dict(entry) for entry in iter_compact_entries(filename, jobs=2)], serial)
+
+
+MESSY_BIB = (
+    '% A comment line before anything\n'
+    '@string{prl = "Physical Review Letters"}\n\n'
+    '@Article{first,\n'
+    '    Author  = {Smith, J. and Doe, A.},\n'
+    '    journal = prl,\n'
+    '    title   = "Spin {W}aves",\n'
+    '    month   = jan,\n'
+    '    year    = 2020\n'
+    '}\n\n'
+    '@comment{keep me}\n'
+    '@misc(second, title = {One line}, note = prl # { extra},)\n'
+    'stray text\n'
+)
+
+
+class PassthroughTest(BibFileTest):
+
+    def rewrite(self, edit, newline=None):
+        source = self.write(MESSY_BIB, newline=newline)
+        output = os.path.join(self.directory, 'out.bib')
+        write_passthrough(source, iter_entry_edits(source, edit), output)
+        with open(source, 'rb') as before, open(output, 'rb') as after:
+            return before.read().decode(), after.read().decode()
+
+    def changed_lines(self, before, after):
+        before, after = before.splitlines(True), after.splitlines(True)
+        return [(old, new) for old, new in zip(before, after) if old != new], len(before) - len(after)
+
+    def test_no_edits_is_byte_identical(self):
+        for newline in ('\n', '\r\n'):
+            before, after = self.rewrite(lambda entry: None, newline)
+            self.assertEqual(after, before)
+
+    def test_edit_rewrites_only_that_field(self):
+        def edit(entry):
+            if entry['ID'] == 'first':
+                entry['title'] = 'Spin Waves Revisited'
+        before, after = self.rewrite(edit)
+        changed, removed = self.changed_lines(before, after)
+        self.assertEqual(changed, [('    title   = "Spin {W}aves",\n', '    title   = {Spin Waves Revisited},\n')])
+        self.assertEqual(removed, 0)
+
+    def test_unchanged_macros_stay_macros(self):
+        def edit(entry):
+            entry['pages'] = '12'
+        before, after = self.rewrite(edit)
+        self.assertIn('    journal = prl,\n    title   = "Spin {W}aves",\n    month   = jan,\n', after)
+        self.assertIn('    year    = 2020,\n    pages = {12}\n}', after)
+        self.assertIn('@misc(second, title = {One line}, note = prl # { extra}, pages = {12},)', after)
+
+    def test_removed_field_takes_its_separator(self):
+        def edit(entry):
+            entry.pop('month', None)
+            entry.pop('note', None)
+        before, after = self.rewrite(edit)
+        self.assertIn('    title   = "Spin {W}aves",\n    year    = 2020\n}', after)
+        self.assertIn('@misc(second, title = {One line},)', after)
+        self.assertEqual(after.count('\n'), before.count('\n') - 1)
+
+    def test_edits_read_back_as_edited(self):
+        def edit(entry):
+            entry['journal'] = 'Phys. Rev. Lett.'
+            entry.pop('author', None)
+        source = self.write(MESSY_BIB)
+        output = os.path.join(self.directory, 'out.bib')
+        write_passthrough(source, iter_entry_edits(source, edit), output)
+        expected = list(iter_bib_entries(source))
+        for entry in expected:
+            edit(entry)
+        self.assertEqual(list(iter_bib_entries(output)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from citekeys import citekey_census, scan_entry_keys
+
+
+class CensusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.first = self.write('first.bib', '@string{j = "J"}\n'
+                                             '@article{same, title = {T}, year = {2000}}\n'
+                                             '@article{same,\n  title = {T},\n  year = {2000}\n}\n'
+                                             '@article{shared, title = {S}, year = {2001}}\n'
+                                             '@article{clash, title = {C}, year = {2002}}\n'
+                                             '@comment{same}\n')
+        self.second = self.write('second.bib', '@article{shared,\n    title = {S},\n    year = {2001}\n}\n'
+                                               '@article{clash, title = {C}, year = {2003}, note = {n}}\n'
+                                               '@misc{own, title = {O}}\n')
+
+    def write(self, name, text):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'w', encoding='utf-8') as bib_file:
+            bib_file.write(text)
+        return filename
+
+    def test_scan_entry_keys(self):
+        keys = [key for key, _, _, _ in scan_entry_keys(self.first)]
+        self.assertEqual(keys, ['same', 'same', 'shared', 'clash'])
+        digests = [digest for _, _, _, digest in scan_entry_keys(self.first)]
+        self.assertEqual(digests[0], digests[1])  # equal up to whitespace
+
+    def test_census(self):
+        census = citekey_census([self.first, self.second], jobs=1)
+        self.assertEqual(census['files'], {self.first: {'entries': 4, 'keys': 3},
+                                           self.second: {'entries': 3, 'keys': 3}})
+        self.assertEqual(census['keys'], 4)
+        self.assertEqual(census['duplicates'], [{'key': 'same', 'file': self.first, 'count': 2,
+                                                 'status': 'identical', 'fields': []}])
+        self.assertEqual(census['collisions'], [
+            {'key': 'shared', 'files': [self.first, self.second], 'status': 'identical', 'fields': []},
+            {'key': 'clash', 'files': [self.first, self.second], 'status': 'conflicting', 'fields': ['note', 'year']},
+        ])
+
+    def test_parallel_census_matches_serial(self):
+        files = [self.first, self.second]
+        self.assertEqual(citekey_census(files, jobs=2), citekey_census(files, jobs=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from citescan import WILDCARD, cited_keys, final_key, rewrite_citekeys, scan_citations, scan_files
+
+
+class ScanTest(unittest.TestCase):
+
+    def keys(self, text, aux=False):
+        return [key for key, _ in scan_citations(text, aux)[0]]
+
+    def test_natbib_and_biblatex_commands(self):
+        text = (r'\cite{a} \citet*{b, c} \citep[see][p.~2]{d} \parencite{e} \textcite[12]{f}'
+                r' \footcite{g} \citeauthor{h} \autocite*{i} \nocite{j}')
+        self.assertEqual(self.keys(text), list('abcdefghij'))
+
+    def test_capitalised_commands(self):
+        self.assertEqual(self.keys(r'\Cite{a} \Textcite{b} \Citet{c} \Parencite[see][]{d} \Citeauthor*{e}'),
+                         list('abcde'))
+
+    def test_not_citations(self):
+        self.assertEqual(self.keys(r'\citestyle{authoryear} \cites without keys'), [])
+
+    def test_multicite(self):
+        self.assertEqual(self.keys(r'\parencites(pre)(post)[see][12]{a,b}[3]{c}{d} then {e}'),
+                         ['a', 'b', 'c', 'd'])
+
+    def test_nocite_star(self):
+        self.assertEqual(self.keys(r'\nocite{*}'), [WILDCARD])
+
+    def test_comments_are_ignored(self):
+        citations = scan_citations('\\cite{a} % \\cite{b}\n50\\% \\cite{c}\n%\\cite{d}\n\\cite{e}')[0]
+        self.assertEqual(citations, [('a', 1), ('c', 2), ('e', 4)])
+
+    def test_aux_records(self):
+        text = ('\\relax\n\\citation{a,b}\n\\abx@aux@cite{c}\n\\abx@aux@cite{0}{d}\n'
+                '\\abx@aux@segm{0}{0}{c}\n\\citation{*}\n\\@input{chapter.aux}\n')
+        citations, inputs = scan_citations(text, aux=True)
+        self.assertEqual([key for key, _ in citations], ['a', 'b', 'c', 'd', WILDCARD])
+        self.assertEqual(inputs, ['chapter.aux'])
+
+
+class RewriteTest(unittest.TestCase):
+
+    def test_final_key_follows_chains(self):
+        replacements = {'a': 'b', 'b': 'c', 'x': 'y'}
+        self.assertEqual(final_key('a', replacements), 'c')
+        self.assertEqual(final_key('x', replacements), 'y')
+        self.assertEqual(final_key('c', replacements), 'c')
+
+    def test_final_key_stops_on_cycles(self):
+        self.assertEqual(final_key('a', {'a': 'b', 'b': 'a'}), 'a')
+        self.assertEqual(final_key('a', {'a': 'b', 'b': 'c', 'c': 'b'}), 'b')
+
+    def test_rewrites_chained_keys(self):
+        text = 'See \\cite{a, keep} and \\Citet[p.~1]{b}.\n'
+        self.assertEqual(rewrite_citekeys(text, {'a': 'b', 'b': 'c'}),
+                         'See \\cite{c, keep} and \\Citet[p.~1]{c}.\n')
+
+    def test_rewrites_only_key_lists(self):
+        text = 'a b \\label{a} \\parencites[see]{a}[2]{x,a} \\citestyle{a} \\nocite{*}'
+        self.assertEqual(rewrite_citekeys(text, {'a': 'new'}),
+                         'a b \\label{a} \\parencites[see]{new}[2]{x,new} \\citestyle{a} \\nocite{*}')
+
+    def test_unchanged_text_is_returned_as_is(self):
+        text = '\\cite{a,b}'
+        self.assertIs(rewrite_citekeys(text, {'z': 'y'}), text)
+
+
+class ScanFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, text):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'w', encoding='utf-8') as source:
+            source.write(text)
+        return filename
+
+    def test_included_aux_files_are_followed(self):
+        main = self.write('main.aux', '\\citation{a}\n\\@input{ch1.aux}\n\\@input{missing.aux}\n')
+        self.write('ch1.aux', '\\citation{b}\n\\abx@aux@cite{0}{c}\n\\@input{main.aux}\n')
+        self.assertEqual(scan_files([main]), [('a', main, 1), ('b', os.path.join(self.directory, 'ch1.aux'), 1),
+                                               ('c', os.path.join(self.directory, 'ch1.aux'), 2)])
+
+    def test_parallel_scan_matches_serial(self):
+        files = [self.write(f'part{i}.tex', f'\\cite{{k{i}}}\n\\nocite{{n{i}, shared}}\n') for i in range(4)]
+        self.assertEqual(scan_files(files, jobs=2), scan_files(files, jobs=1))
+        self.assertEqual(cited_keys(files), ['k0', 'n0', 'shared', 'k1', 'n1', 'k2', 'n2', 'k3', 'n3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
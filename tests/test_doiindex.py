@@ -0,0 +1,62 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import doiindex
+from doiindex import DOIIndex, build_index
+
+
+class BuildIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.index_file = os.path.join(self.directory, 'doi-index.sqlite')
+
+    def dump(self, name, *works):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'w', encoding='utf-8') as dump:
+            for work in works:
+                dump.write(json.dumps(work) + '\n')
+        return filename
+
+    def lookup(self, *dois):
+        with DOIIndex(self.index_file) as index:
+            return index.get_many(dois)
+
+    def test_build_and_add(self):
+        self.assertEqual(build_index([self.dump('a.jsonl', {'DOI': '10.1/A', 'page': '1-2'})], self.index_file), 1)
+        build_index([self.dump('b.jsonl', {'DOI': '10.1/b', 'article-number': ['7']})], self.index_file)
+        self.assertEqual(self.lookup('10.1/a', '10.1/b'),
+                         {'10.1/a': {'page': '1-2'}, '10.1/b': {'article-number': '7'}})
+        self.assertFalse([name for name in os.listdir(self.directory) if name.endswith('.tmp')])
+
+    def test_interrupted_build_keeps_old_index(self):
+        build_index([self.dump('a.jsonl', {'DOI': '10.1/a', 'page': '1-2'})], self.index_file)
+        with mock.patch.object(doiindex, 'iter_dump_records', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                build_index([self.dump('b.jsonl', {'DOI': '10.1/b', 'page': '3'})], self.index_file)
+        self.assertEqual(self.lookup('10.1/a', '10.1/b'), {'10.1/a': {'page': '1-2'}})
+        self.assertFalse([name for name in os.listdir(self.directory) if name.endswith('.tmp')])
+
+    def test_missing_index_is_an_error(self):
+        bib = os.path.join(self.directory, 'refs.bib')
+        open(bib, 'w').close()
+        result = subprocess.run([sys.executable, os.path.join(REPO, 'pages-field.py'), '--input', bib,
+                                 '--output', bib + '.out', '--index', self.index_file, '--offline'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 1)
+        self.assertEqual(result.stderr.strip().splitlines(), [f'Error: DOI index {self.index_file} not found '
+                                                               '(build it with --build-index)'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pagerules import PageRuleEngine
+
+
+class PageRulesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = PageRuleEngine()
+
+    def pages(self, doi, journal=''):
+        return self.engine.resolve(dict(doi=doi, journal=journal))
+
+    def test_article_numbers(self):
+        self.assertEqual(self.pages('10.1103/PhysRevB.95.115119'), '115119')
+        self.assertEqual(self.pages('10.1088/1367-2630/15/3/033001'), '033001')
+        self.assertEqual(self.pages('10.1038/ncomms12345'), '12345')
+        self.assertEqual(self.pages('10.1126/sciadv.abc1234'), 'eabc1234')
+        self.assertEqual(self.pages('10.1007/JHEP01(2020)123'), '123')
+
+    def test_scientific_reports_drops_leading_zeros(self):
+        self.assertEqual(self.pages('10.1038/srep01234'), '1234')
+
+    def test_old_iop_item_numbers_are_not_pages(self):
+        self.assertIsNone(self.pages('10.1088/0022-3719/6/7/022'))
+        self.assertIsNone(self.pages('10.1088/0953-8984/1/1/A01'))
+
+    def test_unknown_prefix(self):
+        self.assertIsNone(self.pages('10.9999/whatever.1'))
+        self.assertIsNone(self.pages(''))
+
+    def test_counts(self):
+        self.pages('10.1038/srep01234')
+        self.pages('10.1038/srep05678')
+        self.pages('10.1088/0022-3719/6/7/022')
+        self.assertEqual(self.engine.report(), ['nature-srep: 2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
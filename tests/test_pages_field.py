@@ -0,0 +1,115 @@
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+pages_field = importlib.import_module('pages-field')
+
+
+class ScriptedDOIHandler(BaseHTTPRequestHandler):
+    """Stand-in resolver; the DOI's suffix says how to answer, the request count says which attempt it is."""
+
+    hits = defaultdict(int)
+
+    def do_GET(self):
+        path = self.path.lstrip('/')
+        attempt = self.hits[path]
+        self.hits[path] += 1
+        if path.endswith('flaky') and attempt == 0:
+            return self.reply(503)
+        if path.endswith('limited') and attempt == 0:
+            return self.reply(429, {'Retry-After': '1'})
+        if path.endswith('moved'):
+            return self.reply(301, {'Location': f'/{path[:-len("moved")]}target'})
+        if path.endswith('loop'):
+            return self.reply(302, {'Location': f'/{path}'})
+        if path.endswith('missing'):
+            return self.reply(404)
+        if path.endswith('broken'):
+            return self.reply(500)
+        body = json.dumps({'DOI': path, 'page': '1--10'}).encode()
+        self.reply(200, {'Content-Type': 'application/json'}, body)
+
+    def reply(self, status, headers=None, body=b''):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchMetadataTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedDOIHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.resolver = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        ScriptedDOIHandler.hits.clear()
+
+    def fetch(self, *dois, retries=2):
+        return pages_field.fetch_metadata(dois, jobs=2, resolver=self.resolver, timeout=5,
+                                          retries=retries, backoff=0, rate=0)
+
+    def test_success(self):
+        metadata = self.fetch('10.1/ok')
+        self.assertEqual(metadata['10.1/ok']['page'], '1--10')
+
+    def test_retries_server_errors(self):
+        metadata = self.fetch('10.1/flaky')
+        self.assertEqual(metadata['10.1/flaky']['DOI'], '10.1/flaky')
+        self.assertEqual(ScriptedDOIHandler.hits['10.1/flaky'], 2)
+
+    def test_gives_up_after_retries(self):
+        metadata = self.fetch('10.1/broken', retries=1)
+        self.assertIsNone(metadata['10.1/broken'])
+        self.assertEqual(ScriptedDOIHandler.hits['10.1/broken'], 2)
+
+    def test_honours_retry_after(self):
+        start = time.monotonic()
+        metadata = self.fetch('10.1/limited')
+        self.assertGreaterEqual(time.monotonic() - start, 1)
+        self.assertEqual(metadata['10.1/limited']['DOI'], '10.1/limited')
+        self.assertEqual(ScriptedDOIHandler.hits['10.1/limited'], 2)
+
+    def test_follows_redirects(self):
+        metadata = self.fetch('10.1/moved')
+        self.assertEqual(metadata['10.1/moved']['DOI'], '10.1/target')
+
+    def test_stops_redirect_loops(self):
+        metadata = self.fetch('10.1/loop', retries=0)
+        self.assertIsNone(metadata['10.1/loop'])
+        self.assertEqual(ScriptedDOIHandler.hits['10.1/loop'], pages_field.MAX_REDIRECTS + 1)
+
+    def test_not_found_is_not_retried(self):
+        metadata = self.fetch('10.1/missing')
+        self.assertIsNone(metadata['10.1/missing'])
+        self.assertEqual(ScriptedDOIHandler.hits['10.1/missing'], 1)
+
+    def test_get_article_metadata(self):
+        self.assertEqual(pages_field.get_article_metadata('10.1/ok', resolver=self.resolver, backoff=0)['page'],
+                         '1--10')
+
+
+if __name__ == '__main__':
+    unittest.main()
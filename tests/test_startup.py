@@ -0,0 +1,25 @@
+import os
+import sys
+import unittest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, 'benchmarks'))
+
+from startup import LAZY_MODULES, imported_modules
+from bibtools import SCRIPT_COMMANDS
+
+
+class StartupTest(unittest.TestCase):
+    """No subcommand imports a lazy module at start; the time budget is checked by benchmarks/startup.py."""
+
+    def test_commands(self):
+        baseline = set(imported_modules(['-c', 'pass']))
+        for command in list(SCRIPT_COMMANDS) + ['pipeline']:
+            with self.subTest(command=command):
+                modules = imported_modules([os.path.join(REPO, 'bibtools.py'), command, '--help'])
+                self.assertIn('argparse', modules)  # the command did run
+                self.assertEqual(sorted(set(LAZY_MODULES) & set(modules) - baseline), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
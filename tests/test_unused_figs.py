@@ -0,0 +1,51 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unused_figs
+from unused_figs import GRAPHICS_EXTENSIONS, build_dependency_graph, find_unused_figures
+
+
+class UnusedFiguresTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name, text in [('main.tex', '\\input{intro}\n\\input{methods}\n\\includegraphics{used}\n'
+                                        '% \\includegraphics{old}\n'),
+                           ('intro.tex', '\\includegraphics[width=1cm]{photo.png}\n'),
+                           ('methods.tex', 'No figures here.\n'),
+                           ('main.pdf', ''), ('intro.pdf', ''), ('used.pdf', ''), ('old.pdf', ''),
+                           ('photo.png', ''), ('sketch.png', ''), ('plot.eps', '')]:
+            with open(os.path.join(self.directory, name), 'w') as file:
+                file.write(text)
+        self.main = os.path.join(self.directory, 'main.tex')
+
+    def graph(self, **options):
+        return build_dependency_graph(self.main, cache_path=os.path.join(self.directory, 'cache.json'), **options)
+
+    def test_unused_lists_pdfs_only_by_default(self):
+        graph = self.graph()
+        self.assertEqual(graph['tex_files'], ['main.tex', 'intro.tex', 'methods.tex'])
+        self.assertEqual(graph['figures'], {'used.pdf', 'photo.png'})
+        self.assertEqual(find_unused_figures(self.main, graph), {'old.pdf'})
+        self.assertEqual(find_unused_figures(self.main, graph, GRAPHICS_EXTENSIONS),
+                         {'old.pdf', 'sketch.png', 'plot.eps'})
+
+    def test_small_projects_are_scanned_serially(self):
+        no_processes = mock.patch('concurrent.futures.ProcessPoolExecutor', side_effect=AssertionError)
+        with no_processes:
+            self.graph(use_cache=False)
+        with no_processes, mock.patch.object(unused_figs, 'PARALLEL_THRESHOLD', 0):
+            self.assertRaises(AssertionError, self.graph, use_cache=False)
+        with no_processes:
+            self.assertRaises(AssertionError, self.graph, use_cache=False, jobs=2)
+        self.assertEqual(self.graph(use_cache=False, jobs=2)['tex_files'], ['main.tex', 'intro.tex', 'methods.tex'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,38 +2,254 @@ import os
 import re
 import sys
 import argparse
+import hashlib
+import json
 import shutil
+import time
+from collections import defaultdict
+from doicache import cache_dir
+from runstats import add_stats_arguments, get_stats, start_stats
 
-def get_pdf_files(directory, latex_pdf_file):
-    """Get all PDF files in the specified directory, excluding the LaTeX-generated PDF."""
-    return {f for f in os.listdir(directory) if f.endswith('.pdf') and f != latex_pdf_file}
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks
+    fcntl = None
 
-def get_used_figures(latex_file):
-    """Extract used figures (PDFs) from the LaTeX file."""
-    with open(latex_file, 'r') as file:
-        content = file.read()
-    
-    pattern = re.compile(r'\\includegraphics(?:\[.*?\])?{(.+?\.(?:pdf|jpeg|jpg|png))}')
-    used_figures = set(match.group(1) for match in pattern.finditer(content))
-    
-    return used_figures
+# Extensions \includegraphics tries, in pdflatex's order, when none is given
+GRAPHICS_EXTENSIONS = ['.pdf', '.png', '.jpg', '.jpeg', '.eps']
+# Figure files --unused considers; --all-graphics widens it to GRAPHICS_EXTENSIONS
+FIGURE_EXTENSIONS = ['.pdf']
+# Without an explicit --jobs, .tex files are only scanned in worker processes past this many bytes
+PARALLEL_THRESHOLD = 4 << 20
 
-def get_used_bib_files(latex_file):
-    """Extract used bibliography files from the LaTeX file."""
-    with open(latex_file, 'r') as file:
-        content = file.read()
-    
-    pattern = re.compile(r'\\(?:bibliography|addbibresource){(.+?)}')
+COMMENT_PATTERN = re.compile(r'(?<!\\)%.*')
+# \input{file}, \input file, \include{file}, \subfile{file}
+INCLUDE_PATTERN = re.compile(r'\\(input|include|subfile)(?:\s*\{([^}]*)\}|\s+([^\s{}\\]+))')
+# \import{dir}{file} and friends from the import package
+IMPORT_PATTERN = re.compile(r'\\(import|subimport|inputfrom|subinputfrom|includefrom|subincludefrom)\*?'
+                            r'\s*\{([^}]*)\}\s*\{([^}]*)\}')
+GRAPHICS_PATTERN = re.compile(r'\\includegraphics\*?\s*(?:\[[^\]]*\]\s*)*\{([^}]*)\}')
+GRAPHICSPATH_PATTERN = re.compile(r'\\graphicspath\s*\{((?:\s*\{[^}]*\})*)\s*\}')
+BIB_PATTERN = re.compile(r'\\(bibliography|addbibresource|addglobalbib)\s*(?:\[[^\]]*\])?\s*\{([^}]*)\}')
+
+# --package destinations with these suffixes are written as archives instead of folders
+ARCHIVE_SUFFIXES = ('.zip', '.tar.gz', '.tgz')
+# Already compressed formats, stored without recompressing in zip archives
+STORED_EXTENSIONS = {'.pdf', '.png', '.jpg', '.jpeg'}
+# ioctl that makes a copy-on-write clone of a file (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+def get_pdf_files(directory, latex_pdf_files, graphicspaths=(), main_file=None, extensions=FIGURE_EXTENSIONS):
+    """Get the figure files in the directory and the \\graphicspath folders, excluding the PDFs LaTeX generated.
+
+    Only files with one of extensions count as figures. Subfolders are not
+    searched. A \\graphicspath folder holding a copy of main_file is taken for
+    an earlier --package output and skipped. Paths are relative to directory.
+    """
+    figures = set()
+    for folder in _unique([directory] + [os.path.join(directory, path) for path in graphicspaths]):
+        if not os.path.isdir(folder):
+            continue
+        if folder != directory and main_file and os.path.isfile(os.path.join(folder, main_file)):
+            continue
+        for f in os.listdir(folder):
+            path = os.path.normpath(os.path.relpath(os.path.join(folder, f), directory))
+            if (os.path.splitext(f)[1].lower() in extensions and path not in latex_pdf_files
+                    and os.path.isfile(os.path.join(folder, f))):
+                figures.add(path)
+    return figures
+
+def scan_tex_source(content):
+    """Extract the commands the dependency graph needs from the text of one .tex file."""
+    content = COMMENT_PATTERN.sub('', content)
+    includes = []
+    for match in INCLUDE_PATTERN.finditer(content):
+        includes.append((match.group(1), '', (match.group(2) or match.group(3)).strip()))
+    for match in IMPORT_PATTERN.finditer(content):
+        includes.append((match.group(1), match.group(2).strip(), match.group(3).strip()))
+    graphicspaths = [path for match in GRAPHICSPATH_PATTERN.finditer(content)
+                     for path in re.findall(r'\{([^}]*)\}', match.group(1))]
+    figures = [match.group(1).strip() for match in GRAPHICS_PATTERN.finditer(content)]
+    bib_files = []
+    for command, names in BIB_PATTERN.findall(content):
+        for name in names.split(',') if command == 'bibliography' else [names]:
+            name = name.strip()
+            if name and not name.endswith('.bib'):
+                name += '.bib'
+            if name:
+                bib_files.append(name)
+    return {'includes': includes, 'graphicspaths': graphicspaths, 'figures': figures, 'bib_files': bib_files}
+
+def _scan_tex_file(path, known_hash=None):
+    """Return (stat key, content hash, extraction); extraction is None if the hash is known_hash."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    info = os.stat(path)
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    if digest == known_hash:
+        return [info.st_mtime_ns, info.st_size], digest, None
+    return [info.st_mtime_ns, info.st_size], digest, scan_tex_source(data.decode('utf-8', errors='replace'))
+
+def default_cache_path(latex_file):
+    """Cache of per-file scan results for one main .tex file, in the bibtools cache directory."""
+    key = hashlib.sha1(os.path.abspath(latex_file).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir(), f'texdeps-{key}.json')
+
+def _load_cache(cache_path):
+    try:
+        with open(cache_path, 'r') as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(cache_path, cache):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w') as cache_file:
+        json.dump(cache, cache_file)
+    os.replace(temporary_path, cache_path)
+
+def _find_file(name, directories, extensions):
+    """Return the first existing directory/name(+extension), or None."""
+    for directory in directories:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            return path
+        for extension in extensions:
+            if os.path.isfile(path + extension):
+                return path + extension
+    return None
+
+def _unique(items):
+    return list(dict.fromkeys(items))
+
+def _in_parallel(paths, size, jobs):
+    if len(paths) < 2 or (jobs is not None and jobs <= 1):
+        return False
+    return jobs is not None or size > PARALLEL_THRESHOLD
+
+def build_dependency_graph(latex_file, jobs=None, cache_path=None, use_cache=True):
+    """Follow \\input, \\include, \\subfile and \\import recursively from latex_file.
+
+    Files are scanned a level at a time, in jobs processes when jobs > 1, or
+    with jobs None when the files to scan add up to more than
+    PARALLEL_THRESHOLD bytes; otherwise in this process. Each file's scan result
+    is cached under its mtime and size, and when those change but the content
+    hash does not, the cached result is still used. Returns a dict with the
+    tex files, figures and bib files used (paths relative to the directory of
+    latex_file), the edges of the include graph, and whatever was not found.
+    """
+    with get_stats().phase('parse'):
+        return _build_dependency_graph(latex_file, jobs, cache_path, use_cache)
+
+def _build_dependency_graph(latex_file, jobs, cache_path, use_cache):
+    root = os.path.dirname(os.path.abspath(latex_file))
+    cache_path = cache_path or default_cache_path(latex_file)
+    cache = _load_cache(cache_path) if use_cache else {}
+    new_cache = {}
+
+    # path -> directory its own relative paths resolve against
+    bases = {os.path.abspath(latex_file): root}
+    order = [os.path.abspath(latex_file)]
+    scans = {}
+    edges = []
+    missing = []
+    frontier = list(order)
+    while frontier:
+        stale = []
+        stale_size = 0
+        for path in frontier:
+            cached = cache.get(path)
+            info = os.stat(path)
+            if cached and cached['stat'] == [info.st_mtime_ns, info.st_size]:
+                scans[path] = cached['scan']
+                new_cache[path] = cached
+            else:
+                stale.append(path)
+                stale_size += info.st_size
+        get_stats().count('tex cache hits', len(frontier) - len(stale))
+        get_stats().count('tex files scanned', len(stale))
+        known_hashes = [cache[path]['hash'] if path in cache else None for path in stale]
+        if not _in_parallel(stale, stale_size, jobs):
+            results = [_scan_tex_file(path, known) for path, known in zip(stale, known_hashes)]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(_scan_tex_file, stale, known_hashes))
+        for path, (stat_key, digest, scan) in zip(stale, results):
+            if scan is None:
+                scan = cache[path]['scan']
+            scans[path] = scan
+            new_cache[path] = {'stat': stat_key, 'hash': digest, 'scan': scan}
+
+        next_frontier = []
+        for path in frontier:
+            base = bases[path]
+            for command, directory, name in scans[path]['includes']:
+                if command in ('import', 'inputfrom', 'includefrom'):
+                    search = [os.path.join(root, directory), os.path.join(base, directory)]
+                elif directory:
+                    search = [os.path.join(base, directory)]
+                else:
+                    search = [base, root]
+                found = _find_file(name, _unique(search), ['.tex'])
+                if found is None:
+                    missing.append(name)
+                    continue
+                found = os.path.abspath(found)
+                edges.append((path, found))
+                if found in bases:
+                    continue
+                # Imported and subfile'd documents resolve their own paths from their directory
+                bases[found] = os.path.dirname(found) if directory or command == 'subfile' else base
+                order.append(found)
+                next_frontier.append(found)
+        frontier = next_frontier
+
+    if use_cache:
+        _save_cache(cache_path, new_cache)
+
+    # \graphicspath applies to the whole document, wherever it was set
+    graphicspaths = _unique(os.path.join(bases[path], directory)
+                            for path in order for directory in scans[path]['graphicspaths'])
+    relative = lambda path: os.path.normpath(os.path.relpath(path, root))
+    figures = set()
     bib_files = set()
-    for match in pattern.finditer(content):
-        bib_base_names = match.group(1).split(',')
-        for bib_base_name in bib_base_names:
-            bib_base_name = bib_base_name.strip()
-            if not bib_base_name.endswith(".bib"):
-                bib_base_name += ".bib"
-            bib_files.add(bib_base_name)
-    
-    return bib_files
+    for path in order:
+        search = _unique([bases[path], root] + graphicspaths)
+        for name in scans[path]['figures']:
+            found = _find_file(name, search, GRAPHICS_EXTENSIONS)
+            if found is None:
+                missing.append(name)
+            else:
+                figures.add(relative(found))
+        for name in scans[path]['bib_files']:
+            found = _find_file(name, _unique([bases[path], root]), [])
+            bib_files.add(relative(found) if found else name)
+
+    return {
+        'tex_files': [relative(path) for path in order],
+        'edges': [(relative(source), relative(target)) for source, target in edges],
+        'figures': figures,
+        'bib_files': bib_files,
+        'missing': _unique(missing),
+        'graphicspaths': [relative(path) for path in graphicspaths],
+        'root': root,
+    }
+
+def report_missing(graph):
+    for name in graph['missing']:
+        print(f"Warning: could not find '{name}'", file=sys.stderr)
+
+def get_used_figures(latex_file, graph=None):
+    """Extract used figures from the LaTeX file and everything it includes."""
+    graph = graph or build_dependency_graph(latex_file)
+    return set(graph['figures'])
+
+def get_used_bib_files(latex_file, graph=None):
+    """Extract used bibliography files from the LaTeX file and everything it includes."""
+    graph = graph or build_dependency_graph(latex_file)
+    return set(graph['bib_files'])
 
 def get_bbl_file(latex_file):
     """Get the corresponding BBL file if it exists; otherwise, print an error and exit."""
@@ -43,61 +259,201 @@ def get_bbl_file(latex_file):
         sys.exit(1)
     return {bbl_file}
 
-def find_unused_figures(latex_file):
-    """Find and return PDF files that are not used in the LaTeX file."""
-    latex_pdf_file = os.path.basename(latex_file).replace('.tex', '.pdf')
-    pdf_files = get_pdf_files(os.getcwd(), latex_pdf_file)
-    used_figures = get_used_figures(latex_file)
-    return pdf_files - used_figures
-
-def print_used_figures(latex_file):
-    """Print the used PDF figures in the LaTeX file."""
-    used_figures = get_used_figures(latex_file)
-    print("\n".join(used_figures) if used_figures else "No PDF figures used in the LaTeX file.")
-
-def print_unused_figures(latex_file):
-    """Print the unused PDF figures in the LaTeX file."""
-    unused_figures = find_unused_figures(latex_file)
-    print("\n".join(unused_figures) if unused_figures else "All PDF figures are used.")
-
-def package_latex_project(latex_file, output_folder=None):
-    """Create a folder containing all used figures, the LaTeX file, bibliography files, and BBL file."""
-    base_dir = os.getcwd()
-    base_name = os.path.splitext(os.path.basename(latex_file))[0]
-    
-    if output_folder:
-        os.makedirs(output_folder, exist_ok=True)
-    
-    files_to_copy = {latex_file} | get_used_figures(latex_file) | get_used_bib_files(latex_file) | get_bbl_file(latex_file)
-    files_to_copy = {f for f in files_to_copy if os.path.exists(f)}
-    
-    if output_folder:
-        for file in files_to_copy:
-            # Ensure subfolders are preserved
-            dest_path = os.path.join(output_folder, file)
-            dest_dir = os.path.dirname(dest_path)
-            os.makedirs(dest_dir, exist_ok=True)
-            shutil.copy(file, dest_path)
+def find_unused_figures(latex_file, graph=None, extensions=FIGURE_EXTENSIONS):
+    """Find the figure files in the LaTeX file's folder and \\graphicspath folders that the document does not use."""
+    graph = graph or build_dependency_graph(latex_file)
+    latex_pdf_files = {os.path.splitext(tex_file)[0] + '.pdf' for tex_file in graph['tex_files']}
+    figure_files = get_pdf_files(graph['root'], latex_pdf_files, graph.get('graphicspaths', ()),
+                                 os.path.basename(latex_file), extensions)
+    return figure_files - get_used_figures(latex_file, graph)
+
+def _from_cwd(root, paths):
+    # Paths relative to the LaTeX file's folder, as seen from where the script runs
+    return sorted(os.path.relpath(os.path.join(root, path)) for path in paths)
+
+def print_used_figures(latex_file, graph=None):
+    """Print the figures used in the LaTeX file and everything it includes."""
+    graph = graph or build_dependency_graph(latex_file)
+    used_figures = _from_cwd(graph['root'], get_used_figures(latex_file, graph))
+    print("\n".join(used_figures) if used_figures else "No figures used in the LaTeX file.")
+
+def print_unused_figures(latex_file, graph=None, extensions=FIGURE_EXTENSIONS):
+    """Print the figures not used in the LaTeX file or anything it includes."""
+    graph = graph or build_dependency_graph(latex_file)
+    unused_figures = _from_cwd(graph['root'], find_unused_figures(latex_file, graph, extensions))
+    print("\n".join(unused_figures) if unused_figures else "All figures are used.")
+
+def _file_digest(path):
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+def find_duplicate_files(root, files):
+    """Map every file whose content equals an earlier file's to that earlier file.
 
-        print(f"Files copied to folder: {output_folder}")
+    Only files that share their (non-zero) size with another one are hashed.
+    """
+    by_size = defaultdict(list)
+    for file in sorted(files):
+        by_size[os.path.getsize(os.path.join(root, file))].append(file)
+    duplicates = {}
+    for size, group in by_size.items():
+        if len(group) < 2 or size == 0:
+            continue
+        first_by_digest = {}
+        for file in group:
+            digest = _file_digest(os.path.join(root, file))
+            if digest in first_by_digest:
+                duplicates[file] = first_by_digest[digest]
+            else:
+                first_by_digest[digest] = file
+    return duplicates
+
+def _place_file(source, dest_path, link):
+    """Put source at dest_path by reflink, hardlink or copy; return which one was used."""
+    if os.path.lexists(dest_path):
+        os.unlink(dest_path)
+    if link == 'auto' and fcntl is not None:
+        try:
+            with open(source, 'rb') as source_file, open(dest_path, 'wb') as dest_file:
+                fcntl.ioctl(dest_file.fileno(), FICLONE, source_file.fileno())
+            shutil.copymode(source, dest_path)
+            return 'reflinked'
+        except OSError:
+            os.unlink(dest_path)
+    if link == 'hardlink':
+        try:
+            os.link(source, dest_path)
+            return 'hardlinked'
+        except OSError:
+            pass
+    shutil.copy(source, dest_path)
+    return 'copied'
+
+def _package_folder(root, files, duplicates, output_folder, link, jobs, stats):
+    def place(file):
+        dest_path = os.path.join(output_folder, file)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        return file, _place_file(os.path.join(root, file), dest_path, link)
+
+    from concurrent.futures import ThreadPoolExecutor
+    unique_files = [file for file in files if file not in duplicates]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for file, method in executor.map(place, unique_files):
+            stats[method] += os.path.getsize(os.path.join(root, file))
+    # Identical files share one copy inside the package
+    for file, original in duplicates.items():
+        dest_path = os.path.join(output_folder, file)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        if os.path.lexists(dest_path):
+            os.unlink(dest_path)
+        try:
+            os.link(os.path.join(output_folder, original), dest_path)
+            stats['deduplicated'] += os.path.getsize(dest_path)
+        except OSError:
+            shutil.copy(os.path.join(root, file), dest_path)
+            stats['copied'] += os.path.getsize(dest_path)
+
+def _package_archive(root, files, duplicates, archive_name, stats):
+    import tarfile
+    import zipfile
+    if archive_name.endswith('.zip'):
+        # Zip has no links, so duplicates are stored again
+        with zipfile.ZipFile(archive_name, 'w') as archive:
+            for file in sorted(files):
+                extension = os.path.splitext(file)[1].lower()
+                compression = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                archive.write(os.path.join(root, file), arcname=file, compress_type=compression)
+                stats['archived'] += os.path.getsize(os.path.join(root, file))
+        return
+    with tarfile.open(archive_name, 'w:gz') as archive:
+        for file in sorted(files, key=lambda file: file in duplicates):
+            path = os.path.join(root, file)
+            if file in duplicates:
+                info = archive.gettarinfo(path, arcname=file)
+                info.type = tarfile.LNKTYPE
+                info.linkname = duplicates[file]
+                info.size = 0
+                archive.addfile(info)
+                stats['deduplicated'] += os.path.getsize(path)
+            else:
+                archive.add(path, arcname=file, recursive=False)
+                stats['archived'] += os.path.getsize(path)
+
+def package_files(root, files, destination, link='auto', jobs=None):
+    """Copy files (relative to root) into a folder, or stream them into a .zip or .tar.gz.
+
+    In a folder, files are reflinked where the filesystem can (link='auto'),
+    hardlinked to the originals with link='hardlink', and copied otherwise,
+    several at a time. Files with identical content are stored once. Returns
+    the number of bytes handled per method and the time taken.
+    """
+    started = time.perf_counter()
+    stats = defaultdict(int)
+    with get_stats().phase('write'):
+        duplicates = find_duplicate_files(root, files)
+        if destination.endswith(ARCHIVE_SUFFIXES):
+            _package_archive(root, files, duplicates, destination, stats)
+        else:
+            os.makedirs(destination, exist_ok=True)
+            _package_folder(root, files, duplicates, destination, link, jobs, stats)
+    stats['files'] = len(files)
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+def _megabytes(size):
+    return f"{size / 1e6:.1f} MB"
+
+def package_latex_project(latex_file, output_folder=None, graph=None, link='auto', jobs=None):
+    """Package all .tex files and figures used, the bibliography files, and BBL file into a folder or archive."""
+    graph = graph or build_dependency_graph(latex_file)
+    root = graph['root']
+
+    bbl_file = os.path.relpath(get_bbl_file(latex_file).pop(), root)
+    files_to_copy = set(graph['tex_files']) | get_used_figures(latex_file, graph) | get_used_bib_files(latex_file, graph) | {bbl_file}
+    files_to_copy = {f for f in files_to_copy if os.path.exists(os.path.join(root, f)) and not f.startswith('..')}
+
+    if output_folder:
+        stats = package_files(root, files_to_copy, output_folder, link=link, jobs=jobs)
+        total = sum(stats[method] for method in ('copied', 'reflinked', 'hardlinked', 'deduplicated', 'archived'))
+        if output_folder.endswith(ARCHIVE_SUFFIXES):
+            print(f"Files archived to: {output_folder}")
+        else:
+            print(f"Files copied to folder: {output_folder}")
+        details = ", ".join(f"{_megabytes(stats[method])} {method}"
+                            for method in ('copied', 'reflinked', 'hardlinked', 'archived', 'deduplicated')
+                            if stats[method])
+        print(f"{stats['files']} files, {_megabytes(total)} in {stats['seconds']:.2f} s ({details or 'nothing to copy'})")
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Find used/unused PDF figures and package LaTeX project files.")
-    parser.add_argument("latex_file", help="Path to the LaTeX file.")
+    parser = argparse.ArgumentParser(description="Find used/unused figures and package LaTeX project files.")
+    parser.add_argument("latex_file", help="Path to the main LaTeX file; \\input, \\include, \\subfile and \\import are followed.")
     group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument("--used", action="store_true", help="Print used PDF figures.")
-    group.add_argument("--unused", action="store_true", help="Print unused PDF figures.")
-    group.add_argument("--package", metavar="FOLDER", help="Copy used files to the specified folder.")
+    group.add_argument("--used", action="store_true", help="Print used figures.")
+    group.add_argument("--unused", action="store_true", help="Print unused figures.")
+    group.add_argument("--package", metavar="FOLDER", help="Copy used files to the specified folder, or into an archive if it ends in .zip, .tar.gz or .tgz.")
+    parser.add_argument("--all-graphics", action="store_true", help="With --unused, list unused .png, .jpg, .jpeg and .eps files too, not only PDFs.")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of processes scanning .tex files (default: several only for large projects).")
+    parser.add_argument("--link", choices=["auto", "hardlink", "copy"], default="auto",
+                        help="How --package places files in a folder: auto reflinks (copy-on-write) where the filesystem supports it, hardlink links to the originals, copy always copies (default: auto).")
+    parser.add_argument("--no-cache", action="store_true", help="Rescan every .tex file instead of reusing cached results.")
 
+    add_stats_arguments(parser)
     args = parser.parse_args()
+    start_stats(args)
     
     if not os.path.isfile(args.latex_file):
         print(f"Error: The file '{args.latex_file}' does not exist.")
         sys.exit(1)
+
+    graph = build_dependency_graph(args.latex_file, jobs=args.jobs, use_cache=not args.no_cache)
+    report_missing(graph)
     
     if args.used:
-        print_used_figures(args.latex_file)
+        print_used_figures(args.latex_file, graph)
     elif args.unused:
-        print_unused_figures(args.latex_file)
+        print_unused_figures(args.latex_file, graph, GRAPHICS_EXTENSIONS if args.all_graphics else FIGURE_EXTENSIONS)
     elif args.package:
-        package_latex_project(args.latex_file, output_folder=args.package)
+        package_latex_project(args.latex_file, output_folder=args.package, graph=graph, link=args.link, jobs=args.jobs)
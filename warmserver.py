@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+'''
+Optional warm interpreter for bibtools.
+
+`bibtools serve` imports the modules the tools share and then waits on a Unix
+socket. A bibtools call made with BIBTOOLS_SOCKET set to that socket does not
+run the command itself: it hands its stdin, stdout and stderr, working
+directory, environment and arguments to the server, which forks, runs the
+command in the child and reports the exit status back. The caller skips
+interpreter start-up and imports, which adds up when an editor or a latexmk
+hook runs the tools dozens of times per build. When no server answers, the
+command simply runs in-process.
+
+The socket lives in a directory only the user can enter ($XDG_RUNTIME_DIR,
+or a bibtools-<uid> folder of mode 0700 in the temporary directory), and
+both ends check with SO_PEERCRED that the other runs as the same user before
+anything is sent: a server started by someone else never sees the caller's
+files or environment. The server keeps the code it loaded at start, so
+restart it after updating these scripts. Linux only.
+'''
+import importlib
+import json
+import os
+import signal
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import traceback
+
+# Imported once by the server so that forked commands find them loaded
+PRELOAD = ('argparse', 'hashlib', 'sqlite3', 'difflib', 'concurrent.futures.process',
+           'concurrent.futures.thread', 'bibreader', 'bibkeyindex', 'citescan', 'doicache',
+           'journalabbrev', 'runstats', 'requests')
+
+_MESSAGE_SIZE = 1 << 16
+
+
+def default_socket_path():
+    """Return the socket path in a directory private to this user, creating the directory if needed."""
+    directory = os.environ.get('XDG_RUNTIME_DIR')
+    if not directory:
+        directory = os.path.join(tempfile.gettempdir(), f'bibtools-{os.getuid()}')
+        try:
+            os.mkdir(directory, 0o700)
+        except FileExistsError:
+            pass
+        info = os.lstat(directory)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise PermissionError(f"{directory} is not a directory private to this user")
+    return os.path.join(directory, 'bibtools.sock')
+
+
+def _same_user(connection):
+    """True if the process at the other end of a Unix socket runs as this user."""
+    try:
+        credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    except (AttributeError, OSError):
+        return False
+    _, uid, _ = struct.unpack('3i', credentials)
+    return uid == os.getuid()
+
+
+def call_server(socket_path, argv):
+    """Run argv on the server at socket_path; return its exit status, or None if no server answers."""
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+    except OSError:
+        connection.close()
+        return None
+    with connection:
+        if not _same_user(connection):
+            print(f"Warning: {socket_path} is not served by this user, running the command directly",
+                  file=sys.stderr)
+            return None
+        request = json.dumps({'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ)}).encode() + b'\n'
+        sent = socket.send_fds(connection, [request[:_MESSAGE_SIZE]], [0, 1, 2])
+        connection.sendall(request[sent:])
+        # The reply comes when the command has finished
+        reply = connection.makefile('rb').readline()
+    return int(reply) if reply.strip() else 1
+
+
+def _receive(connection):
+    data, fds, _, _ = socket.recv_fds(connection, _MESSAGE_SIZE, 3)
+    while not data.endswith(b'\n'):
+        chunk = connection.recv(_MESSAGE_SIZE)
+        if not chunk:
+            raise ConnectionError("client went away before sending its request")
+        data += chunk
+    return json.loads(data), fds
+
+
+def _exit_status(code):
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _run_child(connection, run):
+    """Take over the caller's files, run the command and report its status; never returns."""
+    status = 1
+    try:
+        request, fds = _receive(connection)
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        # The command may wait for worker processes of its own
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            status = _exit_status(run(request['argv']))
+        except SystemExit as exit:
+            status = _exit_status(exit.code)
+        # os._exit below skips exit handlers, so print the --stats report now
+        from runstats import finish_stats
+        finish_stats()
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            connection.sendall(f"{status}\n".encode())
+        finally:
+            os._exit(status)
+
+
+def serve(socket_path, run):
+    """Preload the shared modules, then fork run(argv) for every request on socket_path until interrupted."""
+    for name in PRELOAD:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)  # only this user may connect
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+    server.listen()
+    # Finished commands are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # Remove the socket on kill as well as on Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"bibtools server ready; use it with: export BIBTOOLS_SOCKET={socket_path}", flush=True)
+    try:
+        while True:
+            connection, _ = server.accept()
+            if not _same_user(connection):
+                connection.close()
+                continue
+            sys.stdout.flush()
+            sys.stderr.flush()
+            if os.fork() == 0:
+                server.close()
+                _run_child(connection, run)
+            connection.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(socket_path)